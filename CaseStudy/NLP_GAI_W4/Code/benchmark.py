@@ -0,0 +1,342 @@
+# benchmark.py
+
+"""
+This file is a stage-level benchmark suite for the RAG pipeline. It times load_data,
+chunk_data, create_embeddings, setup_vector_database, get_context and
+generate_llm_response on synthetic corpora of several sizes and on the real PDF. It
+reports throughput and p50/p95/p99 latencies per stage to a JSON file, and can compare
+two such files.
+
+LLM calls go to a local stub of the Ollama HTTP API (stub_ollama_server.py) with a
+fixed token rate, so runs are reproducible offline. Pass --ollama-host to benchmark a
+real Ollama server instead. Caches are bypassed so every run measures real work: each
+run gets a fresh PDF text cache and vector database, the embedding cache is disabled,
+and the retrieval caches are cleared before every query.
+
+Usage:
+    python benchmark.py run --sizes 20 100 --output bench.json
+    python benchmark.py compare baseline.json bench.json --threshold 0.1
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import contextlib
+from io import StringIO
+from datetime import datetime, timezone
+
+from config import (
+    APPLE_PDF_PATH, EMBEDDING_MODEL_NAME, EMBEDDING_WORKERS, EMBEDDING_BATCH_SIZE,
+    CHUNK_SIZE, CHUNK_OVERLAP, VECTOR_STORE_BACKEND, DEFAULT_K_RETRIEVER, RETRIEVAL_MODE
+)
+
+# Synthetic pages are filled with this many words; each PDF holds at most
+# PAGES_PER_FILE pages so multi-file ingestion is exercised too.
+WORDS_PER_PAGE = 350
+PAGES_PER_FILE = 20
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """
+    Returns the q-th percentile (0-100) of already sorted values, interpolating
+    linearly between the closest ranks.
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies: list, items: int, unit: str) -> dict:
+    """
+    Summarizes the per-call latencies of one stage. Throughput is items per second
+    over the total time spent in the stage.
+    """
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    return {
+        'runs': len(ordered),
+        'items': items,
+        'unit': unit,
+        'total_s': total,
+        'throughput': items / total if total else None,
+        'mean_s': total / len(ordered) if ordered else None,
+        'p50_s': percentile(ordered, 50),
+        'p95_s': percentile(ordered, 95),
+        'p99_s': percentile(ordered, 99),
+    }
+
+
+def make_synthetic_corpus(directory: str, pages: int, seed: int = 0) -> str:
+    """
+    Writes `pages` pages of deterministic pseudo-text to PDFs in directory and returns
+    the directory.
+    """
+    import pymupdf
+
+    rng = random.Random(seed)
+    syllables = ['ap', 'ple', 'de', 'sign', 'in', 'no', 'va', 'tion', 'or', 'ga', 'ni',
+                 'za', 'lead', 'er', 'ship', 'pro', 'duct', 'team', 'cul', 'ture']
+    vocabulary = [''.join(rng.choice(syllables) for _ in range(rng.randint(1, 3))) for _ in range(2000)]
+    os.makedirs(directory, exist_ok=True)
+    for first_page in range(0, pages, PAGES_PER_FILE):
+        pdf = pymupdf.open()
+        for _ in range(min(PAGES_PER_FILE, pages - first_page)):
+            words = [rng.choice(vocabulary) for _ in range(WORDS_PER_PAGE)]
+            sentences = [' '.join(words[i:i + 12]).capitalize() + '.' for i in range(0, len(words), 12)]
+            page = pdf.new_page()
+            page.insert_textbox(pymupdf.Rect(50, 50, page.rect.width - 50, page.rect.height - 50),
+                                ' '.join(sentences), fontsize=8)
+        pdf.save(os.path.join(directory, f'synthetic_{first_page:06d}.pdf'))
+        pdf.close()
+    return directory
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool = True):
+    """
+    Silences the pipeline's progress messages while a stage is being timed.
+    """
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(StringIO()):
+        yield
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_corpus(rag, pdf_path: str, work_dir: str, args) -> tuple:
+    """
+    Runs the ingestion and retrieval stages on one corpus and returns
+    ({stage: summary}, queries used). Ingestion stages run args.repeats times from scratch.
+    """
+    results = {}
+    latencies = {'load_data': [], 'chunk_data': [], 'setup_vector_database': []}
+    items = {'load_data': 0, 'chunk_data': 0, 'setup_vector_database': 0}
+    for run in range(args.repeats):
+        with quiet(not args.verbose):
+            documents, elapsed = timed(rag.load_data, pdf_path,
+                                       cache_dir=os.path.join(work_dir, f'text_cache_{run}'))
+        if not documents:
+            raise RuntimeError(f"No pages could be loaded from {pdf_path}")
+        latencies['load_data'].append(elapsed)
+        items['load_data'] += len(documents)
+
+        with quiet(not args.verbose):
+            chunks, elapsed = timed(rag.chunk_data, documents, chunk_size=args.chunk_size,
+                                    chunk_overlap=args.chunk_overlap)
+        latencies['chunk_data'].append(elapsed)
+        items['chunk_data'] += len(chunks)
+
+        with quiet(not args.verbose):
+            _, elapsed = timed(rag.setup_vector_database, chunks,
+                               persist_directory=os.path.join(work_dir, f'vector_db_{run}'),
+                               backend=args.backend)
+        if rag.vectorstore is None:
+            raise RuntimeError("The vector database could not be set up.")
+        latencies['setup_vector_database'].append(elapsed)
+        items['setup_vector_database'] += len(chunks)
+
+    results['load_data'] = summarize(latencies['load_data'], items['load_data'], 'pages')
+    results['chunk_data'] = summarize(latencies['chunk_data'], items['chunk_data'], 'chunks')
+    results['setup_vector_database'] = summarize(
+        latencies['setup_vector_database'], items['setup_vector_database'], 'chunks')
+
+    # Queries are sentences sampled from the corpus, so every one has real matches.
+    rng = random.Random(args.seed)
+    sentences = [s.strip() for chunk in chunks for s in chunk.page_content.split('.') if len(s.split()) >= 5]
+    queries = [rng.choice(sentences) for _ in range(args.queries)] if sentences else []
+    context_latencies = []
+    for query in queries:
+        rag.retrieval_cache.clear()
+        rag.query_embedding_cache.clear()
+        with quiet(not args.verbose):
+            _, elapsed = timed(rag.get_context, query, k=args.k, mode=args.retrieval_mode)
+        context_latencies.append(elapsed)
+    results['get_context'] = summarize(context_latencies, len(context_latencies), 'queries')
+    return results, queries
+
+
+def benchmark_llm(rag, queries: list, args) -> dict:
+    """
+    Times generate_llm_response on RAG prompts built from the given queries.
+    Throughput is completion tokens per second.
+    """
+    latencies = []
+    completion_tokens = 0
+    for query in queries[:args.llm_requests]:
+        with quiet(not args.verbose):
+            prompt = rag.create_rag_prompt(query, k=args.k)
+            (_, usage), elapsed = timed(rag.complete, prompt, max_tokens=args.max_tokens,
+                                        return_usage=True, use_cache=False)
+        latencies.append(elapsed)
+        completion_tokens += usage.get('completion_tokens') or 0
+    return summarize(latencies, completion_tokens, 'completion tokens')
+
+
+def run_benchmarks(args) -> dict:
+    from ollama import Client
+    from functions import RAG_LLM
+    from stub_ollama_server import start_server
+
+    stub = None
+    if args.ollama_host:
+        ollama_host = args.ollama_host
+    else:
+        stub = start_server(tokens_per_second=args.tokens_per_second,
+                            response_tokens=args.response_tokens)
+        ollama_host = f"http://127.0.0.1:{stub.server_port}"
+
+    report = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'embedding_model': args.embedding_model,
+            'llm_model': args.model,
+            'ollama_host': args.ollama_host or 'stub',
+            'stub_tokens_per_second': None if args.ollama_host else args.tokens_per_second,
+            'backend': args.backend,
+            'retrieval_mode': args.retrieval_mode,
+            'chunk_size': args.chunk_size,
+            'k': args.k,
+            'repeats': args.repeats,
+        },
+        'results': [],
+    }
+
+    def record(corpus: str, size: int, stage: str, summary: dict):
+        report['results'].append(dict(summary, corpus=corpus, size=size, stage=stage))
+        print(f"{corpus:>9} {size:>6} {stage:<22} p50 {summary['p50_s'] or 0:8.4f}s  "
+              f"p95 {summary['p95_s'] or 0:8.4f}s  p99 {summary['p99_s'] or 0:8.4f}s  "
+              f"{summary['throughput'] or 0:10.1f} {summary['unit']}/s")
+
+    try:
+        with quiet(not args.verbose):
+            rag = RAG_LLM()
+            rag.ollama_client = Client(host=ollama_host)
+            if args.model:
+                rag.set_model(args.model)
+        with quiet(not args.verbose):
+            _, elapsed = timed(rag.create_embeddings, args.embedding_model, use_cache=False,
+                               num_workers=args.embedding_workers,
+                               batch_size=args.embedding_batch_size, warm_up=True)
+        record('all', 0, 'create_embeddings', summarize([elapsed], 1, 'models'))
+
+        corpora = []
+        if 'synthetic' in args.corpus:
+            corpora += [('synthetic', size) for size in args.sizes]
+        if 'real' in args.corpus:
+            corpora.append(('real', 0))
+
+        for corpus, size in corpora:
+            with tempfile.TemporaryDirectory(prefix='rag_benchmark_') as work_dir:
+                if corpus == 'synthetic':
+                    pdf_path = make_synthetic_corpus(os.path.join(work_dir, 'corpus'), size, args.seed)
+                else:
+                    pdf_path = args.pdf
+                stages, queries = benchmark_corpus(rag, pdf_path, work_dir, args)
+                if corpus == 'real':
+                    size = stages['load_data']['items'] // args.repeats
+                for stage, summary in stages.items():
+                    record(corpus, size, stage, summary)
+                if args.llm_requests and queries:
+                    record(corpus, size, 'generate_llm_response', benchmark_llm(rag, queries, args))
+    finally:
+        if stub is not None:
+            stub.shutdown()
+    return report
+
+
+def compare_reports(baseline: dict, current: dict, threshold: float) -> int:
+    """
+    Prints p50 latency and throughput changes per (corpus, size, stage) and returns the
+    number of stages whose p50 latency got worse by more than threshold (a fraction).
+    """
+    old = {(r['corpus'], r['size'], r['stage']): r for r in baseline['results']}
+    regressions = 0
+    print(f"{'corpus':>9} {'size':>6} {'stage':<22} {'p50 old':>9} {'p50 new':>9} {'change':>8} "
+          f"{'thru old':>10} {'thru new':>10} {'change':>8}")
+    for result in current['results']:
+        key = (result['corpus'], result['size'], result['stage'])
+        before = old.get(key)
+        if before is None:
+            print(f"{key[0]:>9} {key[1]:>6} {key[2]:<22} (not in baseline)")
+            continue
+        if not before['p50_s'] or not result['p50_s']:
+            print(f"{key[0]:>9} {key[1]:>6} {key[2]:<22} (no measurements)")
+            continue
+        p50_change = (result['p50_s'] - before['p50_s']) / before['p50_s']
+        throughput_change = ((result['throughput'] - before['throughput']) / before['throughput']
+                             if before['throughput'] and result['throughput'] else 0.0)
+        flag = ''
+        if p50_change > threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f"{key[0]:>9} {key[1]:>6} {key[2]:<22} {before['p50_s']:9.4f} {result['p50_s']:9.4f} "
+              f"{p50_change:+8.1%} {before['throughput'] or 0:10.1f} {result['throughput'] or 0:10.1f} "
+              f"{throughput_change:+8.1%}{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stage-level benchmark suite for the RAG pipeline.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Run the benchmarks and write a JSON report")
+    run_parser.add_argument('--output', default='benchmark_results.json')
+    run_parser.add_argument('--corpus', nargs='+', choices=['synthetic', 'real'], default=['synthetic', 'real'])
+    run_parser.add_argument('--sizes', nargs='+', type=int, default=[20, 100],
+                            help="Synthetic corpus sizes in pages")
+    run_parser.add_argument('--pdf', default=APPLE_PDF_PATH, help="Real corpus (file, directory or glob)")
+    run_parser.add_argument('--repeats', type=int, default=3, help="Runs of each ingestion stage")
+    run_parser.add_argument('--queries', type=int, default=50, help="get_context calls per corpus")
+    run_parser.add_argument('--llm-requests', type=int, default=10, help="LLM calls per corpus (0 to skip)")
+    run_parser.add_argument('--k', type=int, default=DEFAULT_K_RETRIEVER)
+    run_parser.add_argument('--retrieval-mode', default=RETRIEVAL_MODE)
+    run_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    run_parser.add_argument('--chunk-overlap', type=int, default=CHUNK_OVERLAP)
+    run_parser.add_argument('--backend', default=VECTOR_STORE_BACKEND)
+    run_parser.add_argument('--embedding-model', default=EMBEDDING_MODEL_NAME)
+    run_parser.add_argument('--embedding-workers', type=int, default=EMBEDDING_WORKERS)
+    run_parser.add_argument('--embedding-batch-size', type=int, default=EMBEDDING_BATCH_SIZE)
+    run_parser.add_argument('--model', default=None, help="LLM to call (defaults to DEFAULT_MODEL_NAME)")
+    run_parser.add_argument('--max-tokens', type=int, default=256)
+    run_parser.add_argument('--ollama-host', default=None,
+                            help="Benchmark a real Ollama server instead of the local stub")
+    run_parser.add_argument('--tokens-per-second', type=float, default=50.0, help="Stub generation speed")
+    run_parser.add_argument('--response-tokens', type=int, default=64, help="Stub response length")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--verbose', action='store_true', help="Show the pipeline's progress messages")
+
+    compare_parser = commands.add_parser('compare', help="Compare two JSON reports")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help="p50 slowdown (fraction) reported as a regression")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        benchmark_report = run_benchmarks(args)
+        with open(args.output, 'w') as f:
+            json.dump(benchmark_report, f, indent=2)
+        print(f"Wrote {len(benchmark_report['results'])} results to {args.output}")
+    else:
+        with open(args.baseline) as f:
+            baseline_report = json.load(f)
+        with open(args.current) as f:
+            current_report = json.load(f)
+        regressed = compare_reports(baseline_report, current_report, args.threshold)
+        print(f"{regressed} stage(s) regressed by more than {args.threshold:.0%}.")
+        sys.exit(1 if regressed else 0)
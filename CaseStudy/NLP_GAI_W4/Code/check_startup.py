@@ -0,0 +1,63 @@
+# check_startup.py
+
+"""
+This file checks that importing functions.py and creating a RAG_LLM stays fast.
+It runs the import in a fresh interpreter, fails if it takes longer than
+IMPORT_TIME_BUDGET_S, and fails if any heavy dependency (model runtimes, API SDKs,
+vector database clients) was loaded before it was actually needed.
+
+Usage:
+    python check_startup.py
+"""
+import sys
+import json
+import subprocess
+
+from config import IMPORT_TIME_BUDGET_S
+
+# Modules that must only be imported once the corresponding feature is used.
+HEAVY_MODULES = [
+    'torch',
+    'sentence_transformers',
+    'langchain_huggingface',
+    'langchain_chroma',
+    'chromadb',
+    'langchain_community',
+    'fitz',
+    'ollama',
+    'google.generativeai',
+    'numpy',
+]
+
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import functions
+functions.RAG_LLM()
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+def measure_startup() -> dict:
+    """
+    Returns {'elapsed': seconds, 'modules': [...]} for a cold import in a subprocess.
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE], capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    startup = measure_startup()
+    loaded = [name for name in HEAVY_MODULES if name in startup['modules']]
+    print(f"Import + RAG_LLM(): {startup['elapsed']:.3f}s (budget {IMPORT_TIME_BUDGET_S:.3f}s)")
+    failed = False
+    if loaded:
+        print(f"Heavy modules loaded at startup: {', '.join(loaded)}")
+        failed = True
+    if startup['elapsed'] > IMPORT_TIME_BUDGET_S:
+        print("Startup is over budget.")
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -30,8 +30,19 @@ DEFAULT_MODEL_NAME = DEFAULT_OLLAMA_MODEL
 # --- File Paths ---
 # Path to the PDF document for data loading.
 APPLE_PDF_PATH = "HBR_How_Apple_Is_Organized_For_Innovation.pdf"
+# Directory where extracted PDF text is cached, keyed by the file's content hash,
+# so unchanged PDFs are never parsed twice.
+EXTRACTED_TEXT_CACHE_DIR = 'pdf_text_cache'
+# Number of worker processes used to parse PDFs. None uses every available core.
+PDF_INGEST_WORKERS = None
 # Directory to persist the Chroma vector database.
 VECTOR_DB_DIR = 'vector_db_1024'
+# Manifest of per-chunk content hashes, stored inside VECTOR_DB_DIR. It lets a
+# rebuild embed only new or changed chunks and delete the ones that disappeared.
+INDEX_MANIFEST_FILE = 'index_manifest.json'
+# Number of chunks embedded and written to the vector store per bulk insert. It is
+# raised automatically to EMBEDDING_WORKERS * EMBEDDING_BATCH_SIZE when that is larger.
+INDEX_BATCH_SIZE = 256
 
 # --- Chunking Parameters ---
 # The size of each text chunk (in tokens).
@@ -40,15 +51,89 @@ CHUNK_SIZE = 1024
 CHUNK_OVERLAP = 20
 # The encoding name for tiktoken, used for token counting.
 ENCODING_NAME = 'cl100k_base'
+# Number of documents (pages) handed to a chunking worker at a time.
+CHUNK_BATCH_SIZE = 64
+# Number of worker processes used for chunking. None uses every available core.
+CHUNK_WORKERS = None
 
 # --- Embedding Parameters ---
 # The name of the Sentence Transformer model used for generating embeddings.
 # Note: If you change the embedding model, you must delete the old VECTOR_DB_DIR.
 EMBEDDING_MODEL_NAME = 'mixedbread-ai/mxbai-embed-large-v1'
+# Persistent cache of embedding vectors keyed by (model name, normalized text hash).
+# Rebuilding an index only re-encodes chunks whose text was never seen before.
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_DIR = 'embedding_cache'
+# Maximum number of cached vectors per model; least recently used entries are evicted.
+# Changing it resizes an existing cache on next use (lowering it drops entries).
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000
+# Number of worker processes used to embed documents during indexing. Each worker
+# loads its own copy of the model, so budget RAM accordingly. 1 embeds in-process.
+EMBEDDING_WORKERS = 1
+# Number of texts encoded per model forward pass.
+EMBEDDING_BATCH_SIZE = 32
+
+# --- Vector Store Parameters ---
+# Which vector store backs retrieval:
+#   'chroma'    - Chroma (default).
+#   'numpy'     - built-in exact brute-force NumPy index (one matmul per query).
+#   'numpy-ivf' - built-in approximate NumPy index (inverted file), for large corpora.
+# Switching backends re-indexes VECTOR_DB_DIR on the next setup_vector_database() call.
+VECTOR_STORE_BACKEND = 'chroma'
+# Name of the Chroma collection holding the chunks (LangChain's default name).
+CHROMA_COLLECTION_NAME = 'langchain'
+# Storage precision of the NumPy index: 'float32', or 'float16' to halve memory.
+NUMPY_INDEX_DTYPE = 'float32'
+# Number of IVF clusters. None picks roughly sqrt(number of chunks).
+IVF_NLIST = None
+# Number of IVF clusters scanned per query. Higher is more accurate but slower.
+IVF_NPROBE = 8
 
 # --- Retriever Parameters ---
 # Default number of relevant documents to retrieve from the vector store.
 DEFAULT_K_RETRIEVER = 3
+# In-memory cache of retrieval results keyed by (normalized query, k, index version).
+# Entries expire after RETRIEVAL_CACHE_TTL seconds and the whole cache is dropped
+# whenever the index is rebuilt. A size of 0 disables it.
+RETRIEVAL_CACHE_SIZE = 1024
+RETRIEVAL_CACHE_TTL = 600
+# Second-tier cache of query embeddings, so the same question asked with a different
+# k skips the embedding model. A size of 0 disables it.
+QUERY_EMBEDDING_CACHE_SIZE = 4096
+# How chunks are retrieved: 'dense' (vector similarity), 'keyword' (BM25 only, never
+# touches the embedding model) or 'hybrid' (both, merged with reciprocal rank fusion).
+RETRIEVAL_MODE = 'dense'
+# Number of candidates taken from each of the dense and keyword rankings before fusion.
+HYBRID_FETCH_K = 20
+# Reciprocal rank fusion constant; larger values flatten the advantage of top ranks.
+RRF_K = 60
+# BM25 term-frequency saturation and document-length normalization.
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# --- Collections ---
+# Named document collections served by one RAG_LLM, as name -> vector database
+# directory. Subdirectories of COLLECTIONS_DIR holding an index are registered too,
+# named after the subdirectory; setup_vector_database(collection=...) builds them there.
+COLLECTIONS = {}
+COLLECTIONS_DIR = 'collections'
+# Collections are opened on first query and closed least recently used first once
+# their indexes (estimated from their size on disk) exceed this many megabytes.
+# Closing frees the memory of NumPy-backed collections only: chromadb keeps every
+# Chroma directory it has opened loaded until the process exits.
+INDEX_MEMORY_BUDGET_MB = 2048
+
+# --- Context Packing Parameters ---
+# Maximum prompt tokens (system message, question and retrieved context) for a Q&A
+# prompt. Keys are model name prefixes; models that match none use
+# DEFAULT_PROMPT_TOKEN_BUDGET. Smaller prompts mean less prefill time on local models.
+DEFAULT_PROMPT_TOKEN_BUDGET = 4096
+PROMPT_TOKEN_BUDGETS = {
+    'gemini': 16384,
+}
+# Chunks with a dense similarity score below this are not added to the context
+# (None disables the threshold). Not applied to keyword or hybrid scores.
+CONTEXT_MIN_SCORE = None
 
 # --- LLM Generation Parameters ---
 # Default maximum number of tokens for the LLM to generate.
@@ -58,4 +143,52 @@ DEFAULT_TEMPERATURE = 0.1 # A low temperature for more factual, less creative an
 # Default top_p value for nucleus sampling.
 DEFAULT_TOP_P = 0.9
 # Default top_k value for sampling.
-DEFAULT_TOP_K = 40
\ No newline at end of file
+DEFAULT_TOP_K = 40
+# Maximum number of LLM calls in flight at once for batch APIs such as get_answers().
+LLM_MAX_CONCURRENCY = 4
+
+# --- Model Warm-up Parameters ---
+# How long Ollama keeps a model loaded after its last request, e.g. '30m', '-1' (keep it
+# loaded indefinitely) or '0' (unload right away). None uses the server default (5m).
+OLLAMA_KEEP_ALIVE = '30m'
+# Load the default LLM (in the background) when a RAG_LLM is created, and the embedding
+# model in create_embeddings(), instead of on the first request.
+WARM_UP_ON_INIT = False
+
+# --- LLM Response Cache ---
+# Opt-in SQLite cache of LLM responses keyed by (backend, model, messages, max_tokens,
+# temperature, top_p, top_k). Useful for repeated evaluation runs at low temperature.
+# Enable per instance with enable_response_cache() or per call with use_cache=True.
+LLM_CACHE_ENABLED = False
+LLM_CACHE_PATH = 'llm_response_cache.sqlite3'
+# Size cap of the cache in megabytes; least recently used responses are evicted.
+LLM_CACHE_MAX_MB = 256
+
+# --- Bulk Evaluation Parameters ---
+# Number of questions evaluated concurrently by evaluation.py.
+EVAL_WORKERS = 4
+# Maximum LLM requests per minute for each backend during bulk evaluation
+# (None means unlimited).
+EVAL_RATE_LIMITS = {'ollama': None, 'gemini': 60}
+
+# --- Async Generation Parameters ---
+# Per-backend limits on concurrent in-flight requests for the async API.
+OLLAMA_MAX_CONCURRENCY = 4
+GEMINI_MAX_CONCURRENCY = 8
+# Seconds to wait for one async LLM call before giving up.
+LLM_TIMEOUT = 120
+
+# --- Logging and Instrumentation ---
+# Level of the pipeline's progress messages, which are written to stdout as plain text.
+LOG_LEVEL = 'INFO'
+# Record timing spans per stage and counters (chunks embedded, retrievals, cache hits,
+# LLM requests, errors and tokens). Can also be switched on with enable_instrumentation().
+INSTRUMENTATION_ENABLED = False
+# Where spans and counters go: 'logging' (debug messages on the 'rag.metrics' logger)
+# and/or 'prometheus' (aggregated, see RAG_LLM.metrics_text()).
+INSTRUMENTATION_EXPORTERS = ('logging', 'prometheus')
+
+# --- Startup Parameters ---
+# Maximum seconds for `import functions` plus RAG_LLM() in a fresh interpreter,
+# checked by check_startup.py.
+IMPORT_TIME_BUDGET_S = 1.0
@@ -0,0 +1,103 @@
+# context_packer.py
+
+"""
+This file packs retrieved chunks into the context of a RAG prompt under a token budget.
+Chunks are added in relevance order until the budget is used up. Text repeated between
+chunks is dropped, and so is the overlap that the text splitter leaves between adjacent
+chunks. Optionally, packing stops at the first chunk whose similarity score is below a
+threshold. Token counts use the same tiktoken encoding as the text splitter.
+"""
+from functools import lru_cache
+
+# Overlaps shorter than this many characters are left alone; they are as likely to be
+# a coincidence (a common word or phrase) as splitter overlap.
+MIN_OVERLAP_CHARS = 32
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str):
+    import tiktoken
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_tokens(text: str, encoding_name: str) -> int:
+    return len(get_encoding(encoding_name).encode(text, disallowed_special=()))
+
+
+def count_prompt_tokens(prompt: list, encoding_name: str) -> int:
+    """
+    Counts the tokens in the contents of a list of chat messages. Per-message
+    formatting tokens added by the backend are not included.
+    """
+    return sum(count_tokens(message['content'], encoding_name) for message in prompt)
+
+
+def overlap_length(head: str, tail: str) -> int:
+    """
+    Returns the length of the longest suffix of head that is also a prefix of tail
+    (at least MIN_OVERLAP_CHARS long), or 0 if there is none.
+    """
+    if len(head) < MIN_OVERLAP_CHARS or len(tail) < MIN_OVERLAP_CHARS:
+        return 0
+    probe = tail[:MIN_OVERLAP_CHARS]
+    start = head.find(probe, max(0, len(head) - len(tail)))
+    while start != -1:
+        if tail.startswith(head[start:]):
+            return len(head) - start
+        start = head.find(probe, start + 1)
+    return 0
+
+
+def remove_overlap(text: str, selected: list) -> str:
+    """
+    Strips from text any part already present in the selected chunks: returns '' if
+    it is contained in one of them, and otherwise trims a leading part that continues
+    a selected chunk and a trailing part that a selected chunk starts with.
+    """
+    for other in selected:
+        if text in other:
+            return ''
+    for other in selected:
+        cut = overlap_length(other, text)
+        if cut:
+            text = text[cut:].lstrip(' .,;:\n')
+        cut = overlap_length(text, other)
+        if cut:
+            text = text[:-cut]
+    return text.strip()
+
+
+def pack_context(results: list, max_tokens: int, encoding_name: str,
+                 min_score: float = None, separator: str = '. '):
+    """
+    Packs (Document, score) pairs, most relevant first, into a context string of at
+    most max_tokens tokens. Chunks that do not fit are skipped so that smaller, less
+    relevant chunks can still use the remaining budget.
+
+    Returns:
+        tuple: (context, stats) where stats has 'chunks_used', 'chunks_skipped'
+               (over budget), 'chunks_deduplicated', 'chunks_below_threshold' and
+               'context_tokens'.
+    """
+    stats = {'chunks_used': 0, 'chunks_skipped': 0, 'chunks_deduplicated': 0,
+             'chunks_below_threshold': 0, 'context_tokens': 0}
+    separator_tokens = count_tokens(separator, encoding_name)
+    selected = []
+    used_tokens = 0
+    for position, (doc, score) in enumerate(results):
+        if min_score is not None and score < min_score:
+            stats['chunks_below_threshold'] = len(results) - position
+            break
+        text = remove_overlap(doc.page_content.strip(), selected)
+        if not text:
+            stats['chunks_deduplicated'] += 1
+            continue
+        tokens = count_tokens(text, encoding_name) + (separator_tokens if selected else 0)
+        if used_tokens + tokens > max_tokens:
+            stats['chunks_skipped'] += 1
+            continue
+        selected.append(text)
+        used_tokens += tokens
+    stats['chunks_used'] = len(selected)
+    stats['context_tokens'] = used_tokens
+    return separator.join(selected), stats
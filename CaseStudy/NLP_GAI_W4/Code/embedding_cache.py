@@ -0,0 +1,321 @@
+# embedding_cache.py
+
+"""
+This file provides a disk-backed cache for embedding vectors.
+Vectors are stored in a NumPy memmap and indexed by a small SQLite table, keyed by
+the embedding model name and a hash of the normalized text. The cache is bounded
+in size and evicts the least recently used entries once it is full.
+"""
+import os
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from instrumentation import logger
+
+# Seconds after which a reserved but never completed entry (e.g. left by a crashed
+# process) may be evicted like any other.
+PENDING_ENTRY_TIMEOUT = 600
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapses runs of whitespace so trivially different copies of a chunk share a key.
+    """
+    return ' '.join(text.split())
+
+
+class EmbeddingCache:
+    """
+    A size-capped, least-recently-used store of embedding vectors for one model.
+    Each model gets its own directory under cache_dir holding 'index.sqlite3'
+    (text hash -> slot, last use) and 'vectors.f32' (a slots x dim memmap).
+
+    Several processes may share a cache directory. Slots are handed out inside a
+    write transaction, and an entry only becomes visible ('ready') after its vector
+    has been written and flushed, so a crash can lose entries but never make a key
+    return another text's vector.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str, max_entries: int):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.directory = os.path.join(cache_dir, safe_name)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._conn = sqlite3.connect(
+            os.path.join(self.directory, 'index.sqlite3'), check_same_thread=False,
+            timeout=30, isolation_level=None
+        )
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, last_used REAL NOT NULL, '
+            'ready INTEGER NOT NULL DEFAULT 1)'
+        )
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(entries)')]
+        if 'ready' not in columns:
+            self._conn.execute('ALTER TABLE entries ADD COLUMN ready INTEGER NOT NULL DEFAULT 1')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+
+        dim = self._meta('dim')
+        if dim:
+            self._open_vectors(dim)
+
+    def key(self, text: str, kind: str = 'document') -> str:
+        """
+        Returns the cache key for a text. Query and document embeddings are kept
+        apart because some models encode them differently.
+        """
+        payload = f"{self.model_name}\0{kind}\0{normalize_text(text)}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _meta(self, name: str):
+        row = self._conn.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def _open_vectors(self, dim: int):
+        """
+        Maps the vector file and applies max_entries: a larger cap grows the file, a
+        smaller one drops the entries whose slots fall outside it.
+        """
+        path = os.path.join(self.directory, 'vectors.f32')
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            stored_capacity = self._meta('capacity')
+            if stored_capacity is not None and stored_capacity != self.max_entries:
+                dropped = 0
+                if self.max_entries < stored_capacity:
+                    dropped = self._conn.execute(
+                        'DELETE FROM entries WHERE slot >= ?', (self.max_entries,)).rowcount
+                logger.info(f"Embedding cache for '{self.model_name}' resized from {stored_capacity} "
+                            f"to {self.max_entries} entries ({dropped} entries dropped).")
+            # The file only ever grows, so processes still mapping the old size stay valid.
+            if self._file_rows(path, dim) < self.max_entries:
+                with open(path, 'ab') as f:
+                    f.truncate(self.max_entries * dim * 4)
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (dim,))
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('capacity', ?)", (self.max_entries,))
+            self._conn.execute('COMMIT')
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._map_vectors(path, dim)
+
+    @staticmethod
+    def _file_rows(path: str, dim: int) -> int:
+        return os.path.getsize(path) // (dim * 4) if os.path.exists(path) else 0
+
+    def _map_vectors(self, path: str, dim: int):
+        self._vectors = np.memmap(path, dtype=np.float32, mode='r+',
+                                  shape=(self._file_rows(path, dim), dim))
+
+    def _ensure_mapped(self, slot: int):
+        # Another process may have grown the file since it was mapped here.
+        if slot >= self._vectors.shape[0]:
+            self._map_vectors(self._vectors.filename, self._vectors.shape[1])
+
+    def get_many(self, keys: list) -> dict:
+        """
+        Returns {key: vector} for the keys present in the cache and refreshes their
+        last-used time. Updates the hit and miss counters.
+
+        The lookup and the copy run in the same write transaction that _reserve_slots
+        takes to evict entries, so no other process can hand a slot to another key
+        (and start overwriting it) between finding an entry and reading its vector.
+        """
+        found = {}
+        with self._lock:
+            if self._vectors is None and self._meta('dim'):
+                self._open_vectors(self._meta('dim'))
+            if self._vectors is not None:
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for start in range(0, len(keys), 500):
+                        batch = keys[start:start + 500]
+                        placeholders = ','.join('?' * len(batch))
+                        rows = self._conn.execute(
+                            f'SELECT key, slot FROM entries WHERE ready = 1 AND key IN ({placeholders})', batch
+                        ).fetchall()
+                        for key, slot in rows:
+                            self._ensure_mapped(slot)
+                            found[key] = np.array(self._vectors[slot])
+                    if found:
+                        now = time.time()
+                        self._conn.executemany(
+                            'UPDATE entries SET last_used = ? WHERE key = ?',
+                            [(now, key) for key in found]
+                        )
+                    self._conn.execute('COMMIT')
+                except BaseException:
+                    self._conn.execute('ROLLBACK')
+                    raise
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items: dict):
+        """
+        Stores {key: vector} entries, evicting the least recently used entries
+        when the cache is full.
+
+        Slots are reserved (and evicted entries deleted) in one write transaction that
+        is committed before any vector is written; the new entries are marked ready
+        only after their vectors are flushed.
+        """
+        if not items:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._open_vectors(len(next(iter(items.values()))))
+            slots = self._reserve_slots(list(items))
+            if not slots:
+                return
+            self._ensure_mapped(max(slots.values()))
+            for key, slot in slots.items():
+                self._vectors[slot] = np.asarray(items[key], dtype=np.float32)
+            self._vectors.flush()
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'UPDATE entries SET ready = 1 WHERE key = ? AND slot = ?', list(slots.items())
+            )
+            self._conn.execute('COMMIT')
+
+    def _reserve_slots(self, keys: list) -> dict:
+        """
+        Returns {key: slot} for the keys that need their vector written, reserving
+        free slots (or the slots of evicted entries) for them as not-ready entries.
+        """
+        now = time.time()
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            capacity = self._meta('capacity')
+            existing = {}
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                for key, slot, ready in self._conn.execute(
+                        f'SELECT key, slot, ready FROM entries WHERE key IN ({placeholders})', batch):
+                    existing[key] = (slot, ready)
+            # Keep at most 'capacity' of the incoming entries.
+            pending = [key for key in keys if not (key in existing and existing[key][1])][-capacity:]
+            # A not-ready entry was left by a crash or is being written by another
+            # process: its vector is the same, so its slot is simply written again.
+            slots = {key: existing[key][0] for key in pending if key in existing}
+            new_keys = [key for key in pending if key not in existing]
+
+            free = self._free_slots(capacity, len(new_keys))
+            shortfall = len(new_keys) - len(free)
+            if shortfall > 0:
+                # Entries still being written elsewhere are never evicted, unless stale.
+                evicted = self._conn.execute(
+                    'SELECT key, slot FROM entries WHERE (ready = 1 OR last_used < ?) '
+                    'ORDER BY last_used LIMIT ?',
+                    (now - PENDING_ENTRY_TIMEOUT, shortfall + len(slots))
+                ).fetchall()
+                evicted = [(key, slot) for key, slot in evicted if key not in slots][:shortfall]
+                self._conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key, _ in evicted])
+                free.extend(slot for _, slot in evicted)
+                new_keys = new_keys[:len(free)]
+            slots.update(zip(new_keys, free))
+
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO entries (key, slot, last_used, ready) VALUES (?, ?, ?, 0)',
+                [(key, slot, now) for key, slot in slots.items()]
+            )
+            self._conn.execute('COMMIT')
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        return slots
+
+    def _free_slots(self, capacity: int, count: int) -> list:
+        """
+        Returns up to count unused slots below capacity: first those above the highest
+        slot in use, then any holes (left by dropped entries).
+        """
+        used, highest = self._conn.execute('SELECT COUNT(*), MAX(slot) FROM entries').fetchone()
+        highest = -1 if highest is None else highest
+        free = list(range(highest + 1, min(capacity, highest + 1 + count)))
+        if len(free) < count and used < min(capacity, highest + 1):
+            occupied = {slot for (slot,) in self._conn.execute('SELECT slot FROM entries')}
+            free += [slot for slot in range(min(capacity, highest + 1)) if slot not in occupied][:count - len(free)]
+        return free
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM entries WHERE ready = 1').fetchone()[0]
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and the current size of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'model': self.model_name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self),
+            'max_entries': self.max_entries,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps any LangChain embedding function with an EmbeddingCache. Both document and
+    query embeddings go through the cache; only misses reach the underlying model.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_dir: str, max_entries: int):
+        self.embeddings = embeddings
+        self.cache = EmbeddingCache(model_name, cache_dir, max_entries)
+
+    def embed_documents(self, texts: list) -> list:
+        keys = [self.cache.key(text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        return [np.asarray(found[key], dtype=np.float32).tolist() for key in keys]
+
+    def embed_queries(self, texts: list) -> list:
+        """
+        Embeds many queries at once; cache misses are encoded in a single batch.
+        """
+        keys = [self.cache.key(text, kind='query') for text in texts]
+        found = self.cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            embed_many = getattr(self.embeddings, 'embed_queries', self.embeddings.embed_documents)
+            computed = dict(zip(missing.keys(), embed_many(list(missing.values()))))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [np.asarray(found[key], dtype=np.float32).tolist() for key in keys]
+
+    def embed_query(self, text: str) -> list:
+        key = self.cache.key(text, kind='query')
+        found = self.cache.get_many([key])
+        if key not in found:
+            found[key] = self.embeddings.embed_query(text)
+            self.cache.put_many(found)
+        return np.asarray(found[key], dtype=np.float32).tolist()
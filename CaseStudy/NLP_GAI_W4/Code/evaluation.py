@@ -0,0 +1,205 @@
+# evaluation.py
+
+"""
+This file provides a resumable bulk evaluation runner for the RAG LLM application.
+It reads questions from a CSV or Parquet file, answers and rates each one (groundedness
+and relevance) across a pool of workers, and writes a results table with per-stage
+latencies and token counts.
+
+Every completed question is appended to a JSONL checkpoint file as soon as it finishes,
+so an interrupted run resumes where it stopped instead of starting over. Questions that
+fail are reported in the results but not checkpointed, so the next run retries them.
+
+Usage:
+    python evaluation.py questions.csv results.csv --workers 4
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from config import DEFAULT_K_RETRIEVER, EVAL_WORKERS, EVAL_RATE_LIMITS, VECTOR_DB_DIR
+from rate_limiter import RateLimiter
+
+
+def read_table(path: str):
+    """
+    Reads a CSV or Parquet file into a DataFrame, based on the file extension.
+    """
+    if path.lower().endswith(('.parquet', '.pq')):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def write_table(df, path: str):
+    """
+    Writes a DataFrame to CSV or Parquet, based on the file extension.
+    """
+    if path.lower().endswith(('.parquet', '.pq')):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def load_checkpoint(checkpoint_path: str) -> dict:
+    """
+    Returns {row id: result} for every row recorded in the checkpoint file.
+    A partially written last line (from a crash) is ignored.
+    """
+    completed = {}
+    if not os.path.exists(checkpoint_path):
+        return completed
+    with open(checkpoint_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            completed[record['id']] = record
+    return completed
+
+
+def question_id(question: str) -> str:
+    """
+    Default row id: a hash of the question text, so the checkpoint stays valid when
+    rows are added, removed or reordered.
+    """
+    return hashlib.sha256(question.encode('utf-8')).hexdigest()[:16]
+
+
+def evaluate_question(rag, question: str, k: int = DEFAULT_K_RETRIEVER, **llm_kwargs) -> dict:
+    """
+    Answers and rates one question, timing each stage. The context is retrieved once
+    and shared by the answer and both judges, which run concurrently.
+    """
+    result = {'question': question}
+
+    start = time.perf_counter()
+    context = rag.get_context(question, k=k)
+    result['retrieval_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prompt = rag.create_rag_prompt(question, context=context)
+    answer, usage = rag.complete(prompt, return_usage=True, **llm_kwargs)
+    result['answer_s'] = time.perf_counter() - start
+    result['answer'] = answer
+    result['answer_prompt_tokens'] = usage.get('prompt_tokens')
+    result['answer_completion_tokens'] = usage.get('completion_tokens')
+
+    start = time.perf_counter()
+    ratings = rag.rate_answer(question, answer, k=k, context=context, return_usage=True, **llm_kwargs)
+    result['rating_s'] = time.perf_counter() - start
+    for name in ('groundedness', 'relevance'):
+        usage = ratings['usage'][name]
+        result[name] = ratings[name]
+        result[f'{name}_prompt_tokens'] = usage.get('prompt_tokens')
+        result[f'{name}_completion_tokens'] = usage.get('completion_tokens')
+
+    result['total_s'] = result['retrieval_s'] + result['answer_s'] + result['rating_s']
+    return result
+
+
+def run_evaluation(rag, questions_path: str, output_path: str,
+                   checkpoint_path: str = None,
+                   question_column: str = 'question',
+                   id_column: str = None,
+                   k: int = DEFAULT_K_RETRIEVER,
+                   max_workers: int = EVAL_WORKERS,
+                   rate_limits: dict = EVAL_RATE_LIMITS,
+                   **llm_kwargs):
+    """
+    Evaluates every question in questions_path and writes the results to output_path.
+
+    Args:
+        rag (RAG_LLM): A RAG_LLM instance with its vector database already set up.
+        questions_path (str): CSV or Parquet file with one question per row.
+        output_path (str): CSV or Parquet file for the results.
+        checkpoint_path (str): JSONL checkpoint; defaults to output_path + '.checkpoint.jsonl'.
+        question_column (str): Column holding the question text.
+        id_column (str): Column holding a stable row id; defaults to a hash of the question.
+        max_workers (int): Number of questions evaluated concurrently.
+        rate_limits (dict): Requests per minute per backend ('ollama', 'gemini').
+
+    Returns:
+        pandas.DataFrame: One row per question, in input order.
+    """
+    checkpoint_path = checkpoint_path or output_path + '.checkpoint.jsonl'
+    questions = read_table(questions_path)
+    texts = questions[question_column].astype(str).tolist()
+    ids = questions[id_column].astype(str).tolist() if id_column else [question_id(text) for text in texts]
+
+    completed = load_checkpoint(checkpoint_path)
+    # Repeated questions share an id and are evaluated once.
+    pending = list(dict((row_id, text) for row_id, text in zip(ids, texts) if row_id not in completed).items())
+    print(f"Evaluating {len(pending)} questions ({len(completed)} already done) with {max_workers} workers.")
+
+    # Passed with every LLM call rather than set on rag, which other callers may share.
+    rate_limiters = {
+        backend: RateLimiter(rpm) for backend, rpm in (rate_limits or {}).items() if rpm
+    }
+    failed = {}
+    with open(checkpoint_path, 'a') as checkpoint, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(evaluate_question, rag, text, k, rate_limiters=rate_limiters, **llm_kwargs): row_id
+            for row_id, text in pending
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            row_id = futures[future]
+            try:
+                result = dict(future.result(), id=row_id)
+            except Exception as e:
+                failed[row_id] = {'id': row_id, 'error': str(e)}
+                print(f"Question {row_id} failed: {e}")
+                continue
+            checkpoint.write(json.dumps(result) + '\n')
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+            completed[row_id] = result
+            if done % 10 == 0 or done == len(pending):
+                print(f"Progress: {done}/{len(pending)} questions.")
+
+    rows = []
+    for row_id, text in zip(ids, texts):
+        row = completed.get(row_id) or dict(failed.get(row_id, {'id': row_id}), question=text)
+        rows.append(row)
+    results = pd.DataFrame(rows)
+    if 'error' not in results:
+        results['error'] = None
+    results = results[['id'] + [column for column in results.columns if column != 'id']]
+    write_table(results, output_path)
+    print(f"Wrote {len(results)} results to {output_path} ({len(failed)} failed).")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bulk evaluation of the RAG LLM over a question dataset.")
+    parser.add_argument('questions', help="CSV or Parquet file of questions")
+    parser.add_argument('output', help="CSV or Parquet file for the results")
+    parser.add_argument('--checkpoint', default=None, help="JSONL checkpoint file")
+    parser.add_argument('--question-column', default='question')
+    parser.add_argument('--id-column', default=None)
+    parser.add_argument('--k', type=int, default=DEFAULT_K_RETRIEVER)
+    parser.add_argument('--workers', type=int, default=EVAL_WORKERS)
+    parser.add_argument('--model', default=None, help="Model to evaluate (defaults to DEFAULT_MODEL_NAME)")
+    parser.add_argument('--vector-db', default=VECTOR_DB_DIR)
+    args = parser.parse_args()
+
+    from functions import RAG_LLM
+
+    rag_system = RAG_LLM()
+    if args.model:
+        rag_system.set_model(args.model)
+    rag_system.create_embeddings()
+    rag_system.load_vector_database(args.vector_db)
+    run_evaluation(
+        rag_system, args.questions, args.output,
+        checkpoint_path=args.checkpoint,
+        question_column=args.question_column,
+        id_column=args.id_column,
+        k=args.k,
+        max_workers=args.workers
+    )
@@ -1,23 +1,38 @@
 # functions.py - Version 3.1 (Corrected)
+#
+# Heavy dependencies (Ollama, Gemini, LangChain, sentence-transformers/torch, Chroma,
+# NumPy) are imported lazily where they are first needed, so importing this module and
+# creating a RAG_LLM stay fast. Run check_startup.py to verify the import-time budget.
 
 import os
-import tiktoken
-import pandas as pd
-
-# --- API Clients ---
-from ollama import Client as OllamaClient
-import google.generativeai as genai
-
-# --- LangChain Components ---
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+import json
+import time
+import glob
+import hashlib
+import asyncio
+import itertools
+import threading
+import weakref
+import multiprocessing
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 # --- Import constants and prompt templates ---
 from config import (
-    APPLE_PDF_PATH, VECTOR_DB_DIR, CHUNK_SIZE, CHUNK_OVERLAP,
-    ENCODING_NAME, EMBEDDING_MODEL_NAME, DEFAULT_K_RETRIEVER,
+    APPLE_PDF_PATH, EXTRACTED_TEXT_CACHE_DIR, PDF_INGEST_WORKERS,
+    VECTOR_DB_DIR, INDEX_MANIFEST_FILE, INDEX_BATCH_SIZE,
+    CHUNK_SIZE, CHUNK_OVERLAP, ENCODING_NAME, CHUNK_BATCH_SIZE, CHUNK_WORKERS,
+    EMBEDDING_MODEL_NAME, EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_WORKERS, EMBEDDING_BATCH_SIZE,
+    VECTOR_STORE_BACKEND, CHROMA_COLLECTION_NAME, NUMPY_INDEX_DTYPE, IVF_NLIST, IVF_NPROBE, DEFAULT_K_RETRIEVER,
+    RETRIEVAL_CACHE_SIZE, RETRIEVAL_CACHE_TTL, QUERY_EMBEDDING_CACHE_SIZE,
+    RETRIEVAL_MODE, HYBRID_FETCH_K, RRF_K, BM25_K1, BM25_B,
+    COLLECTIONS, COLLECTIONS_DIR, INDEX_MEMORY_BUDGET_MB,
+    DEFAULT_PROMPT_TOKEN_BUDGET, PROMPT_TOKEN_BUDGETS, CONTEXT_MIN_SCORE, LLM_MAX_CONCURRENCY,
+    OLLAMA_MAX_CONCURRENCY, GEMINI_MAX_CONCURRENCY, LLM_TIMEOUT, OLLAMA_KEEP_ALIVE, WARM_UP_ON_INIT,
+    LOG_LEVEL, INSTRUMENTATION_ENABLED, INSTRUMENTATION_EXPORTERS,
+    LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_MAX_MB,
     DEFAULT_MAX_TOKENS, DEFAULT_TEMPERATURE, DEFAULT_TOP_P, DEFAULT_TOP_K,
     GEMINI_API_KEY, DEFAULT_MODEL_NAME
 )
@@ -26,6 +41,240 @@ from prompt_templates import (
     GROUNDEDNESS_RATER_SYSTEM_MESSAGE, RELEVANCE_RATER_SYSTEM_MESSAGE,
     EVAL_USER_MESSAGE_TEMPLATE
 )
+from instrumentation import (
+    logger, configure_logging, traced, create_exporters, Instrumentation, PrometheusExporter
+)
+from ttl_cache import TTLCache
+from sparse_index import SparseIndex, reciprocal_rank_fusion
+from index_manager import IndexManager
+from context_packer import count_tokens, count_prompt_tokens, pack_context
+from llm_stream import LLMStream
+from llm_cache import ResponseCache
+
+
+RETRIEVAL_MODES = ('dense', 'keyword', 'hybrid')
+
+configure_logging(LOG_LEVEL)
+
+
+def llm_span_attributes(self, prompt, model=None, *args, **kwargs):
+    model = model if model is not None else self.model_name
+    return {'model': model, 'backend': 'gemini' if model.lower().startswith('gemini') else 'ollama'}
+
+# --- Lazy Loading Helpers ---
+_genai = None
+_genai_lock = threading.Lock()
+# chromadb collection behind each open Chroma vector store (see open_vectorstore()).
+_chroma_collections = weakref.WeakKeyDictionary()
+
+def get_genai():
+    """
+    Imports google.generativeai and configures it with GEMINI_API_KEY on first use.
+    """
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            genai.configure(api_key=GEMINI_API_KEY)
+            logger.info("Google Generative AI SDK configured successfully.")
+            _genai = genai
+    return _genai
+
+class LazyEmbeddings:
+    """
+    An embedding function that builds the underlying model only when something
+    actually needs to be embedded, so setting up a RAG_LLM does not load the model.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = self._factory()
+                logger.info("Embedding model loaded.")
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def embed_documents(self, texts: list) -> list:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list:
+        return self.model.embed_query(text)
+
+
+# --- Hashing Helpers ---
+def content_hash(text: str) -> str:
+    """
+    Returns a stable SHA-256 hex digest of a piece of text.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's contents, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --- PDF Ingestion Helpers ---
+def resolve_pdf_paths(pdf_path: str):
+    """
+    Expands a PDF path into a sorted list of files. Accepts a single file,
+    a directory (searched recursively for *.pdf) or a glob pattern.
+    """
+    if os.path.isdir(pdf_path):
+        return sorted(glob.glob(os.path.join(pdf_path, '**', '*.pdf'), recursive=True))
+    if any(ch in pdf_path for ch in '*?['):
+        return sorted(p for p in glob.glob(pdf_path, recursive=True) if os.path.isfile(p))
+    return [pdf_path]
+
+def extract_pdf_pages(pdf_path: str, cache_dir: str = EXTRACTED_TEXT_CACHE_DIR):
+    """
+    Extracts the pages of one PDF as a list of {'page_content', 'metadata'} dicts.
+    Runs inside worker processes. Results are cached on disk by file hash.
+
+    Returns:
+        tuple: (pdf_path, pages, error). On failure pages is None and error holds
+               the message, so one unreadable file never aborts a batch.
+    """
+    try:
+        cache_path = None
+        if cache_dir:
+            cache_path = os.path.join(cache_dir, file_hash(pdf_path) + '.json')
+            if os.path.exists(cache_path):
+                with open(cache_path, 'r') as f:
+                    pages = json.load(f)
+                # The same content may live under another path: point metadata here.
+                for page in pages:
+                    page['metadata']['source'] = pdf_path
+                    page['metadata']['file_path'] = pdf_path
+                return pdf_path, pages, None
+
+        from langchain_community.document_loaders import PyMuPDFLoader
+        pages = [
+            {'page_content': doc.page_content, 'metadata': doc.metadata}
+            for doc in PyMuPDFLoader(pdf_path).load()
+        ]
+        if cache_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(pages, f)
+            os.replace(tmp_path, cache_path)
+        return pdf_path, pages, None
+    except Exception as e:
+        return pdf_path, None, str(e)
+
+
+# --- Chunking Helpers ---
+@lru_cache(maxsize=None)
+def get_text_splitter(chunk_size: int = CHUNK_SIZE,
+                      chunk_overlap: int = CHUNK_OVERLAP,
+                      encoding_name: str = ENCODING_NAME):
+    """
+    Returns a token-based text splitter, built once per process and parameter set
+    so the tiktoken encoder is not reloaded for every call.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=encoding_name,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+
+def split_document_batch(documents: list,
+                         chunk_size: int = CHUNK_SIZE,
+                         chunk_overlap: int = CHUNK_OVERLAP,
+                         encoding_name: str = ENCODING_NAME):
+    """
+    Splits one batch of documents into chunks. Runs inside chunking workers.
+    """
+    return get_text_splitter(chunk_size, chunk_overlap, encoding_name).split_documents(documents)
+
+def iter_batches(iterable, batch_size: int):
+    """
+    Yields lists of up to batch_size items from any iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+# --- Retrieval Helpers ---
+def normalize_query(query: str, casefold: bool = False) -> str:
+    """
+    Normalizes a query for cache lookups, so questions differing only in spacing share
+    an entry. Case is only folded when asked to: embedding models can be case
+    sensitive, so only keyword search (which casefolds its tokens) may ignore it.
+    """
+    query = ' '.join(query.split())
+    return query.casefold() if casefold else query
+
+def chroma_relevance(distance: float, space: str) -> float:
+    """
+    Converts a Chroma distance to a relevance score where higher is more relevant,
+    for the collection's distance function ('l2', 'cosine' or 'ip').
+    """
+    if space == 'l2':
+        return 1.0 - distance / 2 ** 0.5
+    if space == 'ip' and distance <= 0:
+        return -distance
+    return 1.0 - distance
+
+
+# --- Index Manifest Helpers ---
+
+def iter_chunk_keys(chunks):
+    """
+    Yields (chunk_id, content_hash, chunk) for each chunk. The id is built from the
+    chunk's source file, page and its position within that page, so the same chunk
+    gets the same id across rebuilds.
+    """
+    position_per_page = {}
+    for chunk in chunks:
+        source = chunk.metadata.get('source', '')
+        page = chunk.metadata.get('page', 0)
+        position = position_per_page.get((source, page), 0)
+        position_per_page[(source, page)] = position + 1
+        yield f"{source}::{page}::{position}", content_hash(chunk.page_content), chunk
+
+def load_index_manifest(persist_directory: str):
+    """
+    Reads the index manifest stored with the vector database, or returns None if
+    there is none (or it cannot be parsed).
+    """
+    manifest_path = os.path.join(persist_directory, INDEX_MANIFEST_FILE)
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_index_manifest(persist_directory: str, manifest: dict):
+    """
+    Writes the index manifest atomically so a crash never leaves a half-written file.
+    """
+    manifest_path = os.path.join(persist_directory, INDEX_MANIFEST_FILE)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
 
 class RAG_LLM:
     """
@@ -38,146 +287,838 @@ class RAG_LLM:
         Initializes the RAG_LLM by setting up API clients and preparing
         placeholders for the RAG pipeline components.
         """
-        self.ollama_client = OllamaClient()
-        print("Ollama client initialized.")
+        # API clients are created on first use (see the ollama_client property and get_genai()).
+        self._ollama_client = None
+        self._ollama_client_lock = threading.Lock()
+        # Gemini model objects, reused per (model name, system prompt).
+        self._gemini_models = {}
+        self._gemini_models_lock = threading.Lock()
+        # Async clients and semaphores are bound to an event loop, so keep one set per loop.
+        self._async_state = weakref.WeakKeyDictionary()
+        # Timing spans and counters (see instrumentation.py); disabled by default.
+        self.instrumentation = Instrumentation(
+            INSTRUMENTATION_ENABLED,
+            create_exporters(INSTRUMENTATION_EXPORTERS) if INSTRUMENTATION_ENABLED else []
+        )
+        # Time-to-first-token (seconds) of recent streamed responses.
+        self.time_to_first_token = deque(maxlen=1000)
+        # Latency of the first request to each model (which includes loading it) is kept
+        # apart from steady-state latencies, so a cold start does not skew the averages.
+        self.ollama_keep_alive = OLLAMA_KEEP_ALIVE
+        self.first_request_latency = {}
+        self.request_latency = {}
+        self._latency_lock = threading.Lock()
+        # Token counts of recent RAG prompts, and packing stats of the last context.
+        self.prompt_token_counts = deque(maxlen=1000)
+        self.last_context_stats = None
+        # Optional per-backend rate limiters ({'ollama': ..., 'gemini': ...}), each with an
+        # acquire() method called before every blocking LLM request.
+        self.rate_limiters = {}
+        # Persistent LLM response cache (opt-in), opened on first use.
+        self.use_response_cache = LLM_CACHE_ENABLED
+        self.response_cache = None
+        self._response_cache_lock = threading.Lock()
 
-        if GEMINI_API_KEY:
-            try:
-                genai.configure(api_key=GEMINI_API_KEY)
-                print("Google Generative AI SDK configured successfully.")
-            except Exception as e:
-                print(f"Error configuring Google GenAI SDK: {e}")
-        else:
-            print("Warning: GEMINI_API_KEY not found. Gemini models will not be available.")
+        if not GEMINI_API_KEY:
+            logger.warning("Warning: GEMINI_API_KEY not found. Gemini models will not be available.")
 
         # Set instance-level default model name from config
         self.model_name = DEFAULT_MODEL_NAME
-        print(f"Default model for this instance is set to: '{self.model_name}'")
+        logger.info(f"Default model for this instance is set to: '{self.model_name}'")
+        if WARM_UP_ON_INIT:
+            threading.Thread(target=self.warm_up, kwargs={'embeddings': False}, daemon=True).start()
 
         self.document_chunks = None
         self.embedding_model = None
+        self.embedding_model_name = None
+        self.embedding_workers = EMBEDDING_WORKERS
+        self.embedding_batch_size = EMBEDDING_BATCH_SIZE
+        self.vector_store_backend = VECTOR_STORE_BACKEND
         self.vectorstore = None
         self.retriever = None
-        print("RAG_LLM initialized.")
+        # BM25 keyword index built alongside the vector store.
+        self.sparse_index = None
+        self.retrieval_mode = RETRIEVAL_MODE
+        # Bumped every time the index is (re)built; part of every retrieval cache key.
+        self.index_version = 0
+        self.retrieval_cache = TTLCache(RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+        self.query_embedding_cache = TTLCache(QUERY_EMBEDDING_CACHE_SIZE)
+        # Named collections, opened on first query (see get_context(collection=...)).
+        self.index_manager = IndexManager(self._open_collection, INDEX_MEMORY_BUDGET_MB * 1024 * 1024)
+        for name, persist_directory in COLLECTIONS.items():
+            self.index_manager.register(name, persist_directory)
+        self.index_manager.discover(COLLECTIONS_DIR)
+        logger.info("RAG_LLM initialized.")
+
+    @property
+    def ollama_client(self):
+        """
+        The blocking Ollama client, created on first use.
+        """
+        with self._ollama_client_lock:
+            if self._ollama_client is None:
+                from ollama import Client
+                self._ollama_client = Client()
+                logger.info("Ollama client initialized.")
+        return self._ollama_client
+
+    @ollama_client.setter
+    def ollama_client(self, client):
+        self._ollama_client = client
+
+    @staticmethod
+    def _new_async_ollama_client():
+        from ollama import AsyncClient
+        return AsyncClient()
+
+    def enable_instrumentation(self, exporters=INSTRUMENTATION_EXPORTERS):
+        """
+        Starts recording spans and counters, sent to the named exporters
+        ('logging' and/or 'prometheus') or to a list of exporter objects.
+        """
+        if all(isinstance(exporter, str) for exporter in exporters):
+            exporters = create_exporters(exporters)
+        self.instrumentation.exporters = list(exporters)
+        self.instrumentation.enabled = True
 
-    def set_model(self, model_name: str):
+    def disable_instrumentation(self):
+        self.instrumentation.enabled = False
+
+    def metrics_text(self) -> str:
+        """
+        Returns the metrics collected so far in the Prometheus text format, or an empty
+        string if no Prometheus exporter is attached.
+        """
+        exporter = self.instrumentation.get_exporter(PrometheusExporter)
+        return exporter.render() if exporter else ''
+
+    def _count_usage(self, backend: str, model: str, usage: dict):
+        self.instrumentation.count('llm_requests', backend=backend, model=model)
+        self.instrumentation.count('prompt_tokens', usage.get('prompt_tokens') or 0, backend=backend, model=model)
+        self.instrumentation.count('completion_tokens', usage.get('completion_tokens') or 0,
+                                   backend=backend, model=model)
+
+    def set_model(self, model_name: str, warm_up: bool = False):
         """
         Sets the default model to be used for subsequent calls in this instance.
 
         Args:
             model_name (str): The name of the model to set as the new default
                               (e.g., 'gemma2:latest', 'gemini-1.5-flash-latest').
+            warm_up (bool): Load the model now rather than on the first request.
         """
         self.model_name = model_name
-        print(f"Default model for this instance has been changed to: '{self.model_name}'")
+        logger.info(f"Default model for this instance has been changed to: '{self.model_name}'")
+        if warm_up:
+            self.warm_up(model_name, embeddings=False)
 
-    def load_data(self, pdf_path: str = APPLE_PDF_PATH):
+    @traced('warm_up')
+    def warm_up(self, model: str = None, embeddings: bool = True, llm: bool = True):
         """
-        Loads the PDF document from the specified path.
+        Loads a model ahead of the first real request. For Ollama this sends the Q&A
+        system prompt with a one-token generation, which loads the model, applies the
+        keep-alive policy and leaves the shared system prompt prefix in Ollama's prompt
+        cache. For Gemini it configures the SDK and builds the model object.
+        With embeddings=True the embedding model is loaded too; with llm=False only
+        the embedding model is.
         """
-        print(f"Loading data from: {pdf_path}")
+        if llm:
+            self._warm_up_llm(model if model is not None else self.model_name)
+
+        if embeddings and self.embedding_model is not None:
+            start = time.perf_counter()
+            # Bypass the embedding cache so the warm-up text really reaches the model.
+            model = getattr(self.embedding_model, 'embeddings', self.embedding_model)
+            try:
+                model.embed_query("warm-up")
+                logger.info(f"Embedding model warmed up in {time.perf_counter() - start:.2f}s.")
+            except Exception as e:
+                logger.error(f"Error warming up embedding model: {e}")
+
+    def _warm_up_llm(self, model_to_use: str):
+        start = time.perf_counter()
         try:
-            pdf_loader = PyMuPDFLoader(pdf_path)
-            self.documents = pdf_loader.load()
-            print(f"Successfully loaded {len(self.documents)} pages.")
+            if model_to_use.lower().startswith('gemini'):
+                if GEMINI_API_KEY:
+                    self._get_gemini_model(model_to_use, QNA_SYSTEM_MESSAGE)
+            else:
+                self.ollama_client.chat(
+                    model=model_to_use,
+                    messages=[{"role": "system", "content": QNA_SYSTEM_MESSAGE}],
+                    options={"num_predict": 1},
+                    keep_alive=self.ollama_keep_alive
+                )
+                self._record_latency(model_to_use, time.perf_counter() - start)
+            logger.info(f"Model '{model_to_use}' warmed up in {time.perf_counter() - start:.2f}s.")
+        except Exception as e:
+            logger.error(f"Error warming up model '{model_to_use}': {e}")
+
+    def _record_latency(self, model: str, seconds: float):
+        with self._latency_lock:
+            if model not in self.first_request_latency:
+                self.first_request_latency[model] = seconds
+                logger.info(f"First request to '{model}' took {seconds:.2f}s (includes model load).")
+            else:
+                self.request_latency.setdefault(model, deque(maxlen=1000)).append(seconds)
+
+    def latency_stats(self) -> dict:
+        """
+        Returns, per model, the first-request latency and steady-state latency
+        statistics (count, mean, p50, p95) in seconds.
+        """
+        stats = {}
+        with self._latency_lock:
+            for model in set(self.first_request_latency) | set(self.request_latency):
+                latencies = sorted(self.request_latency.get(model, ()))
+                stats[model] = {
+                    'first_request_s': self.first_request_latency.get(model),
+                    'count': len(latencies),
+                    'mean_s': sum(latencies) / len(latencies) if latencies else None,
+                    'p50_s': latencies[len(latencies) // 2] if latencies else None,
+                    'p95_s': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None,
+                }
+        return stats
+
+    def iter_documents(self, pdf_path: str = APPLE_PDF_PATH,
+                       max_workers: int = PDF_INGEST_WORKERS,
+                       cache_dir: str = EXTRACTED_TEXT_CACHE_DIR):
+        """
+        Streams Document objects (one per page) from a PDF file, a directory of PDFs
+        or a glob pattern. Files are parsed across a process pool and their pages are
+        yielded as soon as each file is ready. Unreadable files are reported and skipped.
+        """
+        pdf_paths = resolve_pdf_paths(pdf_path)
+        if not pdf_paths:
+            logger.warning(f"No PDF files found for: {pdf_path}")
+            return
+
+        if len(pdf_paths) == 1 or max_workers == 1:
+            results = (extract_pdf_pages(path, cache_dir) for path in pdf_paths)
+            yield from self._pages_to_documents(results)
+            return
+
+        # 'spawn' avoids forking a process that may already hold torch or tokenizer threads.
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(extract_pdf_pages, path, cache_dir) for path in pdf_paths]
+            results = (future.result() for future in as_completed(futures))
+            yield from self._pages_to_documents(results)
+
+    @staticmethod
+    def _pages_to_documents(results):
+        """
+        Turns (pdf_path, pages, error) results into Document objects, skipping failures.
+        """
+        from langchain_core.documents import Document
+        for path, pages, error in results:
+            if error is not None:
+                logger.warning(f"Skipping unreadable PDF {path}: {error}")
+                continue
+            for page in pages:
+                yield Document(page_content=page['page_content'], metadata=page['metadata'])
+
+    @traced('load_data')
+    def load_data(self, pdf_path: str = APPLE_PDF_PATH, max_workers: int = PDF_INGEST_WORKERS,
+                  cache_dir: str = EXTRACTED_TEXT_CACHE_DIR):
+        """
+        Loads PDF documents from the specified path. The path can be a single PDF,
+        a directory of PDFs or a glob pattern (e.g. 'reports/**/*.pdf').
+        """
+        logger.info(f"Loading data from: {pdf_path}")
+        try:
+            self.documents = list(self.iter_documents(pdf_path, max_workers=max_workers, cache_dir=cache_dir))
+            if not self.documents:
+                logger.warning("No pages could be loaded.")
+                return None
+            logger.info(f"Successfully loaded {len(self.documents)} pages.")
+            self.instrumentation.count('pages_loaded', len(self.documents))
             return self.documents
         except Exception as e:
-            print(f"Error loading PDF data: {e}")
+            logger.error(f"Error loading PDF data: {e}")
             return None
 
+    def iter_chunks(self, documents,
+                    chunk_size: int = CHUNK_SIZE,
+                    chunk_overlap: int = CHUNK_OVERLAP,
+                    encoding_name: str = ENCODING_NAME,
+                    batch_size: int = CHUNK_BATCH_SIZE,
+                    max_workers: int = CHUNK_WORKERS):
+        """
+        Streams chunks from any iterable of documents (e.g. iter_documents()).
+        Batches of documents are split across worker processes and chunks are yielded
+        in input order, so it can feed setup_vector_database() directly while only a
+        few batches are held in memory at a time.
+        """
+        batches = iter_batches(documents, batch_size)
+        head = list(itertools.islice(batches, 2))
+        batches = itertools.chain(head, batches)
+        split_args = (chunk_size, chunk_overlap, encoding_name)
+
+        # A single batch is not worth the cost of starting worker processes.
+        if len(head) < 2 or max_workers == 1:
+            for batch in batches:
+                yield from split_document_batch(batch, *split_args)
+            return
+
+        workers = max_workers or os.cpu_count() or 1
+        # Workers start lazily on submit, possibly while the embedding model is already
+        # running threads, so they are spawned rather than forked.
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            in_flight = deque()
+            for batch in batches:
+                in_flight.append(executor.submit(split_document_batch, batch, *split_args))
+                if len(in_flight) >= 2 * workers:
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
+
+    @traced('chunk_data')
     def chunk_data(self, documents: list,
                    chunk_size: int = CHUNK_SIZE,
                    chunk_overlap: int = CHUNK_OVERLAP,
                    encoding_name: str = ENCODING_NAME):
         """
         Chunks the loaded documents into smaller, manageable pieces.
+        For large corpora prefer iter_chunks(), which does not keep every chunk in memory.
         """
         if not documents:
-            print("No documents provided for chunking.")
+            logger.warning("No documents provided for chunking.")
             return None
-        print(f"Chunking data with chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
+        logger.info(f"Chunking data with chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
         try:
-            text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-                encoding_name=encoding_name,
+            self.document_chunks = list(self.iter_chunks(
+                documents,
                 chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap
-            )
-            self.document_chunks = text_splitter.split_documents(documents)
-            print(f"Created {len(self.document_chunks)} chunks.")
+                chunk_overlap=chunk_overlap,
+                encoding_name=encoding_name
+            ))
+            logger.info(f"Created {len(self.document_chunks)} chunks.")
+            self.instrumentation.count('chunks_created', len(self.document_chunks))
             return self.document_chunks
         except Exception as e:
-            print(f"Error chunking data: {e}")
+            logger.error(f"Error chunking data: {e}")
             return None
 
-    def create_embeddings(self, model_name: str = EMBEDDING_MODEL_NAME):
+    @traced('create_embeddings')
+    def create_embeddings(self, model_name: str = EMBEDDING_MODEL_NAME,
+                          use_cache: bool = EMBEDDING_CACHE_ENABLED,
+                          num_workers: int = EMBEDDING_WORKERS,
+                          batch_size: int = EMBEDDING_BATCH_SIZE,
+                          warm_up: bool = WARM_UP_ON_INIT):
         """
         Initializes the sentence transformer embedding model.
+        With num_workers > 1, document embedding is sharded across that many worker
+        processes, each encoding batch_size texts per forward pass.
+        With use_cache=True the model is wrapped in a persistent embedding cache,
+        so previously seen chunks and queries are never re-encoded.
+        The model weights are loaded on first use unless warm_up is True.
         """
-        print(f"Initializing embedding model: {model_name}")
+        logger.info(f"Initializing embedding model: {model_name}")
         try:
-            self.embedding_model = HuggingFaceEmbeddings(model_name=model_name)
-            print("Embedding model initialized successfully.")
+            if num_workers > 1:
+                from parallel_embeddings import ShardedEmbeddings
+                self.embedding_model = ShardedEmbeddings(model_name, num_workers, batch_size)
+                logger.info(f"Document embedding will use {num_workers} worker processes.")
+            else:
+                def load_model():
+                    from langchain_huggingface import HuggingFaceEmbeddings
+                    return HuggingFaceEmbeddings(
+                        model_name=model_name,
+                        encode_kwargs={'batch_size': batch_size}
+                    )
+                # The model weights are loaded on the first embed call, not here.
+                self.embedding_model = LazyEmbeddings(load_model)
+            self.embedding_workers = num_workers
+            self.embedding_batch_size = batch_size
+            self.query_embedding_cache.clear()
+            self.embedding_model_name = model_name
+            # Collections opened before now have no (or another model's) vector store.
+            self.index_manager.close_all()
+            if use_cache:
+                from embedding_cache import CachedEmbeddings
+                self.embedding_model = CachedEmbeddings(
+                    self.embedding_model, model_name,
+                    cache_dir=EMBEDDING_CACHE_DIR,
+                    max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+                )
+                logger.info(f"Embedding cache enabled in: {EMBEDDING_CACHE_DIR}")
+            logger.info("Embedding model initialized successfully.")
+            if warm_up:
+                self.warm_up(embeddings=True, llm=False)
         except Exception as e:
-            print(f"Error initializing embedding model: {e}")
+            logger.error(f"Error initializing embedding model: {e}")
+
+    def embedding_cache_stats(self):
+        """
+        Returns hit/miss counters of the embedding cache, or None if it is disabled.
+        """
+        from embedding_cache import CachedEmbeddings
+        if isinstance(self.embedding_model, CachedEmbeddings):
+            return self.embedding_model.cache.stats()
+        return None
+
+    def open_vectorstore(self, persist_directory: str = VECTOR_DB_DIR, backend: str = None):
+        """
+        Opens (or creates) the vector store in persist_directory using the given
+        backend ('chroma', 'numpy' or 'numpy-ivf'), defaulting to the instance's backend.
+        """
+        backend = backend or self.vector_store_backend
+        if backend == 'chroma':
+            import chromadb
+            from langchain_chroma import Chroma
+            client = chromadb.PersistentClient(path=persist_directory)
+            vectorstore = Chroma(
+                client=client,
+                collection_name=CHROMA_COLLECTION_NAME,
+                embedding_function=self.embedding_model
+            )
+            # Kept so searches can use chromadb's public collection API.
+            _chroma_collections[vectorstore] = client.get_collection(CHROMA_COLLECTION_NAME)
+            return vectorstore
+        if backend in ('numpy', 'numpy-ivf'):
+            from vector_store import NumpyVectorStore
+            return NumpyVectorStore(
+                self.embedding_model,
+                persist_directory=persist_directory,
+                dtype=NUMPY_INDEX_DTYPE,
+                index_type='ivf' if backend == 'numpy-ivf' else 'exact',
+                nlist=IVF_NLIST,
+                nprobe=IVF_NPROBE
+            )
+        raise ValueError(f"Unknown vector store backend: '{backend}'")
 
-    def setup_vector_database(self, document_chunks: list = None, persist_directory: str = VECTOR_DB_DIR):
+    @traced('setup_vector_database')
+    def setup_vector_database(self, document_chunks: list = None, persist_directory: str = None,
+                              backend: str = None, collection: str = None):
         """
-        Sets up the Chroma vector database from document chunks and embedding model.
+        Sets up the vector database from document chunks and embedding model.
+        The backend ('chroma', 'numpy' or 'numpy-ivf') defaults to VECTOR_STORE_BACKEND.
+        document_chunks may be a list or a stream such as iter_chunks(iter_documents(...)),
+        in which case chunks are embedded and written batch by batch.
+
+        A manifest of per-chunk content hashes is kept alongside the index, so on a
+        rebuild only new or changed chunks are embedded and removed chunks are deleted.
+
+        With a collection name the index is built as that named collection (by default
+        in COLLECTIONS_DIR/<name>) and registered with the index manager, leaving the
+        instance's default index untouched. Otherwise persist_directory defaults to
+        VECTOR_DB_DIR and the index becomes the default one.
         """
         if not self.embedding_model:
-            print("Embedding model not initialized. Please call create_embeddings() first.")
+            logger.warning("Embedding model not initialized. Please call create_embeddings() first.")
             return
         if not document_chunks and not self.document_chunks:
-            print("No document chunks provided or available to set up vector database.")
+            logger.warning("No document chunks provided or available to set up vector database.")
             return
         chunks_to_use = document_chunks if document_chunks is not None else self.document_chunks
-        print(f"Setting up vector database in: {persist_directory}")
+        if persist_directory is None:
+            persist_directory = os.path.join(COLLECTIONS_DIR, collection) if collection else VECTOR_DB_DIR
+        logger.info(f"Setting up vector database in: {persist_directory}")
         try:
-            if not os.path.exists(persist_directory) or not os.listdir(persist_directory):
-                os.makedirs(persist_directory, exist_ok=True)
-                self.vectorstore = Chroma.from_documents(
-                    chunks_to_use,
-                    self.embedding_model,
-                    persist_directory=persist_directory
-                )
-                print("Vector database created and persisted.")
+            from langchain_core.documents import Document
+            backend = backend or self.vector_store_backend
+            os.makedirs(persist_directory, exist_ok=True)
+            vectorstore = self.open_vectorstore(persist_directory, backend)
+
+            manifest = load_index_manifest(persist_directory)
+            if (manifest and manifest.get('embedding_model') == self.embedding_model_name
+                    and manifest.get('backend', 'chroma') == backend):
+                indexed_chunks = manifest.get('chunks', {})
             else:
-                self.vectorstore = Chroma(
-                    persist_directory=persist_directory,
-                    embedding_function=self.embedding_model
-                )
-                print("Vector database loaded from existing directory.")
+                # No usable manifest (legacy index, different embedding model or backend):
+                # the stored vectors cannot be trusted, so start from an empty collection.
+                existing_ids = vectorstore.get(include=[])['ids']
+                if existing_ids:
+                    logger.warning("No matching index manifest found. Rebuilding the vector database.")
+                    vectorstore.delete(ids=existing_ids)
+                indexed_chunks = {}
+
+            # Large bulk inserts keep every embedding worker busy.
+            index_batch_size = max(INDEX_BATCH_SIZE, self.embedding_workers * self.embedding_batch_size)
+            current_chunks = {}
+            pending_ids, pending_chunks = [], []
+            added, updated = 0, 0
+            start = time.perf_counter()
+            sparse_index = SparseIndex(persist_directory, BM25_K1, BM25_B)
+            for chunk_id, chunk_hash, chunk in iter_chunk_keys(chunks_to_use):
+                current_chunks[chunk_id] = chunk_hash
+                # The id travels in the metadata too, so hybrid search can match the same
+                # chunk across backends whether or not they fill in Document.id.
+                chunk = Document(id=chunk_id, page_content=chunk.page_content,
+                                 metadata=dict(chunk.metadata, chunk_id=chunk_id))
+                # The keyword index tracks its own content hashes, so an index built
+                # before it existed is filled in without re-embedding anything.
+                if sparse_index.content_hash(chunk_id) != chunk_hash:
+                    sparse_index.add(chunk_id, chunk.page_content, chunk.metadata, chunk_hash)
+                if indexed_chunks.get(chunk_id) == chunk_hash:
+                    continue
+                if chunk_id in indexed_chunks:
+                    updated += 1
+                else:
+                    added += 1
+                pending_ids.append(chunk_id)
+                pending_chunks.append(chunk)
+                if len(pending_ids) >= index_batch_size:
+                    vectorstore.add_documents(pending_chunks, ids=pending_ids)
+                    pending_ids, pending_chunks = [], []
+            if pending_ids:
+                vectorstore.add_documents(pending_chunks, ids=pending_ids)
+
+            removed_ids = [chunk_id for chunk_id in indexed_chunks if chunk_id not in current_chunks]
+            if removed_ids:
+                vectorstore.delete(ids=removed_ids)
+            sparse_index.delete([chunk_id for chunk_id in list(sparse_index.documents)
+                                 if chunk_id not in current_chunks])
+
+            if backend != 'chroma':
+                vectorstore.persist()
+            sparse_index.persist()
+            save_index_manifest(persist_directory, {
+                'embedding_model': self.embedding_model_name,
+                'backend': backend,
+                'chunks': current_chunks
+            })
+            elapsed = time.perf_counter() - start
+            unchanged = len(current_chunks) - added - updated
+            logger.info(f"Vector database synced: {added} added, {updated} updated, "
+                        f"{len(removed_ids)} removed, {unchanged} unchanged.")
+            self.instrumentation.count('chunks_embedded', added + updated)
+            self.instrumentation.count('chunks_removed', len(removed_ids))
+            if added + updated:
+                logger.info(f"Indexed {added + updated} chunks in {elapsed:.1f}s "
+                            f"({(added + updated) / max(elapsed, 1e-9):.1f} chunks/sec).")
+            cache_stats = self.embedding_cache_stats()
+            if cache_stats:
+                logger.info(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses.")
+
+            if collection:
+                self.index_manager.put(collection, persist_directory, vectorstore, sparse_index)
+                logger.info(f"Collection '{collection}' ready.")
+                return
+            self.vectorstore = vectorstore
+            self.sparse_index = sparse_index
+            self.retriever = vectorstore.as_retriever(
+                search_type='similarity',
+                search_kwargs={'k': DEFAULT_K_RETRIEVER}
+            )
+            self.index_version += 1
+            self.retrieval_cache.clear()
+            logger.info("Retriever initialized.")
+        except Exception as e:
+            logger.error(f"Error setting up vector database: {e}")
+
+    @traced('load_vector_database')
+    def load_vector_database(self, persist_directory: str = VECTOR_DB_DIR):
+        """
+        Opens an existing vector database without re-indexing, using the backend
+        recorded in its manifest.
+        """
+        if not self.embedding_model:
+            logger.warning("Embedding model not initialized. Please call create_embeddings() first.")
+            return
+        manifest = load_index_manifest(persist_directory)
+        if not manifest:
+            logger.warning(f"No index manifest found in: {persist_directory}. Please run setup_vector_database() first.")
+            return
+        try:
+            self.vectorstore = self.open_vectorstore(persist_directory, manifest.get('backend', 'chroma'))
+            self.sparse_index = SparseIndex(persist_directory, BM25_K1, BM25_B)
             self.retriever = self.vectorstore.as_retriever(
                 search_type='similarity',
                 search_kwargs={'k': DEFAULT_K_RETRIEVER}
             )
-            print("Retriever initialized.")
+            self.index_version += 1
+            self.retrieval_cache.clear()
+            logger.info(f"Vector database loaded from: {persist_directory}")
         except Exception as e:
-            print(f"Error setting up vector database: {e}")
+            logger.error(f"Error loading vector database: {e}")
+
+    def register_collection(self, name: str, persist_directory: str):
+        """
+        Makes an existing vector database available as a named collection. It is
+        opened on its first query.
+        """
+        self.index_manager.register(name, persist_directory)
+
+    def collection_stats(self) -> dict:
+        """
+        Returns the registered and open collections, their memory use and the
+        index manager's hit, load and eviction counters.
+        """
+        return self.index_manager.stats()
+
+    def _open_collection(self, persist_directory: str):
+        """
+        Opens the indexes of a collection for the index manager. The vector store is
+        only opened once an embedding model exists; keyword search works without it.
+        """
+        manifest = load_index_manifest(persist_directory)
+        if not manifest:
+            raise FileNotFoundError(f"No index manifest found in: {persist_directory}")
+        vectorstore = None
+        if self.embedding_model:
+            if manifest.get('embedding_model') != self.embedding_model_name:
+                raise ValueError(f"Collection in {persist_directory} was built with "
+                                 f"'{manifest.get('embedding_model')}', not '{self.embedding_model_name}'.")
+            vectorstore = self.open_vectorstore(persist_directory, manifest.get('backend', 'chroma'))
+        sparse_index = SparseIndex(persist_directory, BM25_K1, BM25_B)
+        logger.info(f"Collection opened from: {persist_directory}")
+        return vectorstore, sparse_index
 
-    def get_context(self, user_input: str, k: int = DEFAULT_K_RETRIEVER):
+    def load_keyword_index(self, persist_directory: str = VECTOR_DB_DIR):
         """
-        Retrieves relevant document chunks based on a user query.
+        Opens only the BM25 keyword index of an existing database. This is all that
+        keyword retrieval needs: no embedding model or vector store is loaded.
         """
-        if not self.retriever:
-            print("Retriever not initialized. Please set up the vector database first.")
+        self.sparse_index = SparseIndex(persist_directory, BM25_K1, BM25_B)
+        self.index_version += 1
+        self.retrieval_cache.clear()
+        if not len(self.sparse_index):
+            logger.warning(f"Keyword index in {persist_directory} is empty. Please run setup_vector_database() first.")
+        else:
+            logger.info(f"Keyword index loaded from: {persist_directory} ({len(self.sparse_index)} chunks)")
+
+    def embed_query(self, user_input: str):
+        """
+        Embeds a query, reusing the in-memory query embedding cache when possible.
+        """
+        key = (normalize_query(user_input), self.embedding_model_name)
+        vector = self.query_embedding_cache.get(key)
+        if vector is None:
+            vector = self.embedding_model.embed_query(user_input)
+            self.query_embedding_cache.put(key, vector)
+        return vector
+
+    def embed_queries(self, queries: list):
+        """
+        Embeds many queries in a single model forward pass, skipping those already
+        in the query embedding cache.
+        """
+        keys = [(normalize_query(q), self.embedding_model_name) for q in queries]
+        vectors = [self.query_embedding_cache.get(key) for key in keys]
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            embed_many = getattr(self.embedding_model, 'embed_queries', self.embedding_model.embed_documents)
+            new_vectors = embed_many([queries[positions[0]] for positions in missing.values()])
+            for (key, positions), vector in zip(missing.items(), new_vectors):
+                self.query_embedding_cache.put(key, vector)
+                for i in positions:
+                    vectors[i] = vector
+        return vectors
+
+    def search_by_vectors(self, query_vectors: list, k: int = DEFAULT_K_RETRIEVER, vectorstore=None):
+        """
+        Batch version of search_by_vector(): one similarity search for all query vectors.
+        """
+        from langchain_core.documents import Document
+        from vector_store import NumpyVectorStore
+        vectorstore = self._require_vectorstore(vectorstore)
+        if isinstance(vectorstore, NumpyVectorStore):
+            return vectorstore.search_by_vectors(query_vectors, k=k)
+        collection = _chroma_collections[vectorstore]
+        space = (collection.metadata or {}).get('hnsw:space', 'l2')
+        response = collection.query(
+            query_embeddings=query_vectors, n_results=k,
+            include=['documents', 'metadatas', 'distances']
+        )
+        return [
+            [
+                (Document(id=doc_id, page_content=text, metadata=metadata or {}),
+                 chroma_relevance(distance, space))
+                for doc_id, text, metadata, distance in zip(ids, texts, metadatas, distances)
+            ]
+            for ids, texts, metadatas, distances in zip(
+                response['ids'], response['documents'], response['metadatas'], response['distances']
+            )
+        ]
+
+    def search_by_vector(self, query_vector, k: int = DEFAULT_K_RETRIEVER, vectorstore=None):
+        """
+        Returns the k nearest chunks to a query vector as (Document, relevance score)
+        pairs, where a higher score means more relevant.
+        """
+        return self.search_by_vectors([query_vector], k=k, vectorstore=vectorstore)[0]
+
+    def _require_vectorstore(self, vectorstore=None):
+        vectorstore = vectorstore if vectorstore is not None else self.vectorstore
+        if vectorstore is None:
+            raise RuntimeError("Vector store not initialized. Please set up the vector database "
+                               "(and create the embedding model) first.")
+        return vectorstore
+
+    def keyword_search(self, user_input: str, k: int = DEFAULT_K_RETRIEVER, sparse_index=None):
+        """
+        Returns the k best BM25 matches for a query as (Document, score) pairs.
+        """
+        sparse_index = sparse_index if sparse_index is not None else self.sparse_index
+        if sparse_index is None:
+            raise RuntimeError("Keyword index not initialized. Please set up or load the vector database first.")
+        return sparse_index.search(user_input, k)
+
+    def fuse_results(self, user_input: str, dense_results: list, k: int = DEFAULT_K_RETRIEVER,
+                     sparse_index=None):
+        """
+        Merges dense results for a query with its keyword results using reciprocal
+        rank fusion, returning the top k as (Document, fused score) pairs.
+        """
+        keyword_results = self.keyword_search(user_input, k=max(k, HYBRID_FETCH_K), sparse_index=sparse_index)
+        return reciprocal_rank_fusion([dense_results, keyword_results], k, RRF_K)
+
+    def _resolve_retrieval_mode(self, mode: str = None):
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}'. Expected one of: {', '.join(RETRIEVAL_MODES)}")
+        return mode
+
+    def _get_index(self, collection: str = None):
+        """
+        Returns (vectorstore, sparse_index, cache namespace) for a named collection,
+        opening it if needed, or for the instance's default index when collection is None.
+        """
+        if collection is None:
+            return self.vectorstore, self.sparse_index, self.index_version
+        index = self.index_manager.get(collection)
+        return index.vectorstore, index.sparse_index, (collection, index.version)
+
+    @traced('retrieve')
+    def retrieve(self, user_input: str, k: int = DEFAULT_K_RETRIEVER, mode: str = None,
+                 collection: str = None):
+        """
+        Retrieves the k most relevant chunks for a query as (Document, score) pairs.
+        mode is 'dense', 'keyword' or 'hybrid' and defaults to self.retrieval_mode.
+        collection selects a named collection instead of the default index.
+        Results are cached by (normalized query, k, mode, index version).
+        """
+        mode = self._resolve_retrieval_mode(mode)
+        vectorstore, sparse_index, index_version = self._get_index(collection)
+        cache_key = (normalize_query(user_input, casefold=mode == 'keyword'), k, mode, index_version)
+        results = self.retrieval_cache.get(cache_key)
+        self.instrumentation.count('retrievals', mode=mode)
+        if results is not None:
+            self.instrumentation.count('retrieval_cache_hits', mode=mode)
+        else:
+            if mode == 'keyword':
+                results = self.keyword_search(user_input, k=k, sparse_index=sparse_index)
+            elif mode == 'hybrid':
+                dense_results = self.search_by_vector(self.embed_query(user_input), k=max(k, HYBRID_FETCH_K),
+                                                      vectorstore=vectorstore)
+                results = self.fuse_results(user_input, dense_results, k=k, sparse_index=sparse_index)
+            else:
+                results = self.search_by_vector(self.embed_query(user_input), k=k, vectorstore=vectorstore)
+            self.retrieval_cache.put(cache_key, results)
+        return results
+
+    @traced('retrieve_many')
+    def retrieve_many(self, queries: list, k: int = DEFAULT_K_RETRIEVER, mode: str = None,
+                      collection: str = None):
+        """
+        Batch version of retrieve(): cache misses are embedded together and searched
+        with a single batched similarity search (no embedding at all in keyword mode).
+        """
+        mode = self._resolve_retrieval_mode(mode)
+        vectorstore, sparse_index, index_version = self._get_index(collection)
+        cache_keys = [(normalize_query(q, casefold=mode == 'keyword'), k, mode, index_version) for q in queries]
+        results = [self.retrieval_cache.get(key) for key in cache_keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        self.instrumentation.count('retrievals', len(queries), mode=mode)
+        self.instrumentation.count('retrieval_cache_hits', len(queries) - len(missing), mode=mode)
+        if missing:
+            missing_queries = [queries[i] for i in missing]
+            if mode == 'keyword':
+                batch = [self.keyword_search(q, k=k, sparse_index=sparse_index) for q in missing_queries]
+            else:
+                fetch_k = max(k, HYBRID_FETCH_K) if mode == 'hybrid' else k
+                batch = self.search_by_vectors(self.embed_queries(missing_queries), k=fetch_k,
+                                               vectorstore=vectorstore)
+                if mode == 'hybrid':
+                    batch = [self.fuse_results(q, hits, k=k, sparse_index=sparse_index)
+                             for q, hits in zip(missing_queries, batch)]
+            for i, hits in zip(missing, batch):
+                results[i] = hits
+                self.retrieval_cache.put(cache_keys[i], hits)
+        return results
+
+    def prompt_token_budget(self, model: str = None) -> int:
+        """
+        Returns the maximum Q&A prompt size in tokens for a model (default: self.model_name).
+        """
+        model = model or self.model_name
+        for prefix, budget in PROMPT_TOKEN_BUDGETS.items():
+            if model.startswith(prefix):
+                return budget
+        return DEFAULT_PROMPT_TOKEN_BUDGET
+
+    def context_token_budget(self, question: str, model: str = None) -> int:
+        """
+        Returns how many tokens are left for retrieved context in a Q&A prompt for
+        this question, once the system message, template and question are counted.
+        """
+        user_message = QNA_USER_MESSAGE_TEMPLATE.replace('{context}', '').replace('{question}', question)
+        overhead = count_tokens(QNA_SYSTEM_MESSAGE + user_message, ENCODING_NAME)
+        return max(0, self.prompt_token_budget(model) - overhead)
+
+    def pack_context(self, question: str, results: list, mode: str = None, max_tokens: int = None) -> str:
+        """
+        Packs retrieved (Document, score) pairs into a context string that fits the
+        prompt budget, in relevance order, without duplicated or overlapping text.
+        The similarity threshold (CONTEXT_MIN_SCORE) only applies to dense scores.
+        """
+        mode = mode or self.retrieval_mode
+        if max_tokens is None:
+            max_tokens = self.context_token_budget(question)
+        context, stats = pack_context(
+            results, max_tokens, ENCODING_NAME,
+            min_score=CONTEXT_MIN_SCORE if mode == 'dense' else None
+        )
+        self.last_context_stats = stats
+        logger.info(f"Packed {stats['chunks_used']}/{len(results)} chunks into {stats['context_tokens']} "
+                    f"context tokens (budget {max_tokens}).")
+        return context
+
+    @traced('get_context')
+    def get_context(self, user_input: str, k: int = DEFAULT_K_RETRIEVER, mode: str = None,
+                    max_tokens: int = None, collection: str = None):
+        """
+        Retrieves relevant document chunks based on a user query and packs them into
+        at most max_tokens tokens (default: what the model's prompt budget leaves free).
+        mode is 'dense', 'keyword' or 'hybrid' and defaults to self.retrieval_mode.
+        collection selects a named collection instead of the default index.
+        """
+        mode = mode or self.retrieval_mode
+        try:
+            vectorstore, sparse_index, _ = self._get_index(collection)
+        except Exception as e:
+            logger.error(f"Error opening collection '{collection}': {e}")
             return ""
-        print(f"Retrieving {k} relevant documents for the query.")
+        if mode == 'keyword' and sparse_index is None:
+            logger.warning("Keyword index not initialized. Please set up or load the vector database first.")
+            return ""
+        if mode != 'keyword' and vectorstore is None:
+            logger.warning("Retriever not initialized. Please set up the vector database first.")
+            return ""
+        logger.info(f"Retrieving {k} relevant documents for the query ({mode} search"
+                    f"{f' in {collection}' if collection else ''}).")
         try:
-            relevant_document_chunks = self.retriever.invoke(user_input)
-            context_list = [d.page_content for d in relevant_document_chunks]
-            return ". ".join(context_list)
+            results = self.retrieve(user_input, k=k, mode=mode, collection=collection)
+            return self.pack_context(user_input, results, mode=mode, max_tokens=max_tokens)
         except Exception as e:
-            print(f"Error getting context: {e}")
+            logger.error(f"Error getting context: {e}")
             return ""
 
-    def create_rag_prompt(self, question: str, k: int = DEFAULT_K_RETRIEVER):
+    def create_rag_prompt(self, question: str, k: int = DEFAULT_K_RETRIEVER, context: str = None,
+                          collection: str = None):
         """
         Creates a RAG-enhanced prompt for the LLM.
+        If context is given it is used as-is instead of retrieving it again.
         """
-        context_for_query = self.get_context(question, k=k)
+        context_for_query = context if context is not None else \
+            self.get_context(question, k=k, collection=collection)
         if not context_for_query:
-            print("Could not retrieve context for the prompt.")
+            logger.warning("Could not retrieve context for the prompt.")
             return [{"role": "user", "content": question}]
         user_message = QNA_USER_MESSAGE_TEMPLATE.replace('{context}', context_for_query)
         user_message = user_message.replace('{question}', question)
@@ -185,86 +1126,473 @@ class RAG_LLM:
             {"role": "system", "content": QNA_SYSTEM_MESSAGE},
             {"role": "user", "content": user_message}
         ]
-        print("RAG prompt created.")
+        prompt_tokens = count_prompt_tokens(prompt, ENCODING_NAME)
+        self.prompt_token_counts.append(prompt_tokens)
+        logger.info(f"RAG prompt created ({prompt_tokens} tokens).")
         return prompt
-        
+
+    def _get_gemini_model(self, model_name: str, system_message: str):
+        """
+        Returns a cached genai.GenerativeModel for (model name, system prompt).
+        """
+        key = (model_name, system_message)
+        with self._gemini_models_lock:
+            gemini_model = self._gemini_models.get(key)
+            if gemini_model is None:
+                gemini_model = get_genai().GenerativeModel(
+                    model_name=model_name,
+                    system_instruction=system_message
+                )
+                self._gemini_models[key] = gemini_model
+        return gemini_model
+
+    def enable_response_cache(self, path: str = LLM_CACHE_PATH, max_mb: float = LLM_CACHE_MAX_MB):
+        """
+        Turns on the persistent LLM response cache for every call of this instance.
+        Individual calls can still bypass it with use_cache=False.
+        """
+        with self._response_cache_lock:
+            self.response_cache = ResponseCache(path, max_bytes=int(max_mb * 1024 * 1024))
+        self.use_response_cache = True
+        logger.info(f"LLM response cache enabled: {path}")
+
+    def disable_response_cache(self):
+        """
+        Turns off the LLM response cache for this instance (cached entries are kept).
+        """
+        self.use_response_cache = False
+        logger.info("LLM response cache disabled.")
+
+    def response_cache_stats(self):
+        """
+        Returns hit/miss counters and size of the LLM response cache, or None if unused.
+        """
+        return self.response_cache.stats() if self.response_cache is not None else None
+
+    def _get_response_cache(self, use_cache: bool = None):
+        """
+        Returns the response cache if it applies to this call, opening it on first use.
+        """
+        if not (self.use_response_cache if use_cache is None else use_cache):
+            return None
+        with self._response_cache_lock:
+            if self.response_cache is None:
+                self.response_cache = ResponseCache(
+                    LLM_CACHE_PATH, max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024)
+                )
+        return self.response_cache
+
+    @traced('llm', llm_span_attributes, error_counter='llm_errors')
+    def complete(self, prompt: list,
+                 model: str = None,
+                 max_tokens: int = DEFAULT_MAX_TOKENS,
+                 temperature: float = DEFAULT_TEMPERATURE,
+                 top_p: float = DEFAULT_TOP_P,
+                 top_k: int = DEFAULT_TOP_K,
+                 return_usage: bool = False,
+                 use_cache: bool = None,
+                 rate_limiters: dict = None):
+        """
+        Sends a prompt to the specified LLM and returns the response text.
+        Unlike generate_llm_response(), errors are raised rather than returned as text.
+        With return_usage=True a (text, usage) tuple is returned, where usage holds the
+        'prompt_tokens' and 'completion_tokens' reported by the backend.
+        use_cache=True/False turns the response cache on or off for this call; None
+        follows the instance setting (see enable_response_cache()).
+        rate_limiters ({'ollama': ..., 'gemini': ...}) replaces self.rate_limiters for this call.
+        """
+        model_to_use = model if model is not None else self.model_name
+        backend = 'gemini' if model_to_use.lower().startswith('gemini') else 'ollama'
+
+        cache = self._get_response_cache(use_cache)
+        if cache is not None:
+            cache_key = ResponseCache.make_key(backend, model_to_use, prompt,
+                                               max_tokens, temperature, top_p, top_k)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.info("LLM response served from cache.")
+                self.instrumentation.count('llm_cache_hits', backend=backend, model=model_to_use)
+                return cached if return_usage else cached[0]
+
+        rate_limiter = (self.rate_limiters if rate_limiters is None else rate_limiters).get(backend)
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+
+        start = time.perf_counter()
+        if backend == 'gemini':
+            # --- GEMINI API CALL ---
+            if not GEMINI_API_KEY:
+                raise RuntimeError("The Gemini API key is not configured. Please check your config.")
+            system_message = next((p['content'] for p in prompt if p['role'] == 'system'), None)
+            user_content = next((p['content'] for p in prompt if p['role'] == 'user'), "")
+            gemini_model = self._get_gemini_model(model_to_use, system_message)
+            generation_config = get_genai().types.GenerationConfig(
+                max_output_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                top_k=top_k
+            )
+            response = gemini_model.generate_content(
+                user_content,
+                generation_config=generation_config
+            )
+            logger.info("Gemini response generated.")
+            message = response.text
+            usage = {}
+            if getattr(response, 'usage_metadata', None):
+                usage = {
+                    'prompt_tokens': response.usage_metadata.prompt_token_count,
+                    'completion_tokens': response.usage_metadata.candidates_token_count,
+                }
+        else:
+            # --- OLLAMA API CALL ---
+            llm_response = self.ollama_client.chat(
+                model=model_to_use,
+                messages=prompt,
+                options={
+                    "num_predict": max_tokens,
+                    "temperature": temperature,
+                    "top_p": top_p,
+                    "top_k": top_k,
+                },
+                keep_alive=self.ollama_keep_alive
+            )
+            message = llm_response['message']['content']
+            logger.info("Ollama response generated.")
+            usage = {
+                'prompt_tokens': llm_response.get('prompt_eval_count'),
+                'completion_tokens': llm_response.get('eval_count'),
+            }
+        self._record_latency(model_to_use, time.perf_counter() - start)
+        self._count_usage(backend, model_to_use, usage)
+
+        if cache is not None:
+            cache.put(cache_key, backend, model_to_use, message, usage)
+        return (message, usage) if return_usage else message
+
+    def _iter_tokens(self, prompt: list, model: str, max_tokens: int,
+                     temperature: float, top_p: float, top_k: int):
+        """
+        Streams (text, usage) pieces from the backend for LLMStream.
+        """
+        if model.lower().startswith('gemini'):
+            # --- GEMINI API CALL ---
+            system_message = next((p['content'] for p in prompt if p['role'] == 'system'), None)
+            user_content = next((p['content'] for p in prompt if p['role'] == 'user'), "")
+            gemini_model = self._get_gemini_model(model, system_message)
+            generation_config = get_genai().types.GenerationConfig(
+                max_output_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                top_k=top_k
+            )
+            response = gemini_model.generate_content(
+                user_content,
+                generation_config=generation_config,
+                stream=True
+            )
+            for chunk in response:
+                usage = None
+                if getattr(chunk, 'usage_metadata', None):
+                    usage = {
+                        'prompt_tokens': chunk.usage_metadata.prompt_token_count,
+                        'completion_tokens': chunk.usage_metadata.candidates_token_count,
+                    }
+                # Chunks without text parts (e.g. the final one) raise on .text.
+                text = chunk.text if chunk.parts else ''
+                yield text, usage
+        else:
+            # --- OLLAMA API CALL ---
+            response = self.ollama_client.chat(
+                model=model,
+                messages=prompt,
+                options={
+                    "num_predict": max_tokens,
+                    "temperature": temperature,
+                    "top_p": top_p,
+                    "top_k": top_k,
+                },
+                keep_alive=self.ollama_keep_alive,
+                stream=True
+            )
+            for chunk in response:
+                usage = None
+                if chunk.get('done'):
+                    usage = {
+                        'prompt_tokens': chunk.get('prompt_eval_count'),
+                        'completion_tokens': chunk.get('eval_count'),
+                    }
+                yield chunk['message']['content'], usage
+
+    def _record_stream(self, stream: LLMStream):
+        backend = 'gemini' if stream.model.lower().startswith('gemini') else 'ollama'
+        if stream.error is None:
+            self._record_latency(stream.model, stream.total_time)
+            self._count_usage(backend, stream.model, stream.usage)
+        else:
+            self.instrumentation.count('llm_errors', backend=backend, model=stream.model)
+        if stream.time_to_first_token is not None:
+            self.time_to_first_token.append(stream.time_to_first_token)
+            logger.info(f"Streamed response from {stream.model}: first token after "
+                        f"{stream.time_to_first_token:.3f}s, completed in {stream.total_time:.3f}s.")
+
+    def stream_llm_response(self, prompt: list,
+                            model: str = None,
+                            max_tokens: int = DEFAULT_MAX_TOKENS,
+                            temperature: float = DEFAULT_TEMPERATURE,
+                            top_p: float = DEFAULT_TOP_P,
+                            top_k: int = DEFAULT_TOP_K):
+        """
+        Streams a response from the specified LLM. Returns an LLMStream: iterate over it
+        to receive text as it arrives; afterwards .text, .usage and
+        .time_to_first_token hold the full answer and its statistics.
+        """
+        model_to_use = model if model is not None else self.model_name
+        logger.info(f"Streaming LLM response using model: {model_to_use}")
+        is_gemini = model_to_use.lower().startswith('gemini')
+        if is_gemini and not GEMINI_API_KEY:
+            tokens = iter([("Sorry, the Gemini API key is not configured. Please check your config.", None)])
+        else:
+            tokens = self._iter_tokens(prompt, model_to_use, max_tokens, temperature, top_p, top_k)
+        return LLMStream(
+            tokens, model_to_use,
+            error_message='Sorry, I encountered an error with ' + ('the Gemini API' if is_gemini else 'Ollama'),
+            on_complete=self._record_stream
+        )
+
     def generate_llm_response(self, prompt: list,
                               model: str = None,
                               max_tokens: int = DEFAULT_MAX_TOKENS,
                               temperature: float = DEFAULT_TEMPERATURE,
                               top_p: float = DEFAULT_TOP_P,
-                              top_k: int = DEFAULT_TOP_K):
+                              top_k: int = DEFAULT_TOP_K,
+                              stream: bool = False,
+                              use_cache: bool = None,
+                              rate_limiters: dict = None):
         """
         Generates a response from the specified LLM.
         If no model is provided, it uses the instance's default model name.
+        With stream=True an LLMStream is returned instead (see stream_llm_response()).
+        use_cache=True/False overrides the instance's response cache setting for this call,
+        and rate_limiters the instance's rate limiters (see complete()).
         """
+        if stream:
+            return self.stream_llm_response(prompt, model=model, max_tokens=max_tokens,
+                                            temperature=temperature, top_p=top_p, top_k=top_k)
         model_to_use = model if model is not None else self.model_name
-        
-        print(f"Generating LLM response using model: {model_to_use}")
 
-        if model_to_use.lower().startswith('gemini'):
+        logger.info(f"Generating LLM response using model: {model_to_use}")
+
+        is_gemini = model_to_use.lower().startswith('gemini')
+        if is_gemini and not GEMINI_API_KEY:
+            return "Sorry, the Gemini API key is not configured. Please check your config."
+        try:
+            return self.complete(prompt, model=model_to_use, max_tokens=max_tokens,
+                                 temperature=temperature, top_p=top_p, top_k=top_k,
+                                 use_cache=use_cache, rate_limiters=rate_limiters)
+        except Exception as e:
+            if is_gemini:
+                return f'Sorry, I encountered an error with the Gemini API: \n {e}'
+            return f'Sorry, I encountered an error with Ollama: \n {e}'
+
+    def _get_async_state(self):
+        """
+        Returns the async Ollama client and per-backend semaphores for the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        state = self._async_state.get(loop)
+        if state is None:
+            state = {
+                'ollama_client': self._new_async_ollama_client(),
+                'ollama': asyncio.Semaphore(OLLAMA_MAX_CONCURRENCY),
+                'gemini': asyncio.Semaphore(GEMINI_MAX_CONCURRENCY),
+            }
+            self._async_state[loop] = state
+        return state
+
+    @traced('llm', llm_span_attributes, error_counter='llm_errors')
+    async def acomplete(self, prompt: list,
+                        model: str = None,
+                        max_tokens: int = DEFAULT_MAX_TOKENS,
+                        temperature: float = DEFAULT_TEMPERATURE,
+                        top_p: float = DEFAULT_TOP_P,
+                        top_k: int = DEFAULT_TOP_K,
+                        timeout: float = LLM_TIMEOUT,
+                        use_cache: bool = None):
+        """
+        Async counterpart of complete(). Each backend has its own concurrency limit and
+        every call is bounded by timeout seconds. Errors are raised.
+        """
+        model_to_use = model if model is not None else self.model_name
+        backend = 'gemini' if model_to_use.lower().startswith('gemini') else 'ollama'
+        state = self._get_async_state()
+
+        cache = self._get_response_cache(use_cache)
+        if cache is not None:
+            cache_key = ResponseCache.make_key(backend, model_to_use, prompt,
+                                               max_tokens, temperature, top_p, top_k)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logger.info("LLM response served from cache.")
+                self.instrumentation.count('llm_cache_hits', backend=backend, model=model_to_use)
+                return cached[0]
+
+        start = time.perf_counter()
+        if backend == 'gemini':
             # --- GEMINI API CALL ---
             if not GEMINI_API_KEY:
-                return "Sorry, the Gemini API key is not configured. Please check your config."
-            try:
-                system_message = next((p['content'] for p in prompt if p['role'] == 'system'), None)
-                user_content = next((p['content'] for p in prompt if p['role'] == 'user'), "")
-                gemini_model = genai.GenerativeModel(
-                    model_name=model_to_use,
-                    system_instruction=system_message
-                )
-                generation_config = genai.types.GenerationConfig(
-                    max_output_tokens=max_tokens,
-                    temperature=temperature,
-                    top_p=top_p,
-                    top_k=top_k
-                )
-                response = gemini_model.generate_content(
-                    user_content,
-                    generation_config=generation_config
+                raise RuntimeError("The Gemini API key is not configured. Please check your config.")
+            system_message = next((p['content'] for p in prompt if p['role'] == 'system'), None)
+            user_content = next((p['content'] for p in prompt if p['role'] == 'user'), "")
+            gemini_model = self._get_gemini_model(model_to_use, system_message)
+            generation_config = get_genai().types.GenerationConfig(
+                max_output_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                top_k=top_k
+            )
+            async with state['gemini']:
+                response = await asyncio.wait_for(
+                    gemini_model.generate_content_async(user_content, generation_config=generation_config),
+                    timeout
                 )
-                print("Gemini response generated.")
-                return response.text
-            except Exception as e:
-                return f'Sorry, I encountered an error with the Gemini API: \n {e}'
+            logger.info("Gemini response generated.")
+            message = response.text
+            usage = {}
+            if getattr(response, 'usage_metadata', None):
+                usage = {
+                    'prompt_tokens': response.usage_metadata.prompt_token_count,
+                    'completion_tokens': response.usage_metadata.candidates_token_count,
+                }
         else:
             # --- OLLAMA API CALL ---
-            try:
-                llm_response = self.ollama_client.chat(
-                    model=model_to_use,
-                    messages=prompt,
-                    options={
-                        "num_predict": max_tokens,
-                        "temperature": temperature,
-                        "top_p": top_p,
-                        "top_k": top_k,
-                    }
+            async with state['ollama']:
+                llm_response = await asyncio.wait_for(
+                    state['ollama_client'].chat(
+                        model=model_to_use,
+                        messages=prompt,
+                        options={
+                            "num_predict": max_tokens,
+                            "temperature": temperature,
+                            "top_p": top_p,
+                            "top_k": top_k,
+                        },
+                        keep_alive=self.ollama_keep_alive
+                    ),
+                    timeout
                 )
-                message = llm_response['message']['content']
-                print("Ollama response generated.")
-                return message
-            except Exception as e:
-                return f'Sorry, I encountered an error with Ollama: \n {e}'
+            message = llm_response['message']['content']
+            logger.info("Ollama response generated.")
+            usage = {
+                'prompt_tokens': llm_response.get('prompt_eval_count'),
+                'completion_tokens': llm_response.get('eval_count'),
+            }
+        self._record_latency(model_to_use, time.perf_counter() - start)
+        self._count_usage(backend, model_to_use, usage)
+
+        if cache is not None:
+            cache.put(cache_key, backend, model_to_use, message, usage)
+        return message
+
+    async def agenerate_llm_response(self, prompt: list, model: str = None, **llm_kwargs):
+        """
+        Async counterpart of generate_llm_response(). Errors and timeouts are returned
+        as text, like the synchronous version.
+        """
+        model_to_use = model if model is not None else self.model_name
+
+        logger.info(f"Generating LLM response using model: {model_to_use}")
+
+        is_gemini = model_to_use.lower().startswith('gemini')
+        if is_gemini and not GEMINI_API_KEY:
+            return "Sorry, the Gemini API key is not configured. Please check your config."
+        backend = 'the Gemini API' if is_gemini else 'Ollama'
+        try:
+            return await self.acomplete(prompt, model=model_to_use, **llm_kwargs)
+        except asyncio.TimeoutError:
+            return f'Sorry, the request to {backend} timed out.'
+        except Exception as e:
+            return f'Sorry, I encountered an error with {backend}: \n {e}'
 
-    def get_answer(self, user_input: str, k: int = DEFAULT_K_RETRIEVER, **llm_kwargs):
+    @traced('get_answer')
+    def get_answer(self, user_input: str, k: int = DEFAULT_K_RETRIEVER, context: str = None,
+                   collection: str = None, **llm_kwargs):
         """
         Combines context retrieval and LLM response generation to answer a user question.
+        If context is given it is used instead of retrieving it again; collection
+        selects a named collection to retrieve from instead of the default index.
+        Pass stream=True to get an LLMStream that yields the answer as it is generated.
         """
-        rag_prompt = self.create_rag_prompt(user_input, k=k)
+        rag_prompt = self.create_rag_prompt(user_input, k=k, context=context, collection=collection)
         if not rag_prompt:
-            print("Failed to create RAG prompt. Attempting to answer without context.")
+            logger.info("Failed to create RAG prompt. Attempting to answer without context.")
             return self.generate_llm_response(
                 [{"role": "user", "content": user_input}], **llm_kwargs
             )
         return self.generate_llm_response(rag_prompt, **llm_kwargs)
 
-    def create_groundedness_prompt(self, question: str, answer: str, k: int = DEFAULT_K_RETRIEVER):
+    async def aget_answer(self, user_input: str, k: int = DEFAULT_K_RETRIEVER, collection: str = None,
+                          **llm_kwargs):
+        """
+        Async counterpart of get_answer(). Retrieval runs in a worker thread so the
+        event loop stays free while the query is embedded.
+        """
+        rag_prompt = await asyncio.to_thread(self.create_rag_prompt, user_input, k, collection=collection)
+        return await self.agenerate_llm_response(rag_prompt, **llm_kwargs)
+
+    @traced('get_answers')
+    def get_answers(self, questions: list, k: int = DEFAULT_K_RETRIEVER,
+                    max_workers: int = LLM_MAX_CONCURRENCY, collection: str = None, **llm_kwargs):
+        """
+        Answers a batch of questions. All queries are embedded in one forward pass and
+        searched with one batched similarity search; the LLM calls then run
+        concurrently, at most max_workers at a time.
+
+        Returns:
+            list: One dict per question, in input order, with keys 'question',
+                  'answer' and 'error' (None on success). A failing question does not
+                  fail the batch.
+        """
+        if 'stream' in llm_kwargs:
+            # Checked up front: complete() has no stream option, and the TypeError it raises
+            # would otherwise be reported as a per-question error.
+            raise TypeError("get_answers() does not support stream; use stream_llm_response() per question.")
+        if not questions:
+            return []
+        logger.info(f"Answering {len(questions)} questions with up to {max_workers} concurrent LLM calls.")
+        try:
+            contexts = [
+                self.pack_context(question, hits)
+                for question, hits in zip(questions, self.retrieve_many(questions, k=k, collection=collection))
+            ]
+        except Exception as e:
+            logger.error(f"Error retrieving context for the batch: {e}")
+            contexts = [""] * len(questions)
+
+        def answer_one(question, context):
+            prompt = self.create_rag_prompt(question, context=context)
+            return self.complete(prompt, **llm_kwargs)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(answer_one, q, c) for q, c in zip(questions, contexts)]
+            for question, future in zip(questions, futures):
+                try:
+                    results.append({'question': question, 'answer': future.result(), 'error': None})
+                except Exception as e:
+                    results.append({'question': question, 'answer': None, 'error': str(e)})
+        logger.info(f"Answered {sum(r['error'] is None for r in results)}/{len(results)} questions.")
+        return results
+
+    def create_groundedness_prompt(self, question: str, answer: str, k: int = DEFAULT_K_RETRIEVER,
+                                   context: str = None):
         """
         Creates a prompt for the LLM to evaluate the groundedness of an answer.
+        If context is given it is used as-is instead of retrieving it again.
         """
-        context_for_query = self.get_context(question, k=k)
+        context_for_query = context if context is not None else self.get_context(question, k=k)
         if not context_for_query:
-            print("Could not retrieve context for groundedness evaluation.")
+            logger.warning("Could not retrieve context for groundedness evaluation.")
             return None
         user_message = EVAL_USER_MESSAGE_TEMPLATE.replace('{context}', context_for_query)
         user_message = user_message.replace('{question}', question)
@@ -275,13 +1603,15 @@ class RAG_LLM:
         ]
         return prompt
 
-    def create_relevance_prompt(self, question: str, answer: str, k: int = DEFAULT_K_RETRIEVER):
+    def create_relevance_prompt(self, question: str, answer: str, k: int = DEFAULT_K_RETRIEVER,
+                                context: str = None):
         """
         Creates a prompt for the LLM to evaluate the relevance of an answer.
+        If context is given it is used as-is instead of retrieving it again.
         """
-        context_for_query = self.get_context(question, k=k)
+        context_for_query = context if context is not None else self.get_context(question, k=k)
         if not context_for_query:
-            print("Could not retrieve context for relevance evaluation.")
+            logger.warning("Could not retrieve context for relevance evaluation.")
             return None
         user_message = EVAL_USER_MESSAGE_TEMPLATE.replace('{context}', context_for_query)
         user_message = user_message.replace('{question}', question)
@@ -292,50 +1622,79 @@ class RAG_LLM:
         ]
         return prompt
 
-    def rate_groundedness(self, question: str, answer: str, k: int = DEFAULT_K_RETRIEVER, **llm_kwargs):
+    def _judge(self, name: str, prompt: list, return_usage: bool = False, **llm_kwargs):
         """
-        Rates the groundedness of an answer using the LLM as a judge.
+        Runs one LLM judge prompt. With return_usage=True a (rating, usage) tuple is
+        returned and errors are raised, as with complete().
         """
-        print("Rating groundedness...")
-        prompt = self.create_groundedness_prompt(question, answer, k=k)
         if not prompt:
-            return "Groundedness evaluation failed: context not found."
-        response = self.generate_llm_response(prompt, max_tokens=200, temperature=0.1, **llm_kwargs)
-        return response
+            rating = f"{name.capitalize()} evaluation failed: context not found."
+            return (rating, {}) if return_usage else rating
+        if return_usage:
+            return self.complete(prompt, max_tokens=200, temperature=0.1, return_usage=True, **llm_kwargs)
+        return self.generate_llm_response(prompt, max_tokens=200, temperature=0.1, **llm_kwargs)
 
-    def rate_relevance(self, question: str, answer: str, k: int = DEFAULT_K_RETRIEVER, **llm_kwargs):
+    def rate_groundedness(self, question: str, answer: str, k: int = DEFAULT_K_RETRIEVER,
+                          context: str = None, return_usage: bool = False, **llm_kwargs):
+        """
+        Rates the groundedness of an answer using the LLM as a judge.
+        """
+        logger.info("Rating groundedness...")
+        prompt = self.create_groundedness_prompt(question, answer, k=k, context=context)
+        return self._judge('groundedness', prompt, return_usage=return_usage, **llm_kwargs)
+
+    def rate_relevance(self, question: str, answer: str, k: int = DEFAULT_K_RETRIEVER,
+                       context: str = None, return_usage: bool = False, **llm_kwargs):
         """
         Rates the relevance of an answer using the LLM as a judge.
         """
-        print("Rating relevance...")
-        prompt = self.create_relevance_prompt(question, answer, k=k)
-        if not prompt:
-            return "Relevance evaluation failed: context not found."
-        response = self.generate_llm_response(prompt, max_tokens=200, temperature=0.1, **llm_kwargs)
-        return response
+        logger.info("Rating relevance...")
+        prompt = self.create_relevance_prompt(question, answer, k=k, context=context)
+        return self._judge('relevance', prompt, return_usage=return_usage, **llm_kwargs)
 
-    def rate_answer(self, question: str, answer: str, k: int = DEFAULT_K_RETRIEVER, **llm_kwargs):
+    def rate_answer(self, question: str, answer: str, k: int = DEFAULT_K_RETRIEVER,
+                    context: str = None, return_usage: bool = False, **llm_kwargs):
         """
         Rates both groundedness and relevance of an answer.
+        The context is retrieved once (unless given) and shared by both judges,
+        and the two judge calls run concurrently.
+        With return_usage=True judge errors are raised, and the result also has a
+        'usage' entry with each judge's token usage.
         """
-        print("Rating overall answer quality (groundedness and relevance)...")
-        groundedness_response = self.rate_groundedness(question, answer, k=k, **llm_kwargs)
-        relevance_response = self.rate_relevance(question, answer, k=k, **llm_kwargs)
+        logger.info("Rating overall answer quality (groundedness and relevance)...")
+        if context is None:
+            context = self.get_context(question, k=k)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            groundedness_future = executor.submit(
+                self.rate_groundedness, question, answer, k=k, context=context,
+                return_usage=return_usage, **llm_kwargs
+            )
+            relevance_future = executor.submit(
+                self.rate_relevance, question, answer, k=k, context=context,
+                return_usage=return_usage, **llm_kwargs
+            )
+            groundedness, relevance = groundedness_future.result(), relevance_future.result()
+        if not return_usage:
+            return {"groundedness": groundedness, "relevance": relevance}
         return {
-            "groundedness": groundedness_response,
-            "relevance": relevance_response
+            "groundedness": groundedness[0],
+            "relevance": relevance[0],
+            "usage": {"groundedness": groundedness[1], "relevance": relevance[1]}
         }
 
+    @traced('calculate_rating')
     def calculate_rating(self, question: str, k: int = DEFAULT_K_RETRIEVER, **llm_kwargs):
         """
         Generates an answer for a question and then rates its groundedness and relevance.
+        The context is retrieved once and reused for the answer and both judges.
         """
-        print(f"\n--- Calculating Ratings for Question: '{question}' ---")
-        answer = self.get_answer(question, k=k, **llm_kwargs)
-        rating = self.rate_answer(question, answer, k=k, **llm_kwargs)
-        print("\n--- Results ---")
-        print("Question: \n", question)
-        print("\nAnswer: \n", answer)
-        print("\nGroundedness Rating: \n", rating['groundedness'])
-        print("\nRelevance Rating: \n", rating['relevance'])
-        print("--------------------------------------------------")
\ No newline at end of file
+        logger.info(f"\n--- Calculating Ratings for Question: '{question}' ---")
+        context = self.get_context(question, k=k)
+        answer = self.get_answer(question, k=k, context=context, **llm_kwargs)
+        rating = self.rate_answer(question, answer, k=k, context=context, **llm_kwargs)
+        logger.info("\n--- Results ---")
+        logger.info(f"Question: \n {question}")
+        logger.info(f"\nAnswer: \n {answer}")
+        logger.info(f"\nGroundedness Rating: \n {rating['groundedness']}")
+        logger.info(f"\nRelevance Rating: \n {rating['relevance']}")
+        logger.info("--------------------------------------------------")
\ No newline at end of file
@@ -0,0 +1,179 @@
+# index_manager.py
+
+"""
+This file provides IndexManager, which lets one RAG_LLM serve many document collections.
+Collections are registered by name with the directory holding their vector database.
+A collection's indexes are opened on its first query and kept in a least recently used
+cache bounded by a memory budget: once the open indexes exceed the budget, the least
+recently used collections are closed (and reopened on their next query).
+
+The memory taken by an open collection is estimated from the size of its index files
+on disk, which is what the vector store and keyword index hold or map into memory.
+
+Evicting a collection releases the memory of the NumPy backends ('numpy', 'numpy-ivf')
+and of the keyword index. Chroma collections are dropped from the LRU too, but chromadb
+keeps one client per directory for the life of the process and offers no public way to
+release a single one, so their vector index stays loaded (and a reopen reuses it).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from config import INDEX_MANIFEST_FILE
+
+
+def directory_size(path: str) -> int:
+    """
+    Returns the total size in bytes of all files under path.
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class OpenIndex:
+    """
+    The open indexes of one collection. version changes every time the collection is
+    (re)opened or rebuilt, so cached retrieval results of an older copy are never reused.
+    """
+
+    def __init__(self, name: str, persist_directory: str, vectorstore, sparse_index,
+                 size_bytes: int, version: int):
+        self.name = name
+        self.persist_directory = persist_directory
+        self.vectorstore = vectorstore
+        self.sparse_index = sparse_index
+        self.size_bytes = size_bytes
+        self.version = version
+
+
+class IndexManager:
+    """
+    Registry of named collections with a memory-bounded LRU of open indexes.
+    opener(persist_directory) must return (vectorstore, sparse_index) for a collection.
+    """
+
+    def __init__(self, opener, memory_budget_bytes: int):
+        self.opener = opener
+        self.memory_budget_bytes = memory_budget_bytes
+        self.collections = {}
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self._open = OrderedDict()
+        self._versions = {}
+        self._loading = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, persist_directory: str):
+        """
+        Registers (or re-points) a collection. Nothing is opened until it is queried.
+        """
+        with self._lock:
+            if self.collections.get(name) != persist_directory:
+                self._open.pop(name, None)
+            self.collections[name] = persist_directory
+
+    def unregister(self, name: str):
+        with self._lock:
+            self.collections.pop(name, None)
+            self._open.pop(name, None)
+
+    def discover(self, root: str) -> list:
+        """
+        Registers every subdirectory of root that holds an index, named after the
+        subdirectory. Returns the names registered.
+        """
+        if not os.path.isdir(root):
+            return []
+        names = []
+        for entry in sorted(os.listdir(root)):
+            directory = os.path.join(root, entry)
+            if os.path.isfile(os.path.join(directory, INDEX_MANIFEST_FILE)):
+                self.register(entry, directory)
+                names.append(entry)
+        return names
+
+    def get(self, name: str) -> OpenIndex:
+        """
+        Returns the open indexes of a collection, opening it first if needed.
+        Opening one collection does not block queries to collections already open.
+        """
+        with self._lock:
+            index = self._lookup(name)
+            if index is not None:
+                return index
+            loading_lock = self._loading.setdefault(name, threading.Lock())
+        with loading_lock:
+            with self._lock:
+                # Another thread may have opened it while we waited.
+                index = self._lookup(name)
+                if index is not None:
+                    return index
+                persist_directory = self.collections[name]
+            vectorstore, sparse_index = self.opener(persist_directory)
+            with self._lock:
+                self.loads += 1
+                return self._add(name, persist_directory, vectorstore, sparse_index)
+
+    def _lookup(self, name: str):
+        if name not in self.collections:
+            raise KeyError(f"Unknown collection '{name}'. Registered: {', '.join(sorted(self.collections)) or 'none'}")
+        index = self._open.get(name)
+        if index is not None:
+            self._open.move_to_end(name)
+            self.hits += 1
+        return index
+
+    def put(self, name: str, persist_directory: str, vectorstore, sparse_index) -> OpenIndex:
+        """
+        Registers a collection together with indexes that are already open (e.g. just built).
+        """
+        with self._lock:
+            self.collections[name] = persist_directory
+            return self._add(name, persist_directory, vectorstore, sparse_index)
+
+    def close(self, name: str):
+        with self._lock:
+            self._open.pop(name, None)
+
+    def close_all(self):
+        """
+        Closes every open collection, e.g. after the embedding model has changed.
+        They are reopened on their next query.
+        """
+        with self._lock:
+            self._open.clear()
+
+    def _add(self, name: str, persist_directory: str, vectorstore, sparse_index) -> OpenIndex:
+        version = self._versions.get(name, 0) + 1
+        self._versions[name] = version
+        index = OpenIndex(name, persist_directory, vectorstore, sparse_index,
+                          directory_size(persist_directory), version)
+        self._open[name] = index
+        self._open.move_to_end(name)
+        # The collection just opened always stays, even if it alone exceeds the budget.
+        while len(self._open) > 1 and self.open_bytes() > self.memory_budget_bytes:
+            self._open.popitem(last=False)
+            self.evictions += 1
+        return index
+
+    def open_bytes(self) -> int:
+        return sum(index.size_bytes for index in self._open.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'registered': sorted(self.collections),
+                'open': list(self._open),
+                'open_bytes': self.open_bytes(),
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'hits': self.hits,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
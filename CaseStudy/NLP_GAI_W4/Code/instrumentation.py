@@ -0,0 +1,286 @@
+# instrumentation.py
+
+"""
+This file provides the logging and metrics surface of the RAG LLM application.
+
+- Progress messages go through the 'rag' logger. configure_logging() sends them to
+  stdout as plain text, so scripts and notebooks show the same output as before.
+- Instrumentation records timing spans per pipeline stage and counters (chunks
+  embedded, retrievals, cache hits, LLM requests and errors, prompt and completion
+  tokens), labelled with things like the model used. Each event is passed to the
+  exporters: LoggingExporter logs it, PrometheusExporter aggregates it and renders
+  the Prometheus text exposition format.
+
+When instrumentation is disabled, span() returns a shared no-op context manager and
+count() returns immediately, so the hooks cost next to nothing.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import functools
+import threading
+
+logger = logging.getLogger('rag')
+
+
+class StdoutHandler(logging.StreamHandler):
+    """
+    A stream handler that always writes to the current sys.stdout, so output that is
+    redirected (contextlib.redirect_stdout) or captured (notebooks) goes to the same
+    place as print() would.
+    """
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def configure_logging(level: str = 'INFO'):
+    """
+    Shows the 'rag' logger's messages on stdout as plain text. Does nothing if the
+    application has already attached its own handlers to the logger.
+    """
+    if not logger.handlers:
+        handler = StdoutHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level)
+
+
+def _format_labels(labels: dict) -> str:
+    return ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+def _metric_line(name: str, labels: str, value) -> str:
+    return f'{name}{{{labels}}} {value}' if labels else f'{name} {value}'
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    Times a block of code. Attributes can be added while the span is open with set();
+    the span is reported as failed if the block raises.
+    """
+
+    def __init__(self, instrumentation, name: str, attributes: dict):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.duration = None
+        self.error = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self._start
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.instrumentation._emit('on_span', self)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class LoggingExporter:
+    """
+    Logs every finished span and counter increment to the 'rag.metrics' logger.
+    """
+
+    def __init__(self, level: int = logging.DEBUG):
+        self.level = level
+        self.logger = logging.getLogger('rag.metrics')
+
+    def on_span(self, span: Span):
+        status = f" error={span.error}" if span.error else ''
+        self.logger.log(self.level, f"span {span.name} {span.duration:.4f}s "
+                                    f"{_format_labels(span.attributes)}{status}")
+
+    def on_count(self, name: str, value: float, labels: dict):
+        self.logger.log(self.level, f"count {name} +{value} {_format_labels(labels)}")
+
+
+class PrometheusExporter:
+    """
+    Aggregates spans and counters and renders them in the Prometheus text format.
+    Spans become a rag_span_duration_seconds summary (count and sum) and a
+    rag_span_errors_total counter, labelled by span name and the span's string-valued
+    attributes. Counters become rag_<name>_total.
+    """
+
+    def __init__(self, namespace: str = 'rag'):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._span_count = {}
+        self._span_sum = {}
+        self._span_errors = {}
+        self._counters = {}
+
+    def on_span(self, span: Span):
+        labels = {key: value for key, value in span.attributes.items() if isinstance(value, str)}
+        key = _format_labels(dict(labels, span=span.name))
+        with self._lock:
+            self._span_count[key] = self._span_count.get(key, 0) + 1
+            self._span_sum[key] = self._span_sum.get(key, 0.0) + span.duration
+            if span.error:
+                self._span_errors[key] = self._span_errors.get(key, 0) + 1
+
+    def on_count(self, name: str, value: float, labels: dict):
+        key = (name, _format_labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        ns = self.namespace
+        lines = []
+        with self._lock:
+            if self._span_count:
+                lines.append(f'# HELP {ns}_span_duration_seconds Time spent in each pipeline stage.')
+                lines.append(f'# TYPE {ns}_span_duration_seconds summary')
+                for key in sorted(self._span_count):
+                    lines.append(_metric_line(f'{ns}_span_duration_seconds_count', key, self._span_count[key]))
+                    lines.append(_metric_line(f'{ns}_span_duration_seconds_sum', key, f'{self._span_sum[key]:.6f}'))
+            if self._span_errors:
+                lines.append(f'# TYPE {ns}_span_errors_total counter')
+                for key in sorted(self._span_errors):
+                    lines.append(_metric_line(f'{ns}_span_errors_total', key, self._span_errors[key]))
+            names = sorted({name for name, _ in self._counters})
+            for name in names:
+                lines.append(f'# TYPE {ns}_{name}_total counter')
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(_metric_line(f'{ns}_{name}_total', labels, f'{value:g}'))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str):
+        """
+        Writes the metrics atomically to a file, e.g. for node_exporter's textfile collector.
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+class Instrumentation:
+    """
+    Entry point for spans and counters. Events are passed to every exporter, each of
+    which implements on_span(span) and on_count(name, value, labels).
+    """
+
+    def __init__(self, enabled: bool = False, exporters: list = None):
+        self.enabled = enabled
+        self.exporters = list(exporters or [])
+
+    def span(self, name: str, **attributes):
+        """
+        Returns a context manager timing the enclosed block as a span.
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def count(self, name: str, value: float = 1, **labels):
+        """
+        Adds value to a counter, labelled with the given keyword arguments.
+        """
+        if not self.enabled or not value:
+            return
+        self._emit('on_count', name, value, labels)
+
+    def _emit(self, method: str, *args):
+        for exporter in self.exporters:
+            try:
+                getattr(exporter, method)(*args)
+            except Exception as e:
+                logger.warning(f"Instrumentation exporter {type(exporter).__name__} failed: {e}")
+
+    def get_exporter(self, exporter_type: type):
+        """
+        Returns the first exporter of the given type, or None.
+        """
+        return next((exporter for exporter in self.exporters if isinstance(exporter, exporter_type)), None)
+
+
+def traced(name: str, attributes=None, error_counter: str = None):
+    """
+    Decorates a method so each call is timed as a span on self.instrumentation.
+    attributes is an optional callable receiving the method's arguments (self included)
+    and returning span attributes. With error_counter, a failing call also increments
+    that counter. Sync and async methods are supported.
+    """
+    def decorator(method):
+        def start_span(self, args, kwargs):
+            span_attributes = attributes(self, *args, **kwargs) if attributes else {}
+            return self.instrumentation.span(name, **span_attributes)
+
+        def count_error(self, span):
+            if error_counter:
+                self.instrumentation.count(error_counter, **{
+                    key: value for key, value in span.attributes.items() if isinstance(value, str)
+                })
+
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, *args, **kwargs):
+                if not self.instrumentation.enabled:
+                    return await method(self, *args, **kwargs)
+                with start_span(self, args, kwargs) as span:
+                    try:
+                        return await method(self, *args, **kwargs)
+                    except Exception:
+                        count_error(self, span)
+                        raise
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.instrumentation.enabled:
+                return method(self, *args, **kwargs)
+            with start_span(self, args, kwargs) as span:
+                try:
+                    return method(self, *args, **kwargs)
+                except Exception:
+                    count_error(self, span)
+                    raise
+        return wrapper
+    return decorator
+
+
+def create_exporters(names) -> list:
+    """
+    Builds exporters from names: 'logging' and/or 'prometheus'.
+    """
+    factories = {'logging': LoggingExporter, 'prometheus': PrometheusExporter}
+    unknown = [name for name in names if name not in factories]
+    if unknown:
+        raise ValueError(f"Unknown instrumentation exporter(s): {', '.join(unknown)}")
+    return [factories[name]() for name in names]
@@ -0,0 +1,131 @@
+# llm_cache.py
+
+"""
+This file provides a persistent cache of LLM responses stored in SQLite.
+A response is keyed by everything that determines it: the backend, the model, the full
+message list and the generation parameters. Repeated evaluation and regression runs at
+low temperature can then be answered from disk instead of calling the model again.
+The cache is capped in size and evicts the least recently used responses first.
+"""
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+
+class ResponseCache:
+    """
+    A size-capped SQLite cache of LLM responses with hit/miss counters.
+
+    The total size of the cached responses is kept in a meta row, updated in the same
+    transaction as every insert and eviction, so a put never has to scan the table.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, backend TEXT, model TEXT, response TEXT NOT NULL, '
+            'usage TEXT, size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+        # Caches created before the running total existed start from one full count.
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta SELECT 'bytes', COALESCE(SUM(size), 0) FROM responses"
+        )
+
+    @staticmethod
+    def make_key(backend: str, model: str, messages: list, max_tokens: int,
+                 temperature: float, top_p: float, top_k: int) -> str:
+        """
+        Returns the cache key for one request.
+        """
+        payload = json.dumps(
+            [backend, model, messages, max_tokens, temperature, top_p, top_k],
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns (response, usage) for a cached key, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT response, usage FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+            self.hits += 1
+            return row[0], json.loads(row[1]) if row[1] else {}
+
+    def put(self, key: str, backend: str, model: str, response: str, usage: dict = None):
+        """
+        Stores a response, then evicts least recently used entries while the cache
+        is over its size cap.
+        """
+        usage_json = json.dumps(usage or {})
+        size = len(response.encode('utf-8')) + len(usage_json)
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, backend, model, response, usage_json, size, now, now)
+                )
+                total = self._meta_bytes() + size - (row[0] if row else 0)
+                while total > self.max_bytes:
+                    # Enough of the oldest entries to cover the excess if they are about this size.
+                    count = (total - self.max_bytes) // max(size, 1) + 1
+                    freed = self._conn.execute(
+                        'DELETE FROM responses WHERE rowid IN '
+                        '(SELECT rowid FROM responses ORDER BY last_used LIMIT ?) RETURNING size',
+                        (count,)
+                    ).fetchall()
+                    if not freed:
+                        break
+                    total -= sum(freed_size for (freed_size,) in freed)
+                self._conn.execute("UPDATE meta SET value = ? WHERE name = 'bytes'", (max(total, 0),))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def _meta_bytes(self) -> int:
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.execute('DELETE FROM responses')
+            self._conn.execute("UPDATE meta SET value = 0 WHERE name = 'bytes'")
+            self._conn.execute('COMMIT')
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters, the number of cached responses and their total size.
+        """
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            total = self._meta_bytes()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+        }
@@ -0,0 +1,76 @@
+# llm_stream.py
+
+"""
+This file defines LLMStream, the object returned by the streaming generation API.
+Iterating over it yields text pieces as the backend produces them. Once the stream is
+exhausted, the assembled text, token usage and time-to-first-token are available as
+attributes.
+"""
+import time
+
+
+class LLMStream:
+    """
+    Wraps a backend token iterator. The iterator must yield (text, usage) tuples,
+    where usage is None or a dict with 'prompt_tokens' and/or 'completion_tokens'.
+
+    Attributes:
+        text (str): All text received so far (the full answer once done).
+        usage (dict): Token counts reported by the backend, if any.
+        time_to_first_token (float): Seconds from the request to the first text piece.
+        total_time (float): Seconds from the request to the end of the stream.
+        error (Exception): The error that ended the stream early, if any.
+        done (bool): True once the stream has been fully consumed.
+    """
+
+    def __init__(self, token_iterator, model: str, error_message: str = None, on_complete=None):
+        self.model = model
+        self.text = ''
+        self.usage = {}
+        self.time_to_first_token = None
+        self.total_time = None
+        self.error = None
+        self.done = False
+        self._token_iterator = token_iterator
+        self._error_message = error_message
+        self._on_complete = on_complete
+        self._start = time.perf_counter()
+
+    def __iter__(self):
+        if self.done:
+            yield self.text
+            return
+        parts = []
+        try:
+            for piece, usage in self._token_iterator:
+                if usage:
+                    self.usage.update(usage)
+                if not piece:
+                    continue
+                if self.time_to_first_token is None:
+                    self.time_to_first_token = time.perf_counter() - self._start
+                parts.append(piece)
+                yield piece
+        except Exception as e:
+            self.error = e
+            message = f"{self._error_message or 'Sorry, I encountered an error'}: \n {e}"
+            parts.append(message)
+            yield message
+        finally:
+            self.text = ''.join(parts)
+            self.total_time = time.perf_counter() - self._start
+            self.done = True
+            if self._on_complete is not None:
+                self._on_complete(self)
+
+    def get_text(self) -> str:
+        """
+        Consumes the rest of the stream and returns the full text.
+        """
+        if not self.done:
+            for _ in self:
+                pass
+        return self.text
+
+    def __str__(self):
+        return self.get_text()
@@ -0,0 +1,106 @@
+# parallel_embeddings.py
+
+"""
+This file provides a bulk embedding function that spreads document embedding over
+several worker processes. Each worker loads its own copy of the sentence transformer
+model and encodes its shard in fixed-size batches; the vectors are merged back in
+input order. Query embedding and small batches stay in the calling process.
+"""
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from instrumentation import logger
+
+# Model held by each worker process, loaded once by _init_worker.
+_worker_model = None
+
+
+def _load_model(model_name: str, batch_size: int):
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={'batch_size': batch_size})
+
+
+def _init_worker(model_name: str, batch_size: int, threads_per_worker: int):
+    """
+    Loads the embedding model in a worker process. Torch is limited to this worker's
+    share of the cores so the workers do not oversubscribe the CPU.
+    """
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    _worker_model = _load_model(model_name, batch_size)
+
+
+def _embed_shard(texts: list):
+    return np.asarray(_worker_model.embed_documents(texts), dtype=np.float32)
+
+
+class ShardedEmbeddings(Embeddings):
+    """
+    A LangChain embedding function that embeds large document lists across
+    num_workers processes. The worker pool is started on first use and kept
+    alive until close() is called.
+    """
+
+    def __init__(self, model_name: str, num_workers: int, batch_size: int):
+        self.model_name = model_name
+        self.num_workers = max(1, num_workers)
+        self.batch_size = batch_size
+        self.last_throughput = None
+        self._local_model = None
+        self._executor = None
+
+    @property
+    def local_model(self):
+        if self._local_model is None:
+            self._local_model = _load_model(self.model_name, self.batch_size)
+        return self._local_model
+
+    def _get_executor(self):
+        if self._executor is None:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                # 'spawn' avoids forking a process that may already hold torch threads.
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.batch_size, threads_per_worker)
+            )
+        return self._executor
+
+    def embed_documents(self, texts: list) -> list:
+        if not texts:
+            return []
+        start = time.perf_counter()
+        if self.num_workers == 1 or len(texts) < 2 * self.batch_size:
+            vectors = self.local_model.embed_documents(texts)
+        else:
+            # Several batches per worker keep every process busy until the end.
+            shard_size = max(self.batch_size, -(-len(texts) // (self.num_workers * 4)))
+            shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+            results = self._get_executor().map(_embed_shard, shards)
+            vectors = np.concatenate(list(results)).tolist()
+        elapsed = time.perf_counter() - start
+        self.last_throughput = len(texts) / elapsed if elapsed > 0 else float('inf')
+        logger.info(f"Embedded {len(texts)} chunks with {self.num_workers} worker(s) "
+                    f"at {self.last_throughput:.1f} chunks/sec.")
+        return vectors
+
+    def embed_query(self, text: str) -> list:
+        return self.local_model.embed_query(text)
+
+    def close(self):
+        """
+        Shuts down the worker pool.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,34 @@
+# rate_limiter.py
+
+"""
+This file provides a thread-safe token-bucket rate limiter, used to cap the number of
+requests per minute sent to an LLM backend.
+"""
+import time
+import threading
+
+
+class RateLimiter:
+    """
+    Allows at most requests_per_minute calls to acquire() per minute on average,
+    with bursts of up to `burst` calls. acquire() blocks until a slot is free.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,193 @@
+# sparse_index.py
+
+"""
+This file provides a persistent BM25 keyword index over document chunks, built next to
+the vector store. Exact-term queries (product names, years, people) are often missed by
+dense similarity search; the keyword index finds them without embedding the query at all.
+
+It also provides reciprocal rank fusion (RRF), used to merge the keyword and dense
+result lists into a single hybrid ranking.
+
+The index keeps the text, metadata and per-term counts of every chunk in an SQLite table
+keyed by chunk id, so a sync writes only the chunks it changed and the index loads
+without the embedding model.
+"""
+import os
+import re
+import json
+import math
+import sqlite3
+from contextlib import closing
+
+SPARSE_INDEX_FILE = 'sparse_index.sqlite3'
+# Indexes saved before the SQLite file are imported from this file once, then removed.
+LEGACY_SPARSE_INDEX_FILE = 'sparse_index.json'
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Very common English words carry no retrieval signal and only inflate the postings.
+STOP_WORDS = frozenset(
+    'a an and are as at be but by for from has have he her his i in is it its of on or '
+    'she that the their them they this to was we were what when where which who will '
+    'with you your'.split()
+)
+
+
+def tokenize(text: str) -> list:
+    """
+    Lower-cases the text and splits it into word tokens, dropping stop words.
+    """
+    return [token for token in TOKEN_PATTERN.findall(text.casefold()) if token not in STOP_WORDS]
+
+
+def reciprocal_rank_fusion(result_lists: list, k: int, rrf_k: int = 60) -> list:
+    """
+    Merges several ranked lists of (Document, score) pairs with reciprocal rank fusion.
+    Each document scores sum(1 / (rrf_k + rank)) over the lists it appears in, so only
+    ranks matter and the incompatible score scales of BM25 and cosine similarity do not.
+    Returns the top k (Document, fused score) pairs.
+
+    Documents are matched by the 'chunk_id' stored in their metadata at indexing time,
+    falling back to Document.id (not every vector store fills it in) and finally the text.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, (doc, _) in enumerate(results, start=1):
+            key = doc.metadata.get('chunk_id') or doc.id or doc.page_content
+            entry = fused.setdefault(key, [doc, 0.0])
+            entry[1] += 1.0 / (rrf_k + rank)
+    ranked = sorted(fused.values(), key=lambda entry: entry[1], reverse=True)
+    return [(doc, score) for doc, score in ranked[:k]]
+
+
+class SparseIndex:
+    """
+    An incrementally updatable BM25 inverted index persisted in a directory.
+    Changes are kept in memory until persist() writes them.
+    """
+
+    def __init__(self, persist_directory: str, k1: float = 1.5, b: float = 0.75):
+        self.path = os.path.join(persist_directory, SPARSE_INDEX_FILE)
+        self.legacy_path = os.path.join(persist_directory, LEGACY_SPARSE_INDEX_FILE)
+        self.k1 = k1
+        self.b = b
+        # chunk id -> {'text', 'metadata', 'hash', 'terms': {term: count}, 'length'}
+        self.documents = {}
+        # term -> {chunk id: count}
+        self.postings = {}
+        self.total_length = 0
+        # Ids of the chunks added, replaced or deleted since the last persist().
+        self._dirty = set()
+        self._cleared = False
+        if os.path.exists(self.path):
+            with closing(sqlite3.connect(self.path)) as conn:
+                for chunk_id, record in conn.execute('SELECT chunk_id, record FROM chunks'):
+                    self._insert(chunk_id, json.loads(record))
+        elif os.path.exists(self.legacy_path):
+            with open(self.legacy_path, 'r') as f:
+                for chunk_id, record in json.load(f)['documents'].items():
+                    self._insert(chunk_id, record)
+            self._dirty.update(self.documents)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _insert(self, chunk_id: str, record: dict):
+        self.documents[chunk_id] = record
+        self.total_length += record['length']
+        for term, count in record['terms'].items():
+            self.postings.setdefault(term, {})[chunk_id] = count
+
+    def content_hash(self, chunk_id: str):
+        """
+        Returns the content hash the chunk was indexed with, or None if it is not indexed.
+        """
+        record = self.documents.get(chunk_id)
+        return record['hash'] if record else None
+
+    def add(self, chunk_id: str, text: str, metadata: dict, chunk_hash: str):
+        """
+        Indexes one chunk, replacing any previous version with the same id.
+        """
+        self.delete([chunk_id])
+        self._dirty.add(chunk_id)
+        tokens = tokenize(text)
+        terms = {}
+        for token in tokens:
+            terms[token] = terms.get(token, 0) + 1
+        self._insert(chunk_id, {
+            'text': text,
+            'metadata': metadata,
+            'hash': chunk_hash,
+            'terms': terms,
+            'length': len(tokens),
+        })
+
+    def delete(self, ids: list):
+        for chunk_id in ids:
+            record = self.documents.pop(chunk_id, None)
+            if record is None:
+                continue
+            self._dirty.add(chunk_id)
+            self.total_length -= record['length']
+            for term in record['terms']:
+                postings = self.postings[term]
+                del postings[chunk_id]
+                if not postings:
+                    del self.postings[term]
+
+    def clear(self):
+        self.documents.clear()
+        self.postings.clear()
+        self.total_length = 0
+        self._dirty.clear()
+        self._cleared = True
+
+    def persist(self):
+        """
+        Writes the chunks changed since the last persist() in one transaction, so a
+        crash never leaves the index half-updated. Does nothing if nothing changed.
+        """
+        if not self._dirty and not self._cleared:
+            return
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, record TEXT NOT NULL)')
+            if self._cleared:
+                conn.execute('DELETE FROM chunks')
+            conn.executemany('DELETE FROM chunks WHERE chunk_id = ?',
+                             [(chunk_id,) for chunk_id in self._dirty if chunk_id not in self.documents])
+            conn.executemany('INSERT OR REPLACE INTO chunks VALUES (?, ?)',
+                             [(chunk_id, json.dumps(self.documents[chunk_id]))
+                              for chunk_id in self._dirty if chunk_id in self.documents])
+        self._dirty.clear()
+        self._cleared = False
+        if os.path.exists(self.legacy_path):
+            os.remove(self.legacy_path)
+
+    def search(self, query: str, k: int) -> list:
+        """
+        Returns the k best-matching chunks for a query as (Document, BM25 score) pairs.
+        Chunks sharing no term with the query are never returned.
+        """
+        from langchain_core.documents import Document
+
+        if not self.documents:
+            return []
+        num_documents = len(self.documents)
+        average_length = self.total_length / num_documents or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_documents - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, count in postings.items():
+                length = self.documents[chunk_id]['length']
+                norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            (Document(id=chunk_id, page_content=self.documents[chunk_id]['text'],
+                      metadata=self.documents[chunk_id]['metadata']), score)
+            for chunk_id, score in ranked
+        ]
@@ -0,0 +1,178 @@
+# stub_ollama_server.py
+
+"""
+This file provides a local stand-in for the Ollama HTTP API, used to benchmark the RAG
+pipeline offline with reproducible LLM timings. It implements /api/chat, /api/generate
+(both streaming and non-streaming) and /api/tags. Responses are filler text produced
+at a fixed token rate, and the first request to each model can simulate a load delay.
+
+Usage:
+    python stub_ollama_server.py --port 11435 --tokens-per-second 50 --response-tokens 64
+    # then point an Ollama client at http://127.0.0.1:11435
+"""
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER_WORDS = 'the quick brown fox jumps over the lazy dog'.split()
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """
+    Request handler; its settings live on the server object (see start_server()).
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/':
+            body = b'Ollama is running'
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/api/tags':
+            self._send_json({'models': [
+                {'name': name, 'model': name, 'size': 0, 'digest': '', 'details': {}}
+                for name in sorted(self.server.loaded_models)
+            ]})
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if self.path == '/api/chat':
+            prompt_text = ' '.join(m.get('content') or '' for m in request.get('messages') or [])
+            self._generate(request, prompt_text, chat=True)
+        elif self.path == '/api/generate':
+            self._generate(request, request.get('prompt') or '', chat=False)
+        else:
+            self._send_json({'error': 'not found'}, status=404)
+
+    def _generate(self, request: dict, prompt_text: str, chat: bool):
+        server = self.server
+        model = request.get('model', '')
+        start = time.perf_counter()
+
+        load_duration = 0.0
+        with server.lock:
+            needs_load = model not in server.loaded_models
+            server.loaded_models.add(model)
+        if needs_load and server.load_time:
+            time.sleep(server.load_time)
+            load_duration = server.load_time
+
+        prompt_tokens = len(prompt_text.split())
+        if server.prefill_tokens_per_second:
+            time.sleep(prompt_tokens / server.prefill_tokens_per_second)
+        num_predict = (request.get('options') or {}).get('num_predict')
+        response_tokens = server.response_tokens if num_predict is None or num_predict < 0 \
+            else min(server.response_tokens, num_predict)
+        words = [FILLER_WORDS[i % len(FILLER_WORDS)] + ' ' for i in range(response_tokens)]
+        delay = 1.0 / server.tokens_per_second if server.tokens_per_second else 0.0
+
+        def final(text: str) -> dict:
+            total = time.perf_counter() - start
+            payload = {
+                'model': model,
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'done': True,
+                'done_reason': 'stop',
+                'total_duration': int(total * 1e9),
+                'load_duration': int(load_duration * 1e9),
+                'prompt_eval_count': prompt_tokens,
+                'prompt_eval_duration': 0,
+                'eval_count': response_tokens,
+                'eval_duration': int(max(0.0, total - load_duration) * 1e9),
+            }
+            if chat:
+                payload['message'] = {'role': 'assistant', 'content': text}
+            else:
+                payload['response'] = text
+            return payload
+
+        if request.get('stream', True) is False:
+            time.sleep(delay * response_tokens)
+            self._send_json(final(''.join(words)))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for word in words:
+            time.sleep(delay)
+            piece = {'model': model, 'created_at': datetime.now(timezone.utc).isoformat(), 'done': False}
+            if chat:
+                piece['message'] = {'role': 'assistant', 'content': word}
+            else:
+                piece['response'] = word
+            self._write_chunk(json.dumps(piece) + '\n')
+        self._write_chunk(json.dumps(final('')) + '\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, line: str):
+        data = line.encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+
+def start_server(host: str = '127.0.0.1', port: int = 0,
+                 tokens_per_second: float = 50.0,
+                 response_tokens: int = 64,
+                 prefill_tokens_per_second: float = 0.0,
+                 load_time: float = 0.0):
+    """
+    Starts the stub server in a background thread and returns it. Port 0 picks a
+    free port; the URL to use is f"http://{host}:{server.server_port}".
+    Call server.shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), StubOllamaHandler)
+    server.daemon_threads = True
+    server.tokens_per_second = tokens_per_second
+    server.response_tokens = response_tokens
+    server.prefill_tokens_per_second = prefill_tokens_per_second
+    server.load_time = load_time
+    server.loaded_models = set()
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the Ollama HTTP API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--tokens-per-second', type=float, default=50.0,
+                        help="Generation speed (0 means as fast as possible)")
+    parser.add_argument('--response-tokens', type=int, default=64,
+                        help="Tokens per response (capped by the request's num_predict)")
+    parser.add_argument('--prefill-tokens-per-second', type=float, default=0.0,
+                        help="Prompt processing speed (0 means instant)")
+    parser.add_argument('--load-time', type=float, default=0.0,
+                        help="Seconds of simulated load time on the first request per model")
+    args = parser.parse_args()
+
+    stub = start_server(args.host, args.port, args.tokens_per_second, args.response_tokens,
+                        args.prefill_tokens_per_second, args.load_time)
+    print(f"Stub Ollama server listening on http://{args.host}:{stub.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.shutdown()
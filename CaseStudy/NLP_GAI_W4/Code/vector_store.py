@@ -0,0 +1,410 @@
+# vector_store.py
+
+"""
+This file provides a lightweight vector store built on NumPy, used as an alternative
+to Chroma. Vectors are L2-normalized and kept in one contiguous float32/float16 matrix,
+so a search is a single matrix product followed by argpartition.
+
+Two index types are supported:
+- 'exact': brute-force search over every vector.
+- 'ivf':   an inverted-file index (k-means coarse quantizer). Only the nprobe closest
+           clusters are scanned, which trades a little recall for speed on large corpora.
+
+The vectors are persisted as .npy files and the ids, texts and metadatas as a JSON
+Lines file with a row offset table. Both are memory-mapped on load and records are
+only decoded for the rows a search returns, so opening an existing index is close to
+instant. File names start with the backend name ('numpy' or 'numpy-ivf'), so both
+index types can live in the same directory without loading each other's files.
+"""
+import os
+import json
+import mmap
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from instrumentation import logger
+
+BACKEND_NAMES = {'exact': 'numpy', 'ivf': 'numpy-ivf'}
+META_FILE = '{backend}.meta.json'
+VECTORS_FILE = '{backend}.vectors.npy'
+RECORDS_FILE = '{backend}.records.jsonl'
+OFFSETS_FILE = '{backend}.record_offsets.npy'
+CENTROIDS_FILE = '{backend}.ivf_centroids.npy'
+ASSIGNMENTS_FILE = '{backend}.ivf_assignments.npy'
+
+# float16 matrices are scored in float32 blocks of this many rows (NumPy has no fast
+# float16 matmul).
+SCORE_BLOCK_ROWS = 65536
+
+
+def normalize_rows(matrix):
+    """
+    L2-normalizes each row so a dot product equals cosine similarity.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores, k: int):
+    """
+    Returns the indices of the k highest scores along the last axis, best first.
+    """
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1)
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def kmeans(vectors, n_clusters: int, n_iter: int = 10, sample_size: int = 50000, seed: int = 0):
+    """
+    Spherical k-means on (a sample of) normalized vectors. Returns the centroids.
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(n_clusters):
+            members = vectors[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    A persistent NumPy-backed vector store implementing the LangChain VectorStore
+    interface, so it can be used wherever the Chroma store is used.
+    """
+
+    def __init__(self, embedding_function, persist_directory: str = None,
+                 dtype: str = 'float32', index_type: str = 'exact',
+                 nlist: int = None, nprobe: int = 8):
+        if index_type not in ('exact', 'ivf'):
+            raise ValueError(f"Unknown index type: {index_type}")
+        self._embedding_function = embedding_function
+        self.persist_directory = persist_directory
+        self.dtype = np.dtype(dtype)
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+
+        self._vectors = None          # (capacity, dim) matrix; rows [0, _size) are live
+        self._size = 0
+        self._ids, self._texts, self._metadatas = [], [], []
+        self._row_of = {}
+        self._records = None          # memory-mapped records file, until the store is modified
+        self._offsets = None          # byte offset of each record in _records (size + 1 entries)
+        self._centroids = None
+        self._assignments = None      # cluster of each live row (IVF only)
+        self._trained_size = 0
+        self._lists = None            # (order, offsets) view of rows grouped by cluster
+        self._dirty = False
+
+        if persist_directory and os.path.exists(self._path(META_FILE)):
+            self._load()
+
+    # --- Persistence ---
+    def _path(self, name: str):
+        return os.path.join(self.persist_directory, name.format(backend=BACKEND_NAMES[self.index_type]))
+
+    def _load(self):
+        with open(self._path(META_FILE), 'r') as f:
+            meta = json.load(f)
+        self._size = meta['size']
+        if self._size:
+            # Read-only maps; they are copied into memory only when the store is modified.
+            self._vectors = np.load(self._path(VECTORS_FILE), mmap_mode='r')
+            self._offsets = np.load(self._path(OFFSETS_FILE), mmap_mode='r')
+            with open(self._path(RECORDS_FILE), 'rb') as f:
+                self._records = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._ids = self._texts = self._metadatas = self._row_of = None
+            if self._vectors.dtype != self.dtype:
+                logger.warning(f"Index in {self.persist_directory} is stored as {self._vectors.dtype}; "
+                               f"it is converted to {self.dtype} when the index is next modified.")
+        if self.index_type == 'ivf' and os.path.exists(self._path(CENTROIDS_FILE)):
+            self._centroids = np.load(self._path(CENTROIDS_FILE))
+            self._assignments = np.load(self._path(ASSIGNMENTS_FILE))
+            self._trained_size = meta.get('trained_size', self._size)
+
+    def persist(self):
+        """
+        Writes the index to persist_directory (retraining the IVF quantizer when the
+        corpus has grown or shrunk substantially since it was last trained).
+        """
+        if not self.persist_directory or not self._dirty:
+            return
+        if self.index_type == 'ivf':
+            self._maybe_train()
+        os.makedirs(self.persist_directory, exist_ok=True)
+
+        def save_array(name, array):
+            tmp_path = self._path(name) + '.tmp.npy'
+            np.save(tmp_path, array)
+            os.replace(tmp_path, self._path(name))
+
+        dim = self._vectors.shape[1] if self._vectors is not None else 0
+        save_array(VECTORS_FILE, self._live_vectors() if self._size else np.empty((0, dim), self.dtype))
+        if self.index_type == 'ivf' and self._centroids is not None:
+            save_array(CENTROIDS_FILE, self._centroids)
+            save_array(ASSIGNMENTS_FILE, self._assignments[:self._size])
+
+        # One JSON array [id, text, metadata] per line; offsets[row] is where row's line starts.
+        offsets = np.zeros(self._size + 1, dtype=np.int64)
+        tmp_path = self._path(RECORDS_FILE) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for row in range(self._size):
+                line = (json.dumps(self._record(row)) + '\n').encode('utf-8')
+                f.write(line)
+                offsets[row + 1] = offsets[row] + len(line)
+        os.replace(tmp_path, self._path(RECORDS_FILE))
+        save_array(OFFSETS_FILE, offsets)
+
+        # The meta file is written last: its size is what _load() trusts.
+        tmp_path = self._path(META_FILE) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'size': self._size, 'dtype': str(self.dtype), 'trained_size': self._trained_size}, f)
+        os.replace(tmp_path, self._path(META_FILE))
+        self._dirty = False
+
+    # --- Storage ---
+    def _live_vectors(self):
+        return self._vectors[:self._size]
+
+    def _record(self, row: int):
+        """
+        Returns (id, text, metadata) of a row, decoding it from the mapped records file
+        if the store has not been modified since it was loaded.
+        """
+        if self._ids is not None:
+            return self._ids[row], self._texts[row], self._metadatas[row]
+        doc_id, text, metadata = json.loads(self._records[int(self._offsets[row]):int(self._offsets[row + 1])])
+        return doc_id, text, metadata
+
+    def _materialize(self):
+        """
+        Decodes all records into memory lists, which is needed before ids can be looked
+        up or the store can be modified.
+        """
+        if self._ids is not None:
+            return
+        records = [self._record(row) for row in range(self._size)]
+        self._ids = [record[0] for record in records]
+        self._texts = [record[1] for record in records]
+        self._metadatas = [record[2] for record in records]
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._records.close()
+        self._records, self._offsets = None, None
+
+    def _ensure_capacity(self, extra_rows: int, dim: int):
+        needed = self._size + extra_rows
+        writable = isinstance(self._vectors, np.ndarray) and not isinstance(self._vectors, np.memmap)
+        if self._vectors is not None and writable and self._vectors.shape[0] >= needed:
+            return
+        capacity = max(needed, 2 * (self._vectors.shape[0] if self._vectors is not None else 0), 1024)
+        grown = np.empty((capacity, dim), dtype=self.dtype)
+        if self._size:
+            grown[:self._size] = self._vectors[:self._size]
+        self._vectors = grown
+        if self._assignments is not None:
+            assignments = np.empty(capacity, dtype=np.int32)
+            assignments[:self._size] = self._assignments[:self._size]
+            self._assignments = assignments
+
+    def add_embeddings(self, texts: list, embeddings, metadatas: list = None, ids: list = None):
+        """
+        Inserts (or replaces, for ids already present) pre-computed embeddings.
+        """
+        if not texts:
+            return []
+        self._materialize()
+        vectors = normalize_rows(embeddings).astype(self.dtype)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+
+        new_rows = [i for i, doc_id in enumerate(ids) if doc_id not in self._row_of]
+        self._ensure_capacity(len(new_rows), vectors.shape[1])
+        rows = []
+        for i, doc_id in enumerate(ids):
+            row = self._row_of.get(doc_id)
+            if row is None:
+                row = self._size
+                self._size += 1
+                self._row_of[doc_id] = row
+                self._ids.append(doc_id)
+                self._texts.append(texts[i])
+                self._metadatas.append(metadatas[i])
+            else:
+                self._texts[row] = texts[i]
+                self._metadatas[row] = metadatas[i]
+            rows.append(row)
+        rows = np.asarray(rows)
+        self._vectors[rows] = vectors
+        if self._centroids is not None:
+            self._assignments[rows] = np.argmax(vectors.astype(np.float32) @ self._centroids.T, axis=1)
+            self._lists = None
+        self._dirty = True
+        return list(ids)
+
+    def add_texts(self, texts, metadatas: list = None, ids: list = None, **kwargs):
+        texts = list(texts)
+        embeddings = self._embedding_function.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    def delete(self, ids: list = None, **kwargs):
+        if not ids:
+            return False
+        self._materialize()
+        doomed = {self._row_of[doc_id] for doc_id in ids if doc_id in self._row_of}
+        if not doomed:
+            return False
+        keep = np.asarray([row for row in range(self._size) if row not in doomed], dtype=np.int64)
+        self._vectors = np.array(self._vectors[keep], dtype=self.dtype)
+        if self._assignments is not None:
+            self._assignments = np.array(self._assignments[keep], dtype=np.int32)
+            self._lists = None
+        self._ids = [self._ids[row] for row in keep]
+        self._texts = [self._texts[row] for row in keep]
+        self._metadatas = [self._metadatas[row] for row in keep]
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._size = len(self._ids)
+        self._dirty = True
+        return True
+
+    def get(self, ids: list = None, include: list = None):
+        """
+        Returns stored ids, documents and metadatas (the subset of Chroma's get() used
+        by RAG_LLM).
+        """
+        self._materialize()
+        rows = range(self._size) if ids is None else [self._row_of[i] for i in ids if i in self._row_of]
+        return {
+            'ids': [self._ids[row] for row in rows],
+            'documents': [self._texts[row] for row in rows],
+            'metadatas': [self._metadatas[row] for row in rows],
+        }
+
+    def get_by_ids(self, ids):
+        self._materialize()
+        return [self._document(self._row_of[doc_id]) for doc_id in ids if doc_id in self._row_of]
+
+    def __len__(self):
+        return self._size
+
+    # --- IVF Index ---
+    def _maybe_train(self):
+        if self._size == 0:
+            self._centroids, self._assignments, self._trained_size = None, None, 0
+            return
+        grown = self._trained_size and not (0.8 <= self._size / self._trained_size <= 1.25)
+        if self._centroids is not None and not grown:
+            return
+        nlist = self.nlist or max(1, int(np.sqrt(self._size)))
+        nlist = min(nlist, self._size)
+        vectors = self._live_vectors()
+        self._centroids = kmeans(vectors, nlist)
+        assignments = np.empty(self._vectors.shape[0], dtype=np.int32)
+        for start in range(0, self._size, SCORE_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            assignments[start:start + len(block)] = np.argmax(block @ self._centroids.T, axis=1)
+        self._assignments = assignments
+        self._trained_size = self._size
+        self._lists = None
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            assignments = self._assignments[:self._size]
+            order = np.argsort(assignments, kind='stable')
+            offsets = np.searchsorted(assignments[order], np.arange(len(self._centroids) + 1))
+            self._lists = (order, offsets)
+        return self._lists
+
+    # --- Search ---
+    def _score_rows(self, queries, rows=None):
+        """
+        Returns the (n_queries, n_rows) cosine similarity matrix against all live rows
+        (or the given subset of rows).
+        """
+        vectors = self._live_vectors() if rows is None else self._vectors[rows]
+        if vectors.dtype == np.float32:
+            return queries @ np.asarray(vectors).T
+        scores = np.empty((len(queries), len(vectors)), dtype=np.float32)
+        for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+
+    def search_by_vectors(self, query_vectors, k: int = 4):
+        """
+        Batch search: returns, for each query vector, a list of (Document, score)
+        pairs ordered by decreasing cosine similarity.
+        """
+        queries = normalize_rows(query_vectors)
+        if self._size == 0:
+            return [[] for _ in queries]
+
+        if self.index_type == 'ivf' and self._centroids is None:
+            self._maybe_train()
+
+        if self.index_type == 'exact':
+            scores = self._score_rows(queries)
+            best = top_k(scores, k)
+            results = [
+                [(row, scores[q, row]) for row in best[q]] for q in range(len(queries))
+            ]
+        else:
+            order, offsets = self._inverted_lists()
+            probes = top_k(queries @ self._centroids.T, self.nprobe)
+            results = []
+            for q, clusters in enumerate(probes):
+                rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in clusters])
+                scores = self._score_rows(queries[q:q + 1], rows)[0]
+                best = top_k(scores, k)
+                results.append([(rows[i], scores[i]) for i in best])
+
+        return [
+            [(self._document(row), float(score)) for row, score in hits] for hits in results
+        ]
+
+    def _document(self, row):
+        doc_id, text, metadata = self._record(row)
+        return Document(id=doc_id, page_content=text, metadata=metadata)
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, **kwargs):
+        return self.search_by_vectors([embedding], k=k)[0]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        embedding = self._embedding_function.embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k=k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas: list = None, ids: list = None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        store.persist()
+        return store
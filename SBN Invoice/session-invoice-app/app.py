@@ -1,41 +1,47 @@
 # app.py
-from flask import Flask, render_template, request, send_file
-import json
-from datetime import datetime
-from weasyprint import HTML
+from flask import Flask, render_template, request, send_file, url_for, abort, jsonify
+from datetime import datetime, date, MINYEAR, MAXYEAR
+from calendar import monthrange
+from io import BytesIO
 import os
+import time
+import zipfile
+import click
+import pdf_renderer
+from session_store import SessionStore
+from invoice_numbers import InvoiceCounter
+from invoice_store import InvoiceStore, invoice_id
+from render_queue import RenderQueue
 
 app = Flask(__name__)
 
-# Load session data
-def load_sessions():
-    try:
-        with open('sessions.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        # Return empty list if file doesn't exist
-        return []
+# Sessions are stored in SQLite; sessions.json is imported into it once on first start
+DB_PATH = os.path.join(app.root_path, 'invoice_app.sqlite3')
+SESSIONS_JSON_PATH = os.path.join(app.root_path, 'sessions.json')
+session_store = SessionStore(DB_PATH, json_path=SESSIONS_JSON_PATH)
+# Invoice number sequences live in the same database; safe with several workers
+invoice_counter = InvoiceCounter(DB_PATH, json_path=os.path.join(app.root_path, 'invoice_counter.json'))
+# Issued invoices are kept as invoices/<number>_<content hash>.pdf
+invoice_store = InvoiceStore(DB_PATH, os.path.join(app.root_path, 'invoices'))
+# Background PDF rendering in a process pool (RENDER_WORKERS processes, default: one per CPU)
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 0)) or None
+render_queue = RenderQueue(DB_PATH, invoice_store, max_workers=RENDER_WORKERS)
 
-# Save session data
-def save_sessions(sessions):
-    with open('sessions.json', 'w') as f:
-        json.dump(sessions, f, indent=2)
+# Only the serving process takes over render jobs abandoned by a stopped one, not
+# CLI commands, which import this module too
+@app.before_request
+def recover_render_jobs():
+    render_queue.recover()
 
-# Get next invoice number for the month
-def get_next_invoice_number(month_year):
-    try:
-        with open('invoice_counter.json', 'r') as f:
-            counters = json.load(f)
-    except FileNotFoundError:
-        counters = {}
-    
-    current_count = counters.get(month_year, 0) + 1
-    counters[month_year] = current_count
-    
-    with open('invoice_counter.json', 'w') as f:
-        json.dump(counters, f, indent=2)
-    
-    return f"{current_count:03d}"
+# Load session data (optionally only one month, which is all the calendar needs)
+def load_sessions(year=None, month=None, instructor=None):
+    if year and month:
+        return session_store.sessions_for_month(year, month, instructor=instructor)
+    return session_store.all_sessions()
+
+# Save session data (replaces the stored history)
+def save_sessions(sessions):
+    session_store.replace_all(sessions)
 
 # Convert number to words (Indian numbering system)
 def number_to_words(num):
@@ -79,7 +85,17 @@ def number_to_words(num):
 
 @app.route('/')
 def calendar():
-    sessions = load_sessions()
+    # Month to display: ?year=2025&month=6, defaulting to the current month
+    now = datetime.now()
+    current_year = request.args.get('year', now.year, type=int)
+    current_month = request.args.get('month', now.month, type=int)
+    if not 1 <= current_month <= 12:
+        current_month = now.month
+    # A year date() cannot represent (or whose next month it cannot) shows the current year
+    if not MINYEAR <= current_year < MAXYEAR:
+        current_year = now.year
+    instructor = request.args.get('instructor') or None
+    sessions = load_sessions(current_year, current_month, instructor=instructor)
     
     # Group sessions by date for the calendar view
     sessions_by_date = {}
@@ -89,30 +105,20 @@ def calendar():
             sessions_by_date[date_str] = []
         sessions_by_date[date_str].append(session)
     
-    # Get current month and year for the calendar
-    now = datetime.now()
-    current_month = now.month
-    current_year = now.year
+    # Previous and next month for the calendar navigation
+    prev_year, prev_month = (current_year - 1, 12) if current_month == 1 else (current_year, current_month - 1)
+    next_year, next_month = (current_year + 1, 1) if current_month == 12 else (current_year, current_month + 1)
     
     return render_template('calendar.html', 
                          sessions_by_date=sessions_by_date,
                          current_month=current_month,
-                         current_year=current_year)
+                         current_year=current_year,
+                         instructor=instructor,
+                         prev_month=prev_month, prev_year=prev_year,
+                         next_month=next_month, next_year=next_year)
 
-@app.route('/generate_invoice', methods=['POST'])
-def generate_invoice():
-    session_date = request.form.get('date')
-    session_topic = request.form.get('topic')
-    session_amount = float(request.form.get('amount', 0))
-    
-    # Get current date for invoice
-    invoice_date = datetime.now().strftime('%Y-%m-%d')
-    
-    # Generate invoice number
-    month_year = datetime.now().strftime('%m/%Y')
-    invoice_number = get_next_invoice_number(month_year)
-    full_invoice_number = f"{invoice_number}/{datetime.now().strftime('%m/%Y')}"
-    
+# Build the invoice HTML for a session
+def build_invoice_html(invoice_number, invoice_date, session_topic, session_amount):
     # Calculate GST
     gst_rate = 0.18
     igst_amount = session_amount * gst_rate
@@ -123,26 +129,278 @@ def generate_invoice():
     tax_in_words = number_to_words(int(round(igst_amount)))
     
     # Render invoice template
-    html = render_template('invoice_template.html',
+    return render_template('invoice_template.html',
                          invoice_date=invoice_date,
-                         invoice_number=full_invoice_number,
+                         invoice_number=invoice_number,
                          session_topic=session_topic,
                          base_amount=session_amount,
                          igst_amount=igst_amount,
                          total_amount=total_amount,
                          amount_in_words=amount_in_words,
                          tax_in_words=tax_in_words)
+
+# Render invoice HTML to PDF bytes (stylesheet and fonts are reused between renders)
+def render_pdf(html):
+    return pdf_renderer.render_pdf(html)
+
+# Issue an invoice for the session in the request form; returns its number and HTML
+def issue_invoice_from_form():
+    session_topic = request.form.get('topic')
+    session_amount = float(request.form.get('amount', 0))
+    
+    # Get current date for invoice
+    now = datetime.now()
+    invoice_date = now.strftime('%Y-%m-%d')
     
-    # Generate PDF
-    pdf = HTML(string=html).write_pdf()
+    # The number is taken and the invoice recorded in one transaction, so a failed
+    # render later on does not lose the number
+    month_year = now.strftime('%m/%Y')
+    [(full_invoice_number, html)] = invoice_store.issue(
+        invoice_counter, month_year, [None],
+        lambda invoice_number, _: build_invoice_html(invoice_number, invoice_date, session_topic, session_amount))
+    return full_invoice_number, html
+
+@app.route('/generate_invoice', methods=['POST'])
+def generate_invoice():
+    full_invoice_number, html = issue_invoice_from_form()
     
-    # Save PDF temporarily
-    filename = f"Invoice_{full_invoice_number.replace('/', '_')}.pdf"
-    with open(filename, 'wb') as f:
-        f.write(pdf)
+    # Generate PDF, keep it in the invoice store and stream it from memory
+    pdf = invoice_store.render(html, render_pdf)
+    invoice_store.put(full_invoice_number, html, pdf)
     
-    # Send file to user
-    return send_file(filename, as_attachment=True)
+    filename = f"Invoice_{invoice_id(full_invoice_number)}.pdf"
+    response = send_file(BytesIO(pdf), mimetype='application/pdf',
+                         as_attachment=True, download_name=filename)
+    response.headers['X-Invoice-Url'] = url_for('download_invoice', invoice_id=invoice_id(full_invoice_number))
+    return response
+
+# Re-download an issued invoice (served from the invoice store, no re-render)
+@app.route('/invoices/<invoice_id>')
+def download_invoice(invoice_id):
+    path = invoice_store.fetch(invoice_id, render_pdf)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='application/pdf',
+                     as_attachment=True, download_name=f"Invoice_{invoice_id}.pdf")
+
+# Queue an invoice for background rendering; poll the status URL, then download
+@app.route('/render_jobs', methods=['POST'])
+def submit_render_job():
+    full_invoice_number, html = issue_invoice_from_form()
+    job_id = render_queue.submit(full_invoice_number, html)
+    response = jsonify(render_job_status(render_queue.get(job_id)))
+    response.status_code = 202
+    response.headers['Location'] = url_for('render_job', job_id=job_id)
+    return response
+
+def render_job_status(job):
+    status = {
+        'job_id': job['job_id'],
+        'invoice_number': job['invoice_number'],
+        'status': job['status'],
+        'status_url': url_for('render_job', job_id=job['job_id']),
+    }
+    if job['finished_at']:
+        status['latency_seconds'] = round(job['finished_at'] - job['submitted_at'], 4)
+    if job['status'] == 'done':
+        status['download_url'] = url_for('render_job_pdf', job_id=job['job_id'])
+    if job['error']:
+        status['error'] = job['error']
+    return status
+
+@app.route('/render_jobs/<job_id>')
+def render_job(job_id):
+    job = render_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(render_job_status(job))
+
+@app.route('/render_jobs/<job_id>/pdf')
+def render_job_pdf(job_id):
+    job = render_queue.get(job_id)
+    if job is None:
+        abort(404)
+    if job['status'] != 'done':
+        # Not ready yet (or failed): return the status instead of the PDF
+        pending = job['status'] in ('queued', 'running')
+        response = jsonify(render_job_status(job))
+        response.status_code = 202 if pending else 500
+        if pending:
+            response.headers['Retry-After'] = '1'
+        return response
+    return download_invoice(invoice_id(job['invoice_number']))
+
+# Months still to come cannot be invoiced: their invoice date (today) would fall before them
+def is_future_month(year, month):
+    today = date.today()
+    return (year, month) > (today.year, today.month)
+
+# Month-end invoices are dated the month's last day (today, while the month is still running)
+def month_invoice_date(year, month):
+    last_day = date(year, month, monthrange(year, month)[1])
+    return min(last_day, date.today()).isoformat()
+
+# Issue invoices for the sessions of a month (optionally one instructor's) that have none yet:
+# numbers come from that month's sequence and are taken in a single transaction, so running
+# it again only invoices sessions added since. Returns (sessions, [(invoice_number, html)] issued)
+def issue_month_invoices(year, month, instructor=None):
+    sessions = load_sessions(year, month, instructor=instructor)
+    invoice_date = month_invoice_date(year, month)
+    issued = invoice_store.issue(
+        invoice_counter, f"{month:02d}/{year}", sessions,
+        lambda invoice_number, session: build_invoice_html(invoice_number, invoice_date,
+                                                            session['title'], float(session['amount'])),
+        session_ids=[session['id'] for session in sessions])
+    return sessions, issued
+
+# Render issued invoices across the pool and store them; returns [(invoice_number, pdf)]
+def render_issued(issued):
+    htmls = [html for _, html in issued]
+    invoices = []
+    for (invoice_number, html), (pdf, seconds) in zip(issued, render_queue.render_many(htmls)):
+        invoice_store.put(invoice_number, html, pdf)
+        invoice_store.record_render(seconds)
+        invoices.append((invoice_number, pdf))
+    return invoices
+
+# Merged PDF output is optional and needs pypdf
+def pypdf_available():
+    try:
+        import pypdf  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+# Package issued invoices as a ZIP, or as one merged PDF (needs the optional pypdf package)
+def package_invoices(invoices, output_format='zip'):
+    buffer = BytesIO()
+    if output_format == 'pdf':
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for _, pdf in invoices:
+            writer.append(BytesIO(pdf))
+        writer.write(buffer)
+    else:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for invoice_number, pdf in invoices:
+                archive.writestr(f"Invoice_{invoice_id(invoice_number)}.pdf", pdf)
+    buffer.seek(0)
+    return buffer
+
+# Issue a month's invoices and queue their renders as one batch; poll the status URL, then download
+@app.route('/bulk_invoices', methods=['POST'])
+def bulk_invoices():
+    year = request.form.get('year', type=int)
+    month = request.form.get('month', type=int)
+    instructor = request.form.get('instructor') or None
+    output_format = request.form.get('format', 'zip')
+    if not year or not month or year < MINYEAR or not 1 <= month <= 12 or output_format not in ('zip', 'pdf'):
+        abort(400)
+    if is_future_month(year, month):
+        return jsonify(error=f"{month:02d}/{year} has not started yet; it cannot be invoiced."), 400
+    if output_format == 'pdf' and not pypdf_available():
+        return jsonify(error="Merged PDF output needs the pypdf package; use format=zip."), 400
+    sessions, issued = issue_month_invoices(year, month, instructor=instructor)
+    if not sessions:
+        return jsonify(error=f"No sessions found for {month:02d}/{year}."), 404
+    if not issued:
+        return jsonify(issued=0, already_invoiced=len(sessions),
+                       message=f"All {len(sessions)} sessions of {month:02d}/{year} already have invoices.")
+    batch_id = render_queue.submit_batch(issued)
+    status = bulk_job_status(batch_id, render_queue.batch(batch_id), output_format)
+    status['already_invoiced'] = len(sessions) - len(issued)
+    response = jsonify(status)
+    response.status_code = 202
+    response.headers['Location'] = status['status_url']
+    return response
+
+def bulk_job_status(batch_id, jobs, output_format='zip'):
+    counts = {state: sum(job['status'] == state for job in jobs) for state in ('queued', 'running', 'done', 'failed')}
+    if counts['queued'] or counts['running']:
+        state = 'queued' if counts['queued'] == len(jobs) else 'running'
+    else:
+        state = 'failed' if counts['failed'] else 'done'
+    status = dict(counts, batch_id=batch_id, status=state, invoices=len(jobs),
+                  first_invoice=jobs[0]['invoice_number'], last_invoice=jobs[-1]['invoice_number'],
+                  status_url=url_for('bulk_job', batch_id=batch_id, format=output_format))
+    if state in ('done', 'failed'):
+        status['latency_seconds'] = round(max(job['finished_at'] for job in jobs) -
+                                          min(job['submitted_at'] for job in jobs), 4)
+    if state == 'done':
+        status['download_url'] = url_for('bulk_job_download', batch_id=batch_id, format=output_format)
+    if counts['failed']:
+        status['errors'] = {job['invoice_number']: job['error'] for job in jobs if job['error']}
+    return status
+
+@app.route('/bulk_invoices/<batch_id>')
+def bulk_job(batch_id):
+    jobs = render_queue.batch(batch_id)
+    if not jobs:
+        abort(404)
+    return jsonify(bulk_job_status(batch_id, jobs, request.args.get('format', 'zip')))
+
+# Download a finished batch as a ZIP, or as one merged PDF (?format=pdf)
+@app.route('/bulk_invoices/<batch_id>/download')
+def bulk_job_download(batch_id):
+    output_format = request.args.get('format', 'zip')
+    if output_format not in ('zip', 'pdf'):
+        abort(400)
+    if output_format == 'pdf' and not pypdf_available():
+        return jsonify(error="Merged PDF output needs the pypdf package; use format=zip."), 400
+    jobs = render_queue.batch(batch_id)
+    if not jobs:
+        abort(404)
+    status = bulk_job_status(batch_id, jobs, output_format)
+    if status['status'] != 'done':
+        # Not ready yet (or a render failed): return the status instead of the file
+        pending = status['status'] in ('queued', 'running')
+        response = jsonify(status)
+        response.status_code = 202 if pending else 500
+        if pending:
+            response.headers['Retry-After'] = '1'
+        return response
+    invoices = []
+    for job in jobs:
+        with open(invoice_store.fetch(invoice_id(job['invoice_number']), render_pdf), 'rb') as f:
+            invoices.append((job['invoice_number'], f.read()))
+    # Invoice numbers are NNN/MM/YYYY
+    _, month, year = jobs[0]['invoice_number'].split('/')
+    return send_file(package_invoices(invoices, output_format),
+                     mimetype='application/pdf' if output_format == 'pdf' else 'application/zip',
+                     as_attachment=True, download_name=f"Invoices_{year}_{month}.{output_format}")
+
+# flask --app app bulk-invoices 2025 6 [--instructor NAME] [--format zip|pdf] [--output FILE]
+@app.cli.command('bulk-invoices')
+@click.argument('year', type=click.IntRange(MINYEAR))
+@click.argument('month', type=click.IntRange(1, 12))
+@click.option('--instructor', default=None, help="Only this instructor's sessions.")
+@click.option('--format', 'output_format', type=click.Choice(['zip', 'pdf']), default='zip')
+@click.option('--output', default=None, help="Output file (default: Invoices_<year>_<month>.<format>).")
+def bulk_invoices_command(year, month, instructor, output_format, output):
+    """Issue and render invoices for the sessions of a month that have none yet."""
+    if is_future_month(year, month):
+        raise click.ClickException(f"{month:02d}/{year} has not started yet; it cannot be invoiced.")
+    if output_format == 'pdf' and not pypdf_available():
+        raise click.ClickException("Merged PDF output needs the pypdf package; use --format zip.")
+    start = time.perf_counter()
+    sessions, issued = issue_month_invoices(year, month, instructor=instructor)
+    if not sessions:
+        raise click.ClickException(f"No sessions found for {month:02d}/{year}.")
+    if not issued:
+        click.echo(f"All {len(sessions)} sessions of {month:02d}/{year} already have invoices.")
+        return
+    invoices = render_issued(issued)
+    render_queue.shutdown()
+    output = output or f"Invoices_{year}_{month:02d}.{output_format}"
+    with open(output, 'wb') as f:
+        f.write(package_invoices(invoices, output_format).getvalue())
+    click.echo(f"Issued {len(invoices)} invoices ({invoices[0][0]} to {invoices[-1][0]}) "
+               f"in {time.perf_counter() - start:.1f}s -> {output}")
+
+# Render time, re-download hit rate (this worker) and render queue depth and latency (all workers)
+@app.route('/stats')
+def stats():
+    return jsonify(invoices=invoice_store.stats(), render_queue=render_queue.stats())
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
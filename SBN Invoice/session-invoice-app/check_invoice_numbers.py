@@ -0,0 +1,138 @@
+# check_invoice_numbers.py
+"""
+Checks that invoice numbering stays gap-free and duplicate-free under concurrency.
+
+Several processes, each running several threads, draw numbers from one month's
+sequence in a fresh database, mixing next_number(), allocate() and
+InvoiceStore.issue(). The check fails unless the numbers drawn are exactly 1..N,
+each drawn once, and every number taken by issue() has its invoice on record.
+
+It then saves a month of sessions, runs the month's invoicing from every process at
+once, saves an edited history (a session dropped, one changed, two added) and runs it
+again. Each run must invoice only the sessions that have no invoice yet, and every
+session must end up with exactly one invoice, made for that session.
+
+Usage:
+    python check_invoice_numbers.py [--processes 8] [--threads 8] [--draws 30]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from invoice_numbers import InvoiceCounter
+from invoice_store import InvoiceStore
+from session_store import SessionStore, connect
+
+MONTH_YEAR = '01/2000'
+SESSIONS_YEAR, SESSIONS_MONTH = 2000, 2
+
+
+def draw(db_path, directory, draws):
+    """One thread's draws; returns (numbers drawn, invoice numbers issued)."""
+    counter = InvoiceCounter(db_path)
+    store = InvoiceStore(db_path, directory)
+    numbers, issued = [], []
+    for i in range(draws):
+        if i % 3 == 0:
+            numbers.append(counter.next_number(MONTH_YEAR))
+        elif i % 3 == 1:
+            numbers.extend(counter.allocate(MONTH_YEAR, 3))
+        else:
+            for invoice_number, _ in store.issue(counter, MONTH_YEAR, [None, None],
+                                                 lambda invoice_number, _: f"<p>{invoice_number}</p>"):
+                numbers.append(int(invoice_number.split('/')[0]))
+                issued.append(invoice_number)
+    return numbers, issued
+
+
+def run_process(db_path, directory, threads, draws):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda _: draw(db_path, directory, draws), range(threads)))
+    return ([n for numbers, _ in results for n in numbers],
+            [invoice_number for _, issued in results for invoice_number in issued])
+
+
+def month_run(db_path, directory):
+    """Invoice the sessions month as the app does; returns the invoice numbers issued."""
+    sessions = SessionStore(db_path).sessions_for_month(SESSIONS_YEAR, SESSIONS_MONTH)
+    issued = InvoiceStore(db_path, directory).issue(
+        InvoiceCounter(db_path), f"{SESSIONS_MONTH:02d}/{SESSIONS_YEAR}", sessions,
+        lambda invoice_number, session: f"<p>{invoice_number} {session['title']}</p>",
+        session_ids=[session['id'] for session in sessions])
+    return [invoice_number for invoice_number, _ in issued]
+
+
+def check_sessions(pool, tmp, processes):
+    """Month runs around save_sessions (SessionStore.replace_all); returns a list of failures."""
+    db_path = os.path.join(tmp, 'sessions.sqlite3')
+    directory = os.path.join(tmp, 'session_invoices')
+    store = SessionStore(db_path)
+    InvoiceStore(db_path, directory)
+    InvoiceCounter(db_path)
+    sessions = [{'date': f"{SESSIONS_YEAR}-{SESSIONS_MONTH:02d}-{day:02d}", 'time': '9 to 11 am',
+                 'instructor': 'Check', 'title': f"Session {day}", 'amount': 1000} for day in range(1, 21)]
+    store.replace_all(sessions)
+    first = [n for issued in pool.starmap(month_run, [(db_path, directory)] * processes) for n in issued]
+    # Drop the newest session (whose id a reused rowid would hand to the next one), change
+    # an amount, add two sessions and save in a different order
+    edited = sessions[:-1] + [dict(sessions[0], time='3 to 5 pm', title='Session 1b'),
+                              dict(sessions[1], title='Session 2b')]
+    edited[2] = dict(edited[2], amount=1500)
+    store.replace_all(list(reversed(edited)))
+    second = [n for issued in pool.starmap(month_run, [(db_path, directory)] * processes) for n in issued]
+    with connect(db_path) as conn:
+        rows = conn.execute('SELECT s.title, i.html FROM sessions s LEFT JOIN invoices i ON i.session_id = s.id').fetchall()
+
+    print(f"Sessions: {len(first)} invoices issued for {len(sessions)} sessions, then {len(second)} "
+          f"after saving {len(edited)}; {len(rows)} session/invoice pairs.")
+    failures = []
+    if len(first) != len(sessions):
+        failures.append(f"First month run issued {len(first)} invoices for {len(sessions)} sessions.")
+    if len(second) != 2:
+        failures.append(f"Second month run issued {len(second)} invoices for 2 new sessions.")
+    wrong = [title for title, html in rows if html is None or not html.endswith(f" {title}</p>")]
+    if len(rows) != len(edited) or wrong:
+        failures.append(f"{len(wrong)} session(s) without their own invoice, {len(rows)} pairs for "
+                        f"{len(edited)} sessions.")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concurrency check of invoice numbering.")
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--draws', type=int, default=30, help="Draws per thread")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'invoice_app.sqlite3')
+        directory = os.path.join(tmp, 'invoices')
+        # Create the schema once before the processes race to open the database
+        InvoiceStore(db_path, directory)
+        InvoiceCounter(db_path)
+        with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+            results = pool.starmap(run_process, [(db_path, directory, args.threads, args.draws)] * args.processes)
+            session_failures = check_sessions(pool, tmp, args.processes)
+        numbers = sorted(n for drawn, _ in results for n in drawn)
+        issued = {invoice_number for _, invoice_numbers in results for invoice_number in invoice_numbers}
+        with connect(db_path) as conn:
+            recorded = {row[0] for row in conn.execute('SELECT invoice_number FROM invoices')}
+        last = InvoiceCounter(db_path).current(MONTH_YEAR)
+
+    print(f"{len(numbers)} numbers drawn by {args.processes} processes x {args.threads} threads; "
+          f"counter at {last}; {len(issued)} invoices issued, {len(recorded)} recorded.")
+    failed = False
+    if numbers != list(range(1, len(numbers) + 1)) or last != len(numbers):
+        duplicates = len(numbers) - len(set(numbers))
+        print(f"Numbers are not exactly 1..{len(numbers)}: {duplicates} duplicate(s), counter at {last}.")
+        failed = True
+    if issued != recorded:
+        print(f"{len(issued ^ recorded)} issued invoice(s) missing from, or unexpected in, the invoices table.")
+        failed = True
+    for failure in session_failures:
+        print(failure)
+        failed = True
+    sys.exit(1 if failed else 0)
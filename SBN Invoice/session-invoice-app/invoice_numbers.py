@@ -0,0 +1,109 @@
+# invoice_numbers.py
+"""
+Per-month invoice number sequences, stored in the app's SQLite database.
+
+Each number is taken inside a BEGIN IMMEDIATE transaction, which holds SQLite's
+write lock from the read to the increment. Concurrent requests, from threads or
+from separate worker processes, therefore queue up and each gets the next number:
+no duplicates and no skipped numbers. A crash mid-request rolls the transaction
+back, so the counter is never left half-written. allocate() can also take numbers
+inside a caller's transaction, so that the invoice store records the invoices in
+the same commit (see InvoiceStore.issue()). Counters from an existing
+invoice_counter.json are imported once.
+"""
+import json
+import os
+
+from session_store import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoice_counters (
+    month_year TEXT PRIMARY KEY,
+    last_number INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def format_invoice_number(number, month_year):
+    """Full invoice number: 6, 10/2026 -> 006/10/2026."""
+    return f"{number:03d}/{month_year}"
+
+
+class InvoiceCounter:
+    def __init__(self, db_path, json_path=None):
+        self.db_path = db_path
+        with connect(self.db_path) as conn:
+            conn.executescript(SCHEMA)
+        if json_path:
+            self.import_json(json_path)
+
+    def import_json(self, json_path):
+        """Import invoice_counter.json once, keeping the higher value if a month already has numbers."""
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path, 'r') as f:
+            counters = json.load(f)
+        with connect(self.db_path) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'invoice_counter_json_imported'").fetchone():
+                conn.execute('ROLLBACK')
+                return 0
+            conn.executemany(
+                'INSERT INTO invoice_counters (month_year, last_number) VALUES (?, ?) '
+                'ON CONFLICT (month_year) DO UPDATE SET last_number = MAX(last_number, excluded.last_number)',
+                [(month_year, int(count)) for month_year, count in counters.items()]
+            )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('invoice_counter_json_imported', ?)",
+                         (os.path.abspath(json_path),))
+            conn.execute('COMMIT')
+        return len(counters)
+
+    def next_number(self, month_year):
+        """Atomically take the next number of a month's sequence (1, 2, 3, ...)."""
+        with connect(self.db_path) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            number = conn.execute(
+                'INSERT INTO invoice_counters (month_year, last_number) VALUES (?, 1) '
+                'ON CONFLICT (month_year) DO UPDATE SET last_number = last_number + 1 '
+                'RETURNING last_number',
+                (month_year,)
+            ).fetchone()[0]
+            conn.execute('COMMIT')
+        return number
+
+    def allocate(self, month_year, count, conn=None):
+        """
+        Atomically take the next count numbers of a month's sequence. Returns them as a list.
+        Given conn, a connection in a BEGIN IMMEDIATE transaction, the numbers are taken
+        inside that transaction and are only used up if the caller commits it.
+        """
+        if count <= 0:
+            return []
+        if conn is not None:
+            return self._take(conn, month_year, count)
+        with connect(self.db_path) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            numbers = self._take(conn, month_year, count)
+            conn.execute('COMMIT')
+        return numbers
+
+    @staticmethod
+    def _take(conn, month_year, count):
+        last = conn.execute(
+            'INSERT INTO invoice_counters (month_year, last_number) VALUES (?, ?) '
+            'ON CONFLICT (month_year) DO UPDATE SET last_number = last_number + excluded.last_number '
+            'RETURNING last_number',
+            (month_year, count)
+        ).fetchone()[0]
+        return list(range(last - count + 1, last + 1))
+
+    def current(self, month_year):
+        """The last number issued for a month (0 if none)."""
+        with connect(self.db_path) as conn:
+            row = conn.execute('SELECT last_number FROM invoice_counters WHERE month_year = ?',
+                               (month_year,)).fetchone()
+        return row[0] if row else 0
@@ -0,0 +1,190 @@
+# invoice_store.py
+"""
+Store of issued invoice PDFs.
+
+Each issued invoice is written once to invoices/<number>_<hash>.pdf, where the hash
+is the SHA-256 of the invoice's rendered HTML. The invoice's row in the app's SQLite
+database keeps the hash and the HTML, so a re-download is served straight from disk
+without re-rendering. If the file has gone missing, the exact same HTML is rendered
+again and stored back.
+
+issue() takes invoice numbers and records the invoices in one transaction, before
+any PDF is rendered. A render that fails therefore never loses a number: the invoice
+stays on record and its PDF is rendered from the stored HTML when it is next fetched.
+Invoices issued for a session record its id, and a session is never invoiced twice. Files are written atomically (temp file + rename), so a
+concurrent reader never sees a partial PDF.
+
+The store also counts renders, render time and re-download hits/misses for /stats.
+"""
+import hashlib
+import os
+import threading
+import time
+
+from session_store import connect
+from invoice_numbers import format_invoice_number
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_id TEXT PRIMARY KEY,
+    invoice_number TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    html TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    session_id INTEGER
+);
+"""
+
+# Columns added after the first release, for databases created before them
+MIGRATIONS = {
+    'session_id': 'ALTER TABLE invoices ADD COLUMN session_id INTEGER',
+}
+
+
+def invoice_id(invoice_number):
+    """File- and URL-safe form of an invoice number: 006/10/2026 -> 006_10_2026."""
+    return invoice_number.replace('/', '_')
+
+
+def content_hash(html):
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+class InvoiceStore:
+    def __init__(self, db_path, directory):
+        self.db_path = db_path
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        with connect(self.db_path) as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(invoices)')}
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_session_id '
+                         'ON invoices (session_id) WHERE session_id IS NOT NULL')
+        self._lock = threading.Lock()
+        self.renders = 0
+        self.render_seconds = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def filename_for(self, invoice_number, digest):
+        return f"{invoice_id(invoice_number)}_{digest[:16]}.pdf"
+
+    def issue(self, invoice_counter, month_year, entries, build_html, session_ids=None):
+        """
+        Issue one invoice per entry: take the next numbers of month_year's sequence and
+        record the invoices in the same transaction. build_html(invoice_number, entry)
+        returns an invoice's HTML. session_ids, if given, holds each entry's session id
+        (or None); entries whose session already has an invoice are skipped.
+        Returns a list of (invoice_number, html) in entry order.
+        """
+        session_ids = session_ids or [None] * len(entries)
+        with connect(self.db_path) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            invoiced = self._invoiced_sessions(conn, [s for s in session_ids if s is not None])
+            pending = [(entry, session_id) for entry, session_id in zip(entries, session_ids)
+                       if session_id is None or session_id not in invoiced]
+            numbers = invoice_counter.allocate(month_year, len(pending), conn=conn)
+            issued = []
+            for number, (entry, session_id) in zip(numbers, pending):
+                invoice_number = format_invoice_number(number, month_year)
+                html = build_html(invoice_number, entry)
+                self._record(conn, invoice_number, html, session_id)
+                issued.append((invoice_number, html))
+            conn.execute('COMMIT')
+        return issued
+
+    def invoiced_sessions(self, session_ids):
+        """{session id: invoice number} for those of the given sessions that have an invoice."""
+        with connect(self.db_path) as conn:
+            return self._invoiced_sessions(conn, session_ids)
+
+    @staticmethod
+    def _invoiced_sessions(conn, session_ids):
+        invoiced = {}
+        # Chunked to stay under SQLite's limit on query parameters
+        for start in range(0, len(session_ids), 500):
+            chunk = session_ids[start:start + 500]
+            invoiced.update(conn.execute(
+                f"SELECT session_id, invoice_number FROM invoices WHERE session_id IN ({', '.join('?' * len(chunk))})",
+                chunk
+            ).fetchall())
+        return invoiced
+
+    def _record(self, conn, invoice_number, html, session_id=None):
+        digest = content_hash(html)
+        filename = self.filename_for(invoice_number, digest)
+        conn.execute(
+            'INSERT INTO invoices (invoice_id, invoice_number, content_hash, filename, html, session_id) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (invoice_id) DO UPDATE SET '
+            'content_hash = excluded.content_hash, filename = excluded.filename, html = excluded.html',
+            (invoice_id(invoice_number), invoice_number, digest, filename, html, session_id)
+        )
+        return filename
+
+    def render(self, html, render_pdf):
+        """Render HTML to PDF bytes with render_pdf(html), recording the render time."""
+        start = time.perf_counter()
+        pdf = render_pdf(html)
+        self.record_render(time.perf_counter() - start)
+        return pdf
+
+    def record_render(self, seconds):
+        with self._lock:
+            self.renders += 1
+            self.render_seconds += seconds
+
+    def put(self, invoice_number, html, pdf):
+        """Store an issued invoice's PDF and record it. Returns the stored file's path."""
+        filename = self.filename_for(invoice_number, content_hash(html))
+        self._write(filename, pdf)
+        with connect(self.db_path) as conn:
+            self._record(conn, invoice_number, html)
+        return os.path.join(self.directory, filename)
+
+    def _write(self, filename, pdf):
+        path = os.path.join(self.directory, filename)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp_path, path)
+
+    def get(self, invoice_id):
+        """The stored record of an issued invoice, or None."""
+        with connect(self.db_path) as conn:
+            row = conn.execute('SELECT * FROM invoices WHERE invoice_id = ?', (invoice_id,)).fetchone()
+        return dict(row) if row else None
+
+    def fetch(self, invoice_id, render_pdf):
+        """
+        Path of an issued invoice's PDF, or None if no such invoice was issued.
+        A missing file is re-rendered from the stored HTML (a cache miss).
+        """
+        record = self.get(invoice_id)
+        if record is None:
+            return None
+        path = os.path.join(self.directory, record['filename'])
+        if os.path.exists(path):
+            with self._lock:
+                self.hits += 1
+            return path
+        with self._lock:
+            self.misses += 1
+        self._write(record['filename'], self.render(record['html'], render_pdf))
+        return path
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'renders': self.renders,
+                'render_seconds_total': round(self.render_seconds, 4),
+                'render_seconds_avg': round(self.render_seconds / self.renders, 4) if self.renders else None,
+                'redownload_hits': self.hits,
+                'redownload_misses': self.misses,
+                'redownload_hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,41 @@
+# pdf_renderer.py
+"""
+Invoice HTML to PDF rendering with WeasyPrint.
+
+The invoice stylesheet (static/invoice.css) and WeasyPrint's FontConfiguration are
+built once per process and reused for every render, instead of re-parsing the CSS and
+re-scanning fonts for each invoice. init_renderer() is also the initializer of the
+render pool's processes, so they are ready before the first job arrives.
+"""
+import os
+import time
+
+CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'invoice.css')
+
+_stylesheets = None
+_font_config = None
+
+
+def init_renderer(css_path=CSS_PATH):
+    """Parse the invoice stylesheet and set up fonts for this process."""
+    global _stylesheets, _font_config
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+    _font_config = FontConfiguration()
+    _stylesheets = [CSS(filename=css_path, font_config=_font_config)]
+
+
+def render_pdf(html):
+    """Render invoice HTML to PDF bytes."""
+    from weasyprint import HTML
+    if _stylesheets is None:
+        init_renderer()
+    return HTML(string=html).write_pdf(stylesheets=_stylesheets, font_config=_font_config)
+
+
+def timed_render(html):
+    """Runs in a pool process. Returns (pdf bytes, wall-clock start time, render seconds)."""
+    started_at = time.time()
+    start = time.perf_counter()
+    pdf = render_pdf(html)
+    return pdf, started_at, time.perf_counter() - start
@@ -0,0 +1,276 @@
+# render_queue.py
+"""
+Background PDF rendering for the invoice app.
+
+WeasyPrint is CPU-bound, so rendering inside the request thread ties up a worker for
+hundreds of milliseconds per invoice. RenderQueue hands renders to a local pool of
+processes instead: submit() records a job and returns its id at once; when the render
+finishes the PDF goes into the invoice store and the job is marked done.
+
+Jobs are kept in the app's SQLite database rather than in memory, so any app worker
+can answer a status or download request for a job submitted to another one, and the
+queue depth and latency figures cover all workers. A job goes from 'queued' to
+'running' when a pool process picks it up, then to 'done' or 'failed'. Jobs submitted
+together with submit_batch() share a batch id, which can be polled as one.
+
+Each job records the process that submitted it and the HTML to render. If that
+process dies before the job finishes, the next app process to serve a request claims
+the job (see recover()) and renders it again.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+from session_store import connect
+from pdf_renderer import init_renderer, timed_render
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS render_jobs (
+    job_id TEXT PRIMARY KEY,
+    invoice_number TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    html TEXT,
+    owner_pid INTEGER,
+    batch_id TEXT,
+    owner_start TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_render_jobs_status ON render_jobs (status);
+"""
+
+# Columns added after the first release, for databases created before them
+MIGRATIONS = {
+    'html': 'ALTER TABLE render_jobs ADD COLUMN html TEXT',
+    'owner_pid': 'ALTER TABLE render_jobs ADD COLUMN owner_pid INTEGER',
+    'batch_id': 'ALTER TABLE render_jobs ADD COLUMN batch_id TEXT',
+    'owner_start': 'ALTER TABLE render_jobs ADD COLUMN owner_start TEXT',
+}
+
+# Latency figures in stats() cover this many most recently finished jobs
+LATENCY_WINDOW = 200
+
+# os.kill() cannot probe a process on Windows; there an unfinished job is taken to be
+# abandoned once it is this many seconds old
+ABANDONED_JOB_SECONDS = 600
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def process_start(pid):
+    """
+    Boot id and start time of a process, which tell it apart from a later process
+    given the same pid. None where /proc is unavailable or the process is gone.
+    """
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            boot_id = f.read().strip()
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Field 22 is the start time; the command name before it may contain spaces
+    return f"{boot_id}:{stat.rsplit(')', 1)[1].split()[19]}"
+
+
+def owner_alive(pid, start, submitted_at):
+    """Whether the app process that submitted a job may still be waiting for it."""
+    if pid is None or pid == os.getpid():
+        return False
+    if start is not None:
+        # Recorded where /proc exists: a reused pid has a different start
+        return process_start(pid) == start
+    if os.name == 'nt':
+        return time.time() - submitted_at < ABANDONED_JOB_SECONDS
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def run_job(db_path, job_id, html):
+    """Runs in a pool process: mark the job running, then render it."""
+    with connect(db_path) as conn:
+        conn.execute("UPDATE render_jobs SET status = 'running', started_at = ? WHERE job_id = ?",
+                     (time.time(), job_id))
+    return timed_render(html)
+
+
+class RenderQueue:
+    def __init__(self, db_path, invoice_store, max_workers=None):
+        self.db_path = db_path
+        self.invoice_store = invoice_store
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._recovered_pid = None
+        with connect(self.db_path) as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(render_jobs)')}
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_render_jobs_batch_id ON render_jobs (batch_id)')
+
+    def recover(self):
+        """
+        Take over jobs left unfinished by app processes that have since died.
+        Meant for serving processes only (CLI commands would render the jobs and exit);
+        only the first call in each process does anything.
+        """
+        with self._lock:
+            if self._recovered_pid == os.getpid():
+                return
+            self._recovered_pid = os.getpid()
+        with connect(self.db_path) as conn:
+            stale = [dict(row) for row in conn.execute(
+                "SELECT job_id, invoice_number, html, owner_pid, owner_start, submitted_at FROM render_jobs "
+                "WHERE status IN ('queued', 'running')")
+                if not owner_alive(row['owner_pid'], row['owner_start'], row['submitted_at'])]
+        for job in stale:
+            with connect(self.db_path) as conn:
+                # Only one process wins the claim
+                claimed = conn.execute(
+                    "UPDATE render_jobs SET status = 'queued', started_at = NULL, owner_pid = ?, owner_start = ? "
+                    "WHERE job_id = ? AND status IN ('queued', 'running') AND owner_pid IS ? AND owner_start IS ?",
+                    (os.getpid(), process_start(os.getpid()), job['job_id'], job['owner_pid'], job['owner_start'])
+                ).rowcount
+                if claimed and job['html'] is None:
+                    conn.execute(
+                        "UPDATE render_jobs SET status = 'failed', error = ?, finished_at = ? WHERE job_id = ?",
+                        ('Interrupted: the app process rendering it stopped.', time.time(), job['job_id'])
+                    )
+                    continue
+            if claimed:
+                self._enqueue(job['job_id'], job['invoice_number'], job['html'])
+
+    def _get_executor(self):
+        # Started on first use; 'spawn' keeps pool processes free of the app's threads and locks
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_renderer)
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, invoice_number, html, batch_id=None):
+        """Queue an invoice for rendering. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        with connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO render_jobs (job_id, invoice_number, status, submitted_at, html, owner_pid, "
+                "owner_start, batch_id) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, invoice_number, time.time(), html, os.getpid(), process_start(os.getpid()), batch_id)
+            )
+        self._enqueue(job_id, invoice_number, html)
+        return job_id
+
+    def submit_batch(self, invoices):
+        """Queue a list of (invoice_number, html) for rendering as one batch. Returns the batch id."""
+        batch_id = uuid.uuid4().hex
+        for invoice_number, html in invoices:
+            self.submit(invoice_number, html, batch_id=batch_id)
+        return batch_id
+
+    def _enqueue(self, job_id, invoice_number, html):
+        try:
+            future = self._get_executor().submit(run_job, self.db_path, job_id, html)
+        except BrokenProcessPool:
+            # A pool process died (e.g. killed for memory); start a fresh pool
+            self._reset_executor()
+            future = self._get_executor().submit(run_job, self.db_path, job_id, html)
+        future.add_done_callback(lambda f: self._finish(job_id, invoice_number, html, f))
+
+    def _finish(self, job_id, invoice_number, html, future):
+        # Runs on the pool's management thread when the render completes
+        try:
+            pdf, started_at, seconds = future.result()
+            self.invoice_store.put(invoice_number, html, pdf)
+            self.invoice_store.record_render(seconds)
+            status, error = 'done', None
+        except Exception as e:
+            started_at, status, error = None, 'failed', f"{type(e).__name__}: {e}"
+        with connect(self.db_path) as conn:
+            conn.execute(
+                'UPDATE render_jobs SET status = ?, error = ?, started_at = COALESCE(started_at, ?), '
+                'finished_at = ? WHERE job_id = ?',
+                (status, error, started_at, time.time(), job_id)
+            )
+
+    def render_many(self, htmls):
+        """
+        Render a batch of invoices across the pool and wait for all of them.
+        Returns a list of (pdf bytes, render seconds) in input order.
+        """
+        try:
+            executor = self._get_executor()
+            futures = [executor.submit(timed_render, html) for html in htmls]
+        except BrokenProcessPool:
+            self._reset_executor()
+            executor = self._get_executor()
+            futures = [executor.submit(timed_render, html) for html in htmls]
+        results = []
+        for future in futures:
+            pdf, _, seconds = future.result()
+            results.append((pdf, seconds))
+        return results
+
+    def get(self, job_id):
+        """The job's record, or None if there is no such job."""
+        with connect(self.db_path) as conn:
+            row = conn.execute('SELECT * FROM render_jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def batch(self, batch_id):
+        """The records of a batch's jobs in submission order (empty if there is no such batch)."""
+        with connect(self.db_path) as conn:
+            rows = conn.execute(
+                'SELECT job_id, invoice_number, status, error, submitted_at, started_at, finished_at '
+                'FROM render_jobs WHERE batch_id = ? ORDER BY submitted_at, rowid', (batch_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        with connect(self.db_path) as conn:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM render_jobs GROUP BY status').fetchall())
+            recent = conn.execute(
+                "SELECT submitted_at, started_at, finished_at FROM render_jobs WHERE status = 'done' "
+                "ORDER BY finished_at DESC LIMIT ?", (LATENCY_WINDOW,)
+            ).fetchall()
+        latencies = [row['finished_at'] - row['submitted_at'] for row in recent]
+        waits = [row['started_at'] - row['submitted_at'] for row in recent]
+        return {
+            'queue_depth': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'latency_seconds_avg': round(sum(latencies) / len(latencies), 4) if latencies else None,
+            'latency_seconds_p95': round(percentile(latencies, 0.95), 4) if latencies else None,
+            'queue_wait_seconds_avg': round(sum(waits) / len(waits), 4) if waits else None,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
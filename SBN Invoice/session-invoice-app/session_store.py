@@ -0,0 +1,182 @@
+# session_store.py
+"""
+SQLite storage for the session calendar.
+
+Sessions live in a single table indexed by date and by (instructor, date), so the
+calendar reads only the rows of the month it displays instead of the whole history.
+Session ids are never reused (AUTOINCREMENT), and replacing the history keeps the ids
+of sessions that are still in it, so invoices can refer to sessions by id.
+The database runs in WAL mode: readers never block the writer and several app
+workers can share one file. The first time the store is opened next to an existing
+sessions.json, the JSON history is imported once.
+"""
+import sqlite3
+import json
+import os
+from contextlib import contextmanager
+from datetime import date
+
+SESSION_FIELDS = ('date', 'time', 'instructor', 'title', 'amount')
+# What makes two sessions the same session when the history is replaced
+SESSION_KEY_FIELDS = ('date', 'time', 'instructor', 'title')
+
+SESSIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL,
+    time TEXT,
+    instructor TEXT,
+    title TEXT,
+    amount NUMERIC NOT NULL DEFAULT 0
+);
+"""
+
+SCHEMA = SESSIONS_TABLE.format(name='sessions') + """
+CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions (date);
+CREATE INDEX IF NOT EXISTS idx_sessions_instructor_date ON sessions (instructor, date);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+@contextmanager
+def connect(db_path):
+    """
+    Yield a short-lived connection in autocommit mode; callers open transactions
+    explicitly. One connection per call keeps the database safe across threads and processes.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+def month_range(year, month):
+    """Return the (first day, first day of next month) ISO dates of a month."""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def session_key(session):
+    return tuple(session.get(field) for field in SESSION_KEY_FIELDS)
+
+
+class SessionStore:
+    def __init__(self, db_path, json_path=None):
+        self.db_path = db_path
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate_autoincrement(conn)
+        if json_path:
+            self.import_json(json_path)
+
+    @staticmethod
+    def _migrate_autoincrement(conn):
+        # Tables created before ids were AUTOINCREMENT are rebuilt with the same ids.
+        # The sequence starts past every id an invoice already refers to, so none is reused.
+        conn.execute('BEGIN IMMEDIATE')
+        table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'sessions'").fetchone()[0]
+        if 'AUTOINCREMENT' in table_sql.upper():
+            conn.execute('ROLLBACK')
+            return
+        conn.execute(SESSIONS_TABLE.format(name='sessions_new'))
+        conn.execute(f"INSERT INTO sessions_new SELECT id, {', '.join(SESSION_FIELDS)} FROM sessions")
+        conn.execute('DROP TABLE sessions')
+        conn.execute('ALTER TABLE sessions_new RENAME TO sessions')
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM sessions').fetchone()[0]
+        if 'session_id' in {row['name'] for row in conn.execute('PRAGMA table_info(invoices)')}:
+            last_id = max(last_id, conn.execute('SELECT COALESCE(MAX(session_id), 0) FROM invoices').fetchone()[0])
+        conn.execute("DELETE FROM sqlite_sequence WHERE name IN ('sessions', 'sessions_new')")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('sessions', ?)", (last_id,))
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions (date)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_instructor_date ON sessions (instructor, date)')
+        conn.execute('COMMIT')
+
+    def connect(self):
+        return connect(self.db_path)
+
+    def import_json(self, json_path):
+        """Import sessions.json once. Returns the number of sessions imported (0 if already done)."""
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path, 'r') as f:
+            sessions = json.load(f)
+        with self.connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            imported = conn.execute("SELECT value FROM meta WHERE key = 'sessions_json_imported'").fetchone()
+            if imported:
+                conn.execute('ROLLBACK')
+                return 0
+            self._insert(conn, sessions)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('sessions_json_imported', ?)",
+                         (os.path.abspath(json_path),))
+            conn.execute('COMMIT')
+        return len(sessions)
+
+    @staticmethod
+    def _insert(conn, sessions):
+        conn.executemany(
+            'INSERT INTO sessions (date, time, instructor, title, amount) VALUES (?, ?, ?, ?, ?)',
+            [(s['date'], s.get('time'), s.get('instructor'), s.get('title'), s.get('amount', 0))
+             for s in sessions]
+        )
+
+    def add_sessions(self, sessions):
+        with self.connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._insert(conn, sessions)
+            conn.execute('COMMIT')
+
+    def replace_all(self, sessions):
+        """
+        Replace the whole session history (what save_sessions used to do). Sessions already
+        stored, matched on date, time, instructor and title, keep their id (and the invoices
+        issued for them); the others are deleted, and new ones inserted with new ids.
+        """
+        with self.connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            stored = {}
+            for row in conn.execute(f"SELECT id, {', '.join(SESSION_KEY_FIELDS)} FROM sessions ORDER BY id"):
+                stored.setdefault(session_key(dict(row)), []).append(row['id'])
+            kept, added = [], []
+            for session in sessions:
+                ids = stored.get(session_key(session))
+                if ids:
+                    kept.append((session.get('amount', 0), ids.pop(0)))
+                else:
+                    added.append(session)
+            conn.executemany('DELETE FROM sessions WHERE id = ?', [(i,) for ids in stored.values() for i in ids])
+            conn.executemany('UPDATE sessions SET amount = ? WHERE id = ?', kept)
+            self._insert(conn, added)
+            conn.execute('COMMIT')
+
+    def sessions_between(self, start, end, instructor=None):
+        """Sessions (with their id) with start <= date < end (ISO dates), optionally for one instructor, by date."""
+        query = f"SELECT id, {', '.join(SESSION_FIELDS)} FROM sessions WHERE date >= ? AND date < ?"
+        params = [start, end]
+        if instructor:
+            query += ' AND instructor = ?'
+            params.append(instructor)
+        query += ' ORDER BY date, id'
+        with self.connect() as conn:
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def sessions_for_month(self, year, month, instructor=None):
+        return self.sessions_between(*month_range(year, month), instructor=instructor)
+
+    def all_sessions(self):
+        with self.connect() as conn:
+            return [dict(row) for row in conn.execute(
+                f"SELECT id, {', '.join(SESSION_FIELDS)} FROM sessions ORDER BY date, id")]
+